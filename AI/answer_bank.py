@@ -0,0 +1,394 @@
+"""
+Precomputed answer bank for known syllabus questions.
+
+An offline job runs RAGPipeline.generate_answer over a question file for
+each relevant mark level (rate limited) and writes the results to
+ANSWER_BANK_DIR:
+
+    entries.json     one record per (question, marks, namespace): the full
+                     generate_answer result plus the source chunk ids
+    embeddings.npy   float32 query embeddings, row-aligned with entries
+
+At request time, /generate and /generate/stream look the question up first:
+an exact match on the normalized question text, then (if enabled) a cosine
+match above ANSWER_BANK_SIMILARITY. A hit is a dict lookup and skips both
+retrieval and the LLM.
+
+Entries are invalidated when their sources change. Chunk ids are content
+addressed, so when a namespace's generation moves, every entry whose source
+ids are no longer in the index manifest is dropped until the job is re-run.
+
+Usage:
+    python answer_bank.py build --questions syllabus.txt --marks 2,5,10
+    python answer_bank.py build --questions syllabus.jsonl --namespace cs101 --rate 20
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from config import config
+from invalidation import get_generation, namespace_key
+
+logger = logging.getLogger(__name__)
+
+_NON_WORD = re.compile(r"[^\w\s]")
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase, drop punctuation, collapse whitespace."""
+    return " ".join(_NON_WORD.sub(" ", query.lower()).split())
+
+
+def iter_answer_chunks(answer: str, chunk_chars: int = None) -> Iterator[str]:
+    """Split a stored answer into stream-sized chunks on word boundaries."""
+    chunk_chars = chunk_chars or config.ANSWER_BANK_STREAM_CHUNK_CHARS
+    start = 0
+    while start < len(answer):
+        end = min(len(answer), start + chunk_chars)
+        if end < len(answer):
+            space = answer.rfind(" ", start, end)
+            if space > start:
+                end = space + 1
+        yield answer[start:end]
+        start = end
+
+
+class AnswerBank:
+    """
+    Read side of the answer bank, shared by all requests in a worker.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or config.ANSWER_BANK_DIR
+        self._lock = threading.Lock()
+        self._entries: List[Dict[str, Any]] = []
+        self._embeddings = np.empty((0, 0), dtype=np.float32)
+        self._exact: Dict[Tuple[str, int, str], int] = {}
+        self._rows: Dict[Tuple[int, str], np.ndarray] = {}
+        self._stale: set = set()
+        self._generations: Dict[str, int] = {}
+        self._hits = {"exact": 0, "embedding": 0}
+        self._misses = 0
+        self._mtime = None
+        self._load()
+
+    @staticmethod
+    def read_entries(path: str) -> Tuple[List[Dict[str, Any]], np.ndarray]:
+        entries_path = os.path.join(path, "entries.json")
+        if not os.path.exists(entries_path):
+            return [], np.empty((0, 0), dtype=np.float32)
+
+        with open(entries_path, encoding="utf-8") as f:
+            entries = json.load(f)
+        embeddings = np.load(os.path.join(path, "embeddings.npy"))
+        return entries, embeddings
+
+    def _entries_mtime(self) -> Optional[int]:
+        try:
+            return os.stat(os.path.join(self.path, "entries.json")).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _load(self):
+        mtime = self._entries_mtime()
+        entries, embeddings = self.read_entries(self.path)
+
+        exact = {}
+        rows: Dict[Tuple[int, str], List[int]] = {}
+        for i, entry in enumerate(entries):
+            ns = namespace_key(entry["namespace"])
+            exact[(entry["normalized"], entry["marks"], ns)] = i
+            rows.setdefault((entry["marks"], ns), []).append(i)
+
+        with self._lock:
+            self._entries = entries
+            self._embeddings = embeddings
+            self._exact = exact
+            self._rows = {slot: np.array(indices) for slot, indices in rows.items()}
+            self._stale = set()
+            self._generations = {}
+            self._mtime = mtime
+
+        if entries:
+            logger.info("Loaded answer bank from %s: %d answers", self.path, len(entries))
+
+    def _check_generation(self, namespace: Optional[str]):
+        """Re-validate a namespace's entries once its generation moves."""
+        ns = namespace_key(namespace)
+        generation = get_generation(namespace)
+        with self._lock:
+            if self._generations.get(ns) == generation:
+                return
+
+        from incremental_index import IndexManifest
+
+        manifest = IndexManifest.load(namespace)
+        live = {
+            chunk_id
+            for document in manifest.documents.values()
+            for chunk_id in document["chunks"]
+        }
+
+        with self._lock:
+            # Replaced rather than mutated, so lookups can read a snapshot without the lock
+            stale = set(self._stale)
+            invalidated = 0
+            for i, entry in enumerate(self._entries):
+                if namespace_key(entry["namespace"]) != ns:
+                    continue
+                # Without a manifest nothing can be verified, so any change drops the namespace
+                if (live and set(entry["source_ids"]) <= live) or (not live and generation == entry["generation"]):
+                    stale.discard(i)
+                else:
+                    stale.add(i)
+                    invalidated += 1
+            self._stale = stale
+            self._generations[ns] = generation
+
+        if invalidated:
+            logger.info("Answer bank: %d answers in namespace=%s invalidated by source changes", invalidated, namespace)
+
+    def lookup(
+        self,
+        query: str,
+        marks: int,
+        namespace: Optional[str] = None,
+        embed: Optional[Callable[[str], List[float]]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Find a precomputed answer.
+
+        Args:
+            query: Question text
+            marks: Validated marks
+            namespace: Pinecone namespace
+            embed: Query embedder, called only if the exact match misses
+
+        Returns:
+            {"entry": ..., "match": "exact" | "embedding", "similarity": float} or None
+        """
+        # Pick up a rebuilt bank (one stat per lookup)
+        if self._entries_mtime() != self._mtime:
+            self._load()
+
+        if not self._entries:
+            return None
+
+        self._check_generation(namespace)
+        ns = namespace_key(namespace)
+
+        # One consistent view of the bank; _load and _check_generation swap these under the lock
+        with self._lock:
+            entries, embeddings, stale = self._entries, self._embeddings, self._stale
+            index = self._exact.get((normalize_query(query), marks, ns))
+            rows = self._rows.get((marks, ns))
+            if index is not None and index not in stale:
+                self._hits["exact"] += 1
+                return {"entry": entries[index], "match": "exact", "similarity": 1.0}
+
+        # Embedding outside the lock
+        if embed is not None and rows is not None and config.ANSWER_BANK_SIMILARITY < 1.0:
+            similarities = embeddings[rows] @ np.asarray(embed(query), dtype=np.float32)
+            for position in np.argsort(similarities)[::-1]:
+                similarity = float(similarities[position])
+                if similarity < config.ANSWER_BANK_SIMILARITY:
+                    break
+                index = int(rows[position])
+                if index not in stale:
+                    with self._lock:
+                        self._hits["embedding"] += 1
+                    return {"entry": entries[index], "match": "embedding", "similarity": similarity}
+
+        with self._lock:
+            self._misses += 1
+        return None
+
+    def reload(self):
+        self._load()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "answers": len(self._entries),
+                "stale": len(self._stale),
+                "hits": dict(self._hits),
+                "misses": self._misses,
+                "similarity_threshold": config.ANSWER_BANK_SIMILARITY
+            }
+
+
+def load_questions(path: str, default_marks: List[int]) -> List[Tuple[str, List[int]]]:
+    """
+    Question file: one question per line, or JSONL with "query" and
+    optionally "marks" (an int or a list) to pick the relevant mark levels.
+    """
+    questions = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                record = json.loads(line)
+                marks = record.get("marks", default_marks)
+                questions.append((record["query"], marks if isinstance(marks, list) else [marks]))
+            else:
+                questions.append((line, list(default_marks)))
+    return questions
+
+
+class AnswerBankBuilder:
+    """
+    Offline job filling the answer bank through the normal pipeline.
+    """
+
+    def __init__(
+        self,
+        rag_pipeline=None,
+        path: str = None,
+        namespace: Optional[str] = None,
+        requests_per_minute: float = None,
+        max_retries: int = 3
+    ):
+        if rag_pipeline is None:
+            from rag_pipeline import RAGPipeline
+            rag_pipeline = RAGPipeline()
+
+        # Always generate fresh answers, never from the bank being built
+        rag_pipeline.answer_bank = None
+        self.rag_pipeline = rag_pipeline
+        self.path = path or config.ANSWER_BANK_DIR
+        self.namespace = namespace
+        self.interval = 60.0 / (requests_per_minute or config.ANSWER_BANK_REQUESTS_PER_MINUTE)
+        self.max_retries = max_retries
+
+    def _generate(self, query: str, marks: int) -> Dict[str, Any]:
+        """generate_answer with exponential backoff (rate-limit errors are transient)."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.rag_pipeline.generate_answer(
+                    query=query,
+                    marks=marks,
+                    namespace=self.namespace,
+                    include_sources=True
+                )
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self.interval * (2 ** (attempt + 1))
+                logger.warning("Generation failed (%s), retrying in %.1fs", e, delay)
+                time.sleep(delay)
+
+    def run(self, questions: List[Tuple[str, List[int]]], refresh: bool = False) -> dict:
+        """
+        Generate missing (or, with refresh, all) answers and rewrite the bank.
+        Entries invalidated by source changes are always regenerated.
+        """
+        from schema_service import SchemaService
+
+        entries, embeddings = AnswerBank.read_entries(self.path)
+        bank = AnswerBank(self.path)
+        ns = namespace_key(self.namespace)
+        generation = get_generation(self.namespace)
+
+        kept: Dict[Tuple[str, int, str], Tuple[Dict[str, Any], np.ndarray]] = {}
+        if not refresh:
+            bank._check_generation(self.namespace)
+            for i, entry in enumerate(entries):
+                if i not in bank._stale:
+                    kept[(entry["normalized"], entry["marks"], namespace_key(entry["namespace"]))] = (entry, embeddings[i])
+
+        counts = {"generated": 0, "kept": 0, "failed": 0}
+        next_call = time.monotonic()
+        for query, marks_levels in questions:
+            normalized = normalize_query(query)
+            for marks in marks_levels:
+                marks = SchemaService.validate_marks(marks)
+                key = (normalized, marks, ns)
+                if key in kept:
+                    counts["kept"] += 1
+                    continue
+
+                # Rate limit across LLM calls
+                delay = next_call - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                next_call = time.monotonic() + self.interval
+
+                try:
+                    result = self._generate(query, marks)
+                except Exception as e:
+                    logger.error("Skipping '%.60s' (%s marks): %s", query, marks, e)
+                    counts["failed"] += 1
+                    continue
+
+                if not result["answer"]:
+                    counts["failed"] += 1
+                    continue
+
+                entry = {
+                    "query": query,
+                    "normalized": normalized,
+                    "marks": marks,
+                    "namespace": self.namespace,
+                    "generation": generation,
+                    "source_ids": [doc["id"] for doc in result.get("sources", [])],
+                    "created_at": time.time(),
+                    "result": result
+                }
+                vector = np.asarray(self.rag_pipeline.embedding_service.embed_single(query), dtype=np.float32)
+                kept[key] = (entry, vector)
+                counts["generated"] += 1
+                logger.info("Banked '%.60s' (%s marks)", query, marks)
+
+        self.write(kept.values())
+        counts["total"] = len(kept)
+        return counts
+
+    def write(self, items):
+        """Write entries and embeddings atomically."""
+        items = list(items)
+        os.makedirs(self.path, exist_ok=True)
+
+        entries = [entry for entry, _ in items]
+        matrix = np.stack([vector for _, vector in items]) if items else np.empty((0, 0), dtype=np.float32)
+
+        tmp_embeddings = os.path.join(self.path, "embeddings.tmp.npy")
+        np.save(tmp_embeddings, matrix.astype(np.float32))
+        tmp_entries = os.path.join(self.path, "entries.json.tmp")
+        with open(tmp_entries, "w", encoding="utf-8") as f:
+            json.dump(entries, f, ensure_ascii=False)
+
+        os.replace(tmp_embeddings, os.path.join(self.path, "embeddings.npy"))
+        os.replace(tmp_entries, os.path.join(self.path, "entries.json"))
+        logger.info("Wrote %d answers to %s", len(entries), self.path)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(
+        level=config.LOG_LEVEL,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    parser = argparse.ArgumentParser(description="Precomputed answer bank")
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument("--questions", required=True, help="Question file (one per line or JSONL)")
+    parser.add_argument("--marks", default="2,5,10", help="Mark levels for questions without their own")
+    parser.add_argument("--namespace", default=config.PINECONE_NAMESPACE)
+    parser.add_argument("--rate", type=float, default=config.ANSWER_BANK_REQUESTS_PER_MINUTE,
+                        help="Generations per minute")
+    parser.add_argument("--refresh", action="store_true", help="Regenerate every answer")
+    args = parser.parse_args()
+
+    questions = load_questions(args.questions, [int(m) for m in args.marks.split(",")])
+    builder = AnswerBankBuilder(namespace=args.namespace, requests_per_minute=args.rate)
+    print(json.dumps(builder.run(questions, refresh=args.refresh), indent=2))
@@ -2,15 +2,30 @@ import logging
 from typing import Optional, Dict, Any, List
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, HTTPException, Query, Request
-from fastapi.responses import JSONResponse, Response
+from fastapi import FastAPI, Header, HTTPException, Query, Request
+from fastapi.responses import FileResponse, JSONResponse, Response
 from pydantic import BaseModel, Field
 
 from config import config
 from rag_pipeline import RAGPipeline
 from embedding_service import EmbeddingService
 from retrieval_service import RetrievalService
+from index_catalog import NamespaceNotFound
 from llm_service import LLMService
+from serialization import FastJSONResponse, embedding_response, negotiate_vector_encoding
+from answer_bank import iter_answer_chunks
+from deadline import Deadline, DeadlineExceeded, record_miss
+from request_log import RequestLogMiddleware
+from profiling import ContinuousProfiler, ProfilingMiddleware
+from hot_queries import CacheWarmer, HotQueryLog
+from tracing import TracingMiddleware
+import profiling
+import tracing
+import log_setup
+import deadline as deadlines
+import memory
+import topology
+import usage as usage_accounting
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -26,6 +41,9 @@ embedding_service: Optional[EmbeddingService] = None
 retrieval_service: Optional[RetrievalService] = None
 llm_service: Optional[LLMService] = None
 rag_pipeline: Optional[RAGPipeline] = None
+continuous_profiler: Optional[ContinuousProfiler] = None
+hot_query_log: Optional[HotQueryLog] = None
+cache_warmer: Optional[CacheWarmer] = None
 
 
 @asynccontextmanager
@@ -34,10 +52,18 @@ async def lifespan(app: FastAPI):
     Application lifespan manager.
     Loads models once at startup, cleans up at shutdown.
     """
-    global embedding_service, retrieval_service, llm_service, rag_pipeline
+    global embedding_service, retrieval_service, llm_service, rag_pipeline, continuous_profiler
+    global hot_query_log, cache_warmer
     
     logger.info("Starting application...")
     
+    # Trace allocations from before the model loads, when investigating memory
+    if config.MEMORY_TRACEMALLOC:
+        memory.start_tracemalloc()
+    
+    # Split CPU cores among workers before any model is loaded
+    topology.apply_worker_topology()
+    
     # Initialize services once
     embedding_service = EmbeddingService()
     retrieval_service = RetrievalService()
@@ -48,11 +74,30 @@ async def lifespan(app: FastAPI):
         llm_service=llm_service
     )
     
+    # Keep index stats / the namespace catalog cached off the request path
+    retrieval_service.catalog.start()
+    
+    if config.PROFILE_CONTINUOUS:
+        continuous_profiler = ContinuousProfiler()
+        continuous_profiler.start()
+    
+    # Refill caches with the previous deployment's hottest queries
+    if config.HOT_QUERY_LOG_PATH:
+        cache_warmer = CacheWarmer(rag_pipeline)
+        cache_warmer.start()
+        hot_query_log = HotQueryLog()
+    
     logger.info("Application started successfully")
     
     yield
     
     logger.info("Shutting down application...")
+    if continuous_profiler is not None:
+        continuous_profiler.stop()
+    retrieval_service.catalog.stop()
+    if hot_query_log is not None:
+        hot_query_log.close()
+    embedding_service.close()
 
 
 # Initialize FastAPI app
@@ -60,7 +105,8 @@ app = FastAPI(
     title="RAG API",
     description="Production-ready RAG pipeline with caching and batch processing",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
 
 app.add_middleware(
@@ -75,6 +121,17 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
+# Record incoming requests for `main.py load --replay`
+if config.REQUEST_LOG_PATH:
+    app.add_middleware(RequestLogMiddleware)
+
+# Per-request profiling; not installed at all unless configured
+if profiling.request_profiling_enabled():
+    app.add_middleware(ProfilingMiddleware)
+
+# Request ids for logs (always) and sampled tracing (with TRACE_EXPORT); outermost
+app.add_middleware(TracingMiddleware)
+
 # Preflight safety-net (ngrok/proxies sometimes surface 405/404 on OPTIONS before middleware kicks in)
 @app.options("/{full_path:path}")
 async def preflight_handler(full_path: str, request: Request):
@@ -88,6 +145,9 @@ class QueryRequest(BaseModel):
     filter_metadata: Optional[Dict[str, Any]] = Field(None, description="Metadata filters")
     include_context: bool = Field(True, description="Include formatted context")
     include_scores: bool = Field(False, description="Include similarity scores in context")
+    namespaces: Optional[List[str]] = Field(None, description="Search several namespaces (merged top-k)")
+    namespace_group: Optional[str] = Field(None, description="Search a NAMESPACE_GROUPS group, or 'all'")
+    deadline_ms: Optional[int] = Field(None, description="Request deadline in milliseconds", ge=1)
 
 
 class BatchQueryRequest(BaseModel):
@@ -95,6 +155,7 @@ class BatchQueryRequest(BaseModel):
     top_k: Optional[int] = Field(None, description="Number of results per query", ge=1, le=20)
     namespace: Optional[str] = Field(None, description="Pinecone namespace")
     filter_metadata: Optional[Dict[str, Any]] = Field(None, description="Metadata filters")
+    deadline_ms: Optional[int] = Field(None, description="Request deadline in milliseconds", ge=1)
 
 
 class GenerateRequest(BaseModel):
@@ -107,6 +168,12 @@ class GenerateRequest(BaseModel):
     temperature: Optional[float] = Field(None, description="LLM temperature", ge=0, le=2)
     max_tokens: Optional[int] = Field(None, description="Maximum tokens for response", ge=1)
     include_sources: bool = Field(True, description="Include source documents")
+    min_score: Optional[float] = Field(None, description="Minimum similarity score (defaults per marks)", ge=0, le=1)
+    context_tokens: Optional[int] = Field(None, description="Context token budget (defaults per marks)", ge=1)
+    namespaces: Optional[List[str]] = Field(None, description="Search several namespaces (merged top-k)")
+    namespace_group: Optional[str] = Field(None, description="Search a NAMESPACE_GROUPS group, or 'all'")
+    diversify: Optional[bool] = Field(None, description="MMR-diverse context chunks (defaults to MMR_DIVERSITY)")
+    deadline_ms: Optional[int] = Field(None, description="Request deadline in milliseconds", ge=1)
 
 
 class GenerateResponse(BaseModel):
@@ -115,8 +182,12 @@ class GenerateResponse(BaseModel):
     marks: int
     schema: Dict[str, Any]
     context: str
-    model: Dict[str, str]
+    model: Dict[str, Any]
     sources: Optional[List[Dict[str, Any]]] = None
+    degraded: List[str] = []
+    answer_bank: Optional[Dict[str, Any]] = None
+    diversity: Optional[Dict[str, Any]] = None
+    usage: Optional[Dict[str, Any]] = None
 
 
 class QueryResponse(BaseModel):
@@ -125,6 +196,44 @@ class QueryResponse(BaseModel):
     num_results: int
     model: str
     context: Optional[str] = None
+    namespaces: Optional[Dict[str, Any]] = None
+
+
+def resolve_request_namespaces(
+    namespaces: Optional[List[str]],
+    group: Optional[str],
+    namespace: Optional[str] = None
+) -> Optional[List[str]]:
+    """
+    Namespace list for a fan-out request, or None for a single-namespace one.
+    
+    Explicitly named namespaces missing from the index catalog (or empty)
+    are rejected with 404 before any Pinecone query.
+    """
+    try:
+        retrieval_service.check_namespaces(([namespace] if namespace else []) + list(namespaces or []))
+        if not (namespaces or group):
+            return None
+        return retrieval_service.resolve_namespaces(namespaces, group)
+    except NamespaceNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def namespace_label(request, namespaces: Optional[List[str]]) -> str:
+    """Namespace dimension for usage accounting."""
+    if request.namespace_group:
+        return f"group:{request.namespace_group}"
+    if namespaces:
+        return "+".join(sorted(namespaces))
+    return request.namespace or config.PINECONE_NAMESPACE or "default"
+
+
+def record_hot_query(query: str, marks: Optional[int] = None, namespace: Optional[str] = None):
+    """Add a served query to the hot query log, if enabled."""
+    if hot_query_log is not None:
+        hot_query_log.record(query, marks, namespace)
 
 
 # API Endpoints
@@ -138,13 +247,31 @@ async def root():
     }
 
 
+@app.get("/ready")
+async def ready():
+    """
+    Readiness check: 503 until startup cache warm-up has finished
+    (or used up WARMUP_BUDGET_SECONDS).
+    """
+    if cache_warmer is not None and not cache_warmer.ready.is_set():
+        return JSONResponse(status_code=503, content={"status": "warming", **cache_warmer.stats()})
+    return {"status": "ready"}
+
+
 @app.post("/query", response_model=QueryResponse)
-async def query_documents(request: QueryRequest):
+async def query_documents(
+    request: QueryRequest,
+    x_request_deadline_ms: Optional[str] = Header(None)
+):
     """
     Retrieve relevant documents for a single query.
     
     Returns the most similar documents from the vector database.
+    Pass `namespaces` or `namespace_group` to search several namespaces at once.
     """
+    namespaces = resolve_request_namespaces(request.namespaces, request.namespace_group, request.namespace)
+    record_hot_query(request.query, namespace=request.namespace)
+    
     try:
         result = rag_pipeline.run(
             query=request.query,
@@ -152,72 +279,91 @@ async def query_documents(request: QueryRequest):
             namespace=request.namespace,
             filter_metadata=request.filter_metadata,
             include_context=request.include_context,
-            include_scores=request.include_scores
+            include_scores=request.include_scores,
+            deadline=Deadline.from_request(x_request_deadline_ms, request.deadline_ms),
+            namespaces=namespaces
         )
         
-        return QueryResponse(**result)
+        # Pipeline output is already well-formed; skip response_model re-validation
+        return FastJSONResponse(result)
     
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
-        logger.error(f"Error processing query: {str(e)}")
+        logger.error("Error processing query: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/query/batch")
-async def batch_query_documents(request: BatchQueryRequest):
+async def batch_query_documents(
+    request: BatchQueryRequest,
+    x_request_deadline_ms: Optional[str] = Header(None)
+):
     """
     Retrieve relevant documents for multiple queries in batch.
     
     More efficient than making individual requests.
     """
+    resolve_request_namespaces(None, None, request.namespace)
+    for query in request.queries:
+        record_hot_query(query, namespace=request.namespace)
+    
     try:
         results = rag_pipeline.retrieve_batch(
             queries=request.queries,
             top_k=request.top_k,
             namespace=request.namespace,
-            filter_metadata=request.filter_metadata
+            filter_metadata=request.filter_metadata,
+            deadline=Deadline.from_request(x_request_deadline_ms, request.deadline_ms)
         )
         
-        return {
+        return FastJSONResponse({
             "queries": request.queries,
             "results": results,
             "num_queries": len(request.queries)
-        }
+        })
     
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
-        logger.error(f"Error processing batch query: {str(e)}")
+        logger.error("Error processing batch query: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/embed")
 async def embed_text(
     text: str = Query(..., description="Text to embed"),
-    use_cache: bool = Query(True, description="Use cache if available")
+    use_cache: bool = Query(True, description="Use cache if available"),
+    encoding: Optional[str] = Query(None, description="Vector encoding: json, base64 or binary"),
+    accept: Optional[str] = Header(None)
 ):
     """
     Generate embedding for given text.
     
     Useful for debugging or custom vector operations.
+    JSON by default; send `encoding=base64|binary` or an Accept header of
+    application/octet-stream for packed little-endian float32 vectors.
     """
+    try:
+        vector_encoding = negotiate_vector_encoding(accept=accept, encoding=encoding)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
     try:
         if use_cache:
             embedding = embedding_service.embed_single(text)
         else:
-            # Bypass cache
-            embedding = embedding_service.model.encode(
-                text,
-                normalize_embeddings=config.NORMALIZE_EMBEDDINGS,
-                show_progress_bar=False
-            ).tolist()
+            embedding = embedding_service.embed_uncached(text)
         
-        return {
-            "text": text,
-            "embedding": embedding,
-            "dimension": len(embedding),
-            "model": embedding_service.model_name
-        }
+        return embedding_response(
+            text=text,
+            embedding=embedding,
+            model_name=embedding_service.model_name,
+            encoding=vector_encoding
+        )
     
     except Exception as e:
-        logger.error(f"Error generating embedding: {str(e)}")
+        logger.error("Error generating embedding: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -228,13 +374,40 @@ async def get_stats():
     """
     try:
         stats = rag_pipeline.get_stats()
+        stats["topology"] = topology.current_layout()
+        stats["deadlines"] = deadlines.stats()
+        stats["usage"] = usage_accounting.stats()
+        stats["tracing"] = tracing.stats()
+        stats["logging"] = log_setup.stats()
+        if hot_query_log is not None:
+            stats["warmup"] = {**cache_warmer.stats(), "hot_query_log": hot_query_log.stats()}
+        stats["memory"] = memory.memory_report(embedding_service, rag_pipeline)
+        if continuous_profiler is not None:
+            stats["profiling"] = {"hot_frames": continuous_profiler.top()}
         return stats
     
     except Exception as e:
-        logger.error(f"Error getting stats: {str(e)}")
+        logger.error("Error getting stats: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/profiles/{name}")
+async def get_profile(name: str, x_profile: Optional[str] = Header(None)):
+    """
+    Download a folded-stack profile (linked from the X-Profile response header).
+    
+    Render with flamegraph.pl or load into speedscope.
+    """
+    if config.PROFILE_ADMIN_TOKEN and not profiling.is_admin(x_profile):
+        raise HTTPException(status_code=403, detail="Profile access requires the admin token")
+    
+    path = profiling.profile_path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"Profile not found: {name}")
+    
+    return FileResponse(path, media_type="text/plain")
+
+
 @app.post("/cache/clear")
 async def clear_cache():
     """
@@ -247,12 +420,15 @@ async def clear_cache():
         return {"status": "success", "message": "Cache cleared"}
     
     except Exception as e:
-        logger.error(f"Error clearing cache: {str(e)}")
+        logger.error("Error clearing cache: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/generate", response_model=GenerateResponse)
-async def generate_answer(request: GenerateRequest):
+async def generate_answer(
+    request: GenerateRequest,
+    x_request_deadline_ms: Optional[str] = Header(None)
+):
     """
     Generate an exam-style answer using RAG pipeline with schema-based formatting.
     
@@ -263,7 +439,15 @@ async def generate_answer(request: GenerateRequest):
     - 5 marks: Definition + Explanation + Multiple Examples
     - 7-10 marks: Comprehensive coverage
     - 15 marks: Essay-style with in-depth analysis
+    
+    Honours X-Request-Deadline-Ms / deadline_ms: when time runs short the
+    answer is shortened or omitted (see "degraded") and sources are returned.
+    
+    "usage" reports LLM tokens, queue/generation time and estimated cost.
     """
+    namespaces = resolve_request_namespaces(request.namespaces, request.namespace_group, request.namespace)
+    record_hot_query(request.query, request.marks, request.namespace)
+    
     try:
         result = rag_pipeline.generate_answer(
             query=request.query,
@@ -274,18 +458,34 @@ async def generate_answer(request: GenerateRequest):
             custom_system_prompt=request.custom_system_prompt,
             temperature=request.temperature,
             max_tokens=request.max_tokens,
-            include_sources=request.include_sources
+            include_sources=request.include_sources,
+            min_score=request.min_score,
+            context_tokens=request.context_tokens,
+            deadline=Deadline.from_request(x_request_deadline_ms, request.deadline_ms),
+            namespaces=namespaces,
+            diversify=request.diversify
         )
         
-        return GenerateResponse(**result)
+        usage_accounting.record(
+            result.get("usage"),
+            endpoint="generate",
+            marks=result["marks"],
+            namespace=namespace_label(request, namespaces)
+        )
+        return FastJSONResponse(result)
     
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
-        logger.error(f"Error generating answer: {str(e)}")
+        logger.error("Error generating answer: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/generate/stream")
-async def generate_answer_stream(request: GenerateRequest):
+async def generate_answer_stream(
+    request: GenerateRequest,
+    x_request_deadline_ms: Optional[str] = Header(None)
+):
     """
     Generate a streaming exam-style answer using RAG pipeline.
     
@@ -295,54 +495,124 @@ async def generate_answer_stream(request: GenerateRequest):
     from fastapi.responses import StreamingResponse
     from schema_service import SchemaService
     
+    namespaces = resolve_request_namespaces(request.namespaces, request.namespace_group, request.namespace)
+    record_hot_query(request.query, request.marks, request.namespace)
+    
     try:
-        # Validate marks
+        deadline = Deadline.from_request(x_request_deadline_ms, request.deadline_ms)
+        
+        # Validate marks and resolve the precompiled schema once
         marks = SchemaService.validate_marks(request.marks)
+        schema = SchemaService.resolve(marks)
+        
+        # Known questions stream straight from the answer bank (schema defaults only)
+        if RAGPipeline.answer_bank_eligible(
+            schema,
+            top_k=request.top_k,
+            filter_metadata=request.filter_metadata,
+            custom_system_prompt=request.custom_system_prompt,
+            temperature=request.temperature,
+            max_tokens=request.max_tokens,
+            min_score=request.min_score,
+            context_tokens=request.context_tokens,
+            namespaces=namespaces,
+            diversify=request.diversify
+        ):
+            banked = rag_pipeline.lookup_answer(request.query, marks, request.namespace, include_sources=False)
+            if banked is not None:
+                return StreamingResponse(
+                    iter_answer_chunks(banked["answer"]),
+                    media_type="text/plain",
+                    headers={"X-Answer-Bank": banked["answer_bank"]["match"]}
+                )
         
         # Get schema configuration
-        temperature = request.temperature or SchemaService.get_temperature(marks)
-        max_tokens = request.max_tokens or SchemaService.get_max_tokens(marks)
+        temperature = request.temperature or schema.temperature
+        max_tokens = request.max_tokens or schema.max_tokens
         
-        # Retrieve documents
-        documents = rag_pipeline.retrieve(
+        # Retrieve documents (mark-aware top_k and score cutoff, optional MMR)
+        documents, diversity = rag_pipeline.retrieve_for_context(
             query=request.query,
+            schema=schema,
             top_k=request.top_k,
             namespace=request.namespace,
-            filter_metadata=request.filter_metadata
+            filter_metadata=request.filter_metadata,
+            min_score=request.min_score,
+            context_tokens=request.context_tokens,
+            deadline=deadline,
+            namespaces=namespaces,
+            diversify=request.diversify
         )
         
-        # Build context
-        context = rag_pipeline.build_context(documents=documents)
+        # Build context within the schema's token budget
+        context = rag_pipeline.build_context(
+            documents=documents,
+            max_tokens=request.context_tokens or schema.context_tokens
+        )
         
         # Build prompts
         if request.custom_system_prompt:
             system_prompt = request.custom_system_prompt
             user_prompt = f"Context: {context}\n\nQuestion: {request.query}"
         else:
-            system_prompt = SchemaService.build_system_prompt(marks)
-            user_prompt = SchemaService.build_user_prompt(request.query, context, marks)
+            system_prompt = schema.system_prompt
+            user_prompt = SchemaService.render_user_prompt(request.query, context, schema, marks)
+        
+        # Fit generation into the remaining deadline
+        budget = rag_pipeline.plan_llm_budget(deadline, max_tokens)
+        if budget["degraded"] == "llm_skipped":
+            raise DeadlineExceeded("llm", deadline.remaining())
+        
+        # Streamed text cannot be retracted, so streams route by tier without cascade
+        model = llm_service.model_for(schema.model_tier)
+        
+        # Stream generation, stopping cleanly once the deadline passes.
+        # Usage arrives after the headers are sent, so it is only aggregated into /stats.
+        usage = {}
         
-        # Stream generation
         def generate():
-            for chunk in llm_service.generate_stream(
+            stream = llm_service.generate_stream(
                 prompt=user_prompt,
                 system_prompt=system_prompt,
                 temperature=temperature,
-                max_tokens=max_tokens
-            ):
-                yield chunk
+                max_tokens=budget["max_tokens"],
+                timeout=budget["timeout"],
+                model=model,
+                usage=usage
+            )
+            try:
+                for chunk in stream:
+                    yield chunk
+                    if deadline.expired():
+                        record_miss("llm")
+                        break
+            finally:
+                stream.close()
+                usage_accounting.record(
+                    usage,
+                    endpoint="generate_stream",
+                    marks=marks,
+                    namespace=namespace_label(request, namespaces)
+                )
         
-        return StreamingResponse(generate(), media_type="text/plain")
+        headers = {}
+        if budget["degraded"]:
+            headers["X-Degraded"] = budget["degraded"]
+        if diversity is not None:
+            headers["X-Context-Tokens-Saved"] = str(diversity["tokens_saved"])
+        return StreamingResponse(generate(), media_type="text/plain", headers=headers)
     
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
-        logger.error(f"Error in streaming generation: {str(e)}")
+        logger.error("Error in streaming generation: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # Error handlers
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
-    logger.error(f"Unhandled exception: {str(exc)}")
+    logger.error("Unhandled exception: %s", exc)
     return JSONResponse(
         status_code=500,
         content={"detail": "Internal server error"}
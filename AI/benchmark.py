@@ -0,0 +1,366 @@
+"""
+Microbenchmarks for hot-path pieces of the RAG service.
+
+Usage:
+    python benchmark.py prompts
+    python benchmark.py prompts --iterations 50000
+    python benchmark.py embed-pool --workers 4
+    python benchmark.py hedging --iterations 2000
+    python benchmark.py embedding-path --iterations 5000
+    python benchmark.py tracing
+    python benchmark.py logging
+"""
+
+import argparse
+import os
+import time
+from typing import Callable, Dict
+
+from config import config
+from schema_service import SchemaService
+
+SAMPLE_QUERY = "Explain the working of Dijkstra's shortest path algorithm"
+SAMPLE_CONTEXT = "\n\n---\n\n".join(
+    f"Chunk {i}: Dijkstra's algorithm finds shortest paths from a source node "
+    f"using a priority queue of tentative distances." for i in range(5)
+)
+
+
+def _time_per_call(fn: Callable[[], object], iterations: int) -> float:
+    """Return mean nanoseconds per call."""
+    start = time.perf_counter_ns()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter_ns() - start) / iterations
+
+
+def _report(title: str, rows: Dict[str, float]):
+    print(title)
+    for label, ns in rows.items():
+        print(f"  {label:<40} {ns / 1000:>10.2f} us/op")
+
+
+def bench_prompts(args: argparse.Namespace):
+    """Per-request prompt assembly: render on every call vs precompiled registry."""
+    iterations = args.iterations
+    marks_levels = sorted(SchemaService.SCHEMAS.keys())
+
+    def render_per_request():
+        for marks in marks_levels:
+            SchemaService._render_system_prompt(marks)
+            SchemaService.render_user_prompt(
+                SAMPLE_QUERY, SAMPLE_CONTEXT, SchemaService.resolve(marks), marks
+            )
+
+    def precompiled():
+        for marks in marks_levels:
+            schema = SchemaService.resolve(marks)
+            schema.system_prompt
+            SchemaService.render_user_prompt(SAMPLE_QUERY, SAMPLE_CONTEXT, schema, marks)
+
+    start = time.perf_counter_ns()
+    SchemaService.compile()
+    compile_ns = time.perf_counter_ns() - start
+
+    levels = len(marks_levels)
+    _report(f"Prompt assembly ({iterations} iterations x {levels} mark levels)", {
+        "compile (one-off, all levels)": compile_ns,
+        "render system prompt per request": _time_per_call(render_per_request, iterations) / levels,
+        "precompiled resolve": _time_per_call(precompiled, iterations) / levels,
+    })
+
+
+def bench_embed_pool(args: argparse.Namespace):
+    """Batch embedding throughput: in-process encode vs the worker pool."""
+    from embedding_pool import EmbeddingPool
+    from embedding_service import EmbeddingService
+
+    batch_sizes = [32, 128, 512, 2048]
+    workers = args.workers or max(2, (os.cpu_count() or 2) // 2)
+    service = EmbeddingService(enable_cache=False, pool_workers=0, server_socket="")
+    pool = EmbeddingPool(
+        dimension=service.dimension,
+        num_workers=workers
+    )
+    repeats = args.repeats
+
+    try:
+        print(f"Batch embedding throughput ({workers} pool workers, best of {repeats})")
+        print(f"  {'batch':>6} {'in-process':>14} {'pool':>14} {'speedup':>8}")
+        for batch_size in batch_sizes:
+            texts = [f"{SAMPLE_QUERY} (variant {i})" for i in range(batch_size)]
+            in_process = min(
+                _time_per_call(lambda: service.model.encode(
+                    texts, batch_size=config.EMBEDDING_BATCH_SIZE, show_progress_bar=False
+                ), 1)
+                for _ in range(repeats)
+            )
+            pooled = min(_time_per_call(lambda: pool.encode(texts), 1) for _ in range(repeats))
+            print(
+                f"  {batch_size:>6} {batch_size / (in_process / 1e9):>10.0f} t/s"
+                f" {batch_size / (pooled / 1e9):>10.0f} t/s {in_process / pooled:>7.2f}x"
+            )
+    finally:
+        pool.close()
+
+
+def bench_hedging(args: argparse.Namespace):
+    """Query tail latency against a fake index, with and without hedging."""
+    import numpy as np
+    from hedging import FakeIndex
+    from retrieval_service import RetrievalService
+    
+    iterations = args.iterations
+    vector = [0.0] * 8
+    
+    print(f"Fake index query latency ({iterations} sequential queries)")
+    print(f"  {'mode':<10} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9} {'hedged':>8}")
+    for hedged in (False, True):
+        service = RetrievalService(index=FakeIndex(seed=42), hedged=hedged)
+        latencies = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            service.query(vector, top_k=5)
+            latencies.append((time.perf_counter() - start) * 1000)
+        
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        rate = service.hedger.stats()["hedge_rate"] if hedged else 0.0
+        print(
+            f"  {'hedged' if hedged else 'plain':<10} {p50:>6.1f} ms {p95:>6.1f} ms"
+            f" {p99:>6.1f} ms {max(latencies):>6.1f} ms {rate:>7.1%}"
+        )
+
+
+def _retained_blocks(fn: Callable[[], object]) -> int:
+    """Allocated blocks still alive in the value fn returns."""
+    import tracemalloc
+    
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        value = fn()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    del value
+    return sum(stat.count_diff for stat in after.compare_to(before, "filename") if stat.count_diff > 0)
+
+
+def bench_embedding_path(args: argparse.Namespace):
+    """
+    Embedding representation cost from encoder to the Pinecone request:
+    per-row Python lists (previous path) vs float32 arrays end to end.
+    Uses a stand-in encoder unless --model is given, so only the
+    conversion, caching and request-building overhead is measured.
+    """
+    import pickle
+    
+    import numpy as np
+    from memory import estimate_bytes
+    from retrieval_service import as_list
+    
+    iterations = args.iterations
+    batch_size = 128
+    
+    if args.model:
+        from embedding_service import EmbeddingService
+        model = EmbeddingService(enable_cache=False, pool_workers=0, server_socket="").model
+        encode = lambda texts: model.encode(texts, normalize_embeddings=True, show_progress_bar=False)
+    else:
+        rng = np.random.default_rng(0)
+        dimension = 384
+        encode = lambda texts: rng.standard_normal(
+            (dimension,) if isinstance(texts, str) else (len(texts), dimension), dtype=np.float32
+        )
+    
+    texts = [f"{SAMPLE_QUERY} (variant {i})" for i in range(batch_size)]
+    list_cache, array_cache = {}, {}
+    
+    def list_miss():
+        vector = encode(SAMPLE_QUERY).tolist()
+        list_cache["q"] = vector
+        return {"vector": vector}
+    
+    def array_miss():
+        vector = np.asarray(encode(SAMPLE_QUERY), dtype=np.float32)
+        vector.setflags(write=False)
+        array_cache["q"] = vector
+        return {"vector": as_list(vector)}
+    
+    def list_hit():
+        return {"vector": list_cache["q"]}
+    
+    def array_hit():
+        return {"vector": as_list(array_cache["q"])}
+    
+    def list_batch():
+        return [row.tolist() for row in encode(texts)]
+    
+    def array_batch():
+        return np.asarray(encode(texts), dtype=np.float32)
+    
+    list_miss()
+    array_miss()
+    
+    _report(f"Embedding path, single query ({iterations} iterations)", {
+        "miss, lists": _time_per_call(list_miss, iterations),
+        "miss, float32 arrays": _time_per_call(array_miss, iterations),
+        "hit, lists": _time_per_call(list_hit, iterations),
+        "hit, float32 arrays (tolist at client)": _time_per_call(array_hit, iterations),
+    })
+    
+    batch_iterations = max(1, iterations // batch_size)
+    list_rows, array_rows = list_batch(), array_batch()
+    _report(f"Embedding path, batch of {batch_size} ({batch_iterations} iterations)", {
+        "encode, lists": _time_per_call(list_batch, batch_iterations),
+        "encode, float32 matrix": _time_per_call(array_batch, batch_iterations),
+        "pickle to/from pool worker, lists": _time_per_call(
+            lambda: pickle.loads(pickle.dumps(list_rows)), batch_iterations
+        ),
+        "pickle to/from pool worker, float32 matrix": _time_per_call(
+            lambda: pickle.loads(pickle.dumps(array_rows)), batch_iterations
+        ),
+        "numpy scoring of rows, lists": _time_per_call(
+            lambda: np.asarray(list_rows, dtype=np.float32) @ array_rows[0], batch_iterations
+        ),
+        "numpy scoring of rows, float32 matrix": _time_per_call(
+            lambda: array_rows @ array_rows[0], batch_iterations
+        ),
+    })
+    
+    print("Retained allocations and bytes")
+    for label, fn in (
+        ("single, list", lambda: encode(SAMPLE_QUERY).tolist()),
+        ("single, float32 array", lambda: np.asarray(encode(SAMPLE_QUERY), dtype=np.float32)),
+        (f"batch of {batch_size}, lists", list_batch),
+        (f"batch of {batch_size}, float32 matrix", array_batch),
+    ):
+        value = fn()
+        print(f"  {label:<40} {_retained_blocks(fn):>8} blocks {estimate_bytes(value):>10} bytes")
+
+
+def bench_tracing(args: argparse.Namespace):
+    """Per-span and per-request tracing overhead, unsampled vs sampled."""
+    import tracing
+    
+    iterations = args.iterations
+    spans_per_request = 15
+    exporter = tracing.TraceExporter(os.devnull)
+    
+    def one_span():
+        with tracing.span("stage", namespace="default", top_k=5) as span:
+            span.set("matches", 5)
+    
+    def request_spans():
+        for _ in range(spans_per_request):
+            one_span()
+    
+    def sampled_request():
+        trace = tracing.Trace(tracing._new_id(32), "bench")
+        token = tracing._trace.set(trace)
+        try:
+            request_spans()
+        finally:
+            tracing._trace.reset(token)
+        exporter.export(trace)
+    
+    try:
+        _report(f"Tracing overhead ({iterations} iterations)", {
+            "span, no trace": _time_per_call(one_span, iterations),
+            f"request ({spans_per_request} spans), unsampled": _time_per_call(request_spans, iterations),
+            f"request ({spans_per_request} spans), sampled + export": _time_per_call(
+                sampled_request, max(1, iterations // 10)
+            ),
+            "context propagation to executor": _time_per_call(
+                lambda: tracing.propagate(one_span)(), iterations
+            ),
+        })
+    finally:
+        exporter.close()
+
+
+def bench_logging(args: argparse.Namespace):
+    """
+    Caller-side logging cost of one /query: eager f-strings written
+    synchronously (previous setup) vs queued, lazily formatted records
+    without the unused caller/process fields.
+    """
+    import logging
+    import queue
+    
+    import log_setup
+    
+    iterations = args.iterations
+    query, top_k, namespace, matches = SAMPLE_QUERY, 5, "default", 5
+    logger = logging.getLogger("bench.logging")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    
+    def eager_request():
+        logger.info(f"Processing query: {query[:100]}...")
+        logger.info(f"Querying Pinecone: top_k={top_k}, namespace={namespace}")
+        logger.info(f"Retrieved {matches} documents")
+        logger.info(f"Generating response with model: {config.GROQ_MODEL}")
+        logger.info(f"Generated {len(SAMPLE_CONTEXT)} characters")
+    
+    def lazy_request():
+        logger.info("Processing query: %.100s...", query)
+        logger.info("Querying Pinecone: top_k=%d, namespace=%s", top_k, namespace)
+        logger.info("Retrieved %d documents", matches)
+        logger.info("Generating response with model: %s", config.GROQ_MODEL)
+        logger.info("Generated %d characters", len(SAMPLE_CONTEXT))
+    
+    def use(*handlers):
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+        for handler in handlers:
+            logger.addHandler(handler)
+    
+    sync_handler = logging.StreamHandler(open(os.devnull, "w"))
+    sync_handler.setFormatter(logging.Formatter(log_setup.TEXT_FORMAT))
+    
+    def queued(sample_rates=None, rate_limit=0.0):
+        handler = log_setup.DroppingQueueHandler(queue.Queue())
+        handler.addFilter(log_setup.SamplingFilter(sample_rates or {}, rate_limit))
+        return handler
+    
+    rows = {}
+    use(sync_handler)
+    rows["sync handler, f-strings (before)"] = _time_per_call(eager_request, iterations)
+    use(sync_handler)
+    rows["sync handler, lazy args"] = _time_per_call(lazy_request, iterations)
+    log_setup.skip_unused_record_fields(skip_caller=True)
+    for label, handler in (
+        ("queued, lazy args", queued()),
+        ("queued, lazy args, 10% sampled", queued({"bench": 0.1})),
+        ("queued, lazy args, rate-limited 50/s", queued(rate_limit=50)),
+    ):
+        use(handler)
+        rows[label] = _time_per_call(lazy_request, iterations)
+    logger.setLevel(logging.WARNING)
+    rows["level above INFO, f-strings"] = _time_per_call(eager_request, iterations)
+    rows["level above INFO, lazy args"] = _time_per_call(lazy_request, iterations)
+    
+    _report(f"Logging cost per /query, 5 INFO lines ({iterations} iterations)", rows)
+
+
+BENCHMARKS = {
+    "prompts": bench_prompts,
+    "embed-pool": bench_embed_pool,
+    "hedging": bench_hedging,
+    "embedding-path": bench_embedding_path,
+    "tracing": bench_tracing,
+    "logging": bench_logging,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="RAG service microbenchmarks")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--repeats", type=int, default=3, help="Timed repeats per case (best is reported)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (embed-pool)")
+    parser.add_argument("--model", action="store_true", help="Use the real embedding model (embedding-path)")
+    args = parser.parse_args()
+
+    BENCHMARKS[args.benchmark](args)
@@ -1,9 +1,12 @@
 import hashlib
 import logging
+import threading
 from functools import lru_cache
-from typing import List, Optional
+from typing import Optional
 import numpy as np
 
+from memory import estimate_bytes
+
 logger = logging.getLogger(__name__)
 
 
@@ -11,61 +14,102 @@ class EmbeddingCache:
     """
     In-memory LRU cache for query embeddings.
     For production, replace with Redis.
+    
+    Bounded by entry count and by estimated bytes (keys plus vectors).
+    Vectors are stored as read-only float32 arrays and returned without
+    copying. Safe to share between request threads and the cache warmer.
     """
     
-    def __init__(self, max_size: int = 1000):
+    def __init__(self, max_size: int = 1000, max_bytes: int = None):
         self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.bytes_used = 0
         self._cache = {}
         self._access_count = {}
-        logger.info(f"Initialized embedding cache with max_size={max_size}")
+        self._sizes = {}
+        self._lock = threading.Lock()
+        logger.info(f"Initialized embedding cache with max_size={max_size}, max_bytes={max_bytes}")
     
     def _generate_key(self, query: str, model_name: str) -> str:
         """Generate cache key from query and model name."""
         content = f"{model_name}:{query}"
         return hashlib.md5(content.encode()).hexdigest()
     
-    def get(self, query: str, model_name: str) -> Optional[List[float]]:
+    def get(self, query: str, model_name: str) -> Optional[np.ndarray]:
         """Retrieve cached embedding."""
         key = self._generate_key(query, model_name)
         
-        if key in self._cache:
-            self._access_count[key] = self._access_count.get(key, 0) + 1
-            logger.debug(f"Cache HIT for query: {query[:50]}...")
-            return self._cache[key]
+        with self._lock:
+            embedding = self._cache.get(key)
+            if embedding is not None:
+                self._access_count[key] = self._access_count.get(key, 0) + 1
+        
+        if embedding is not None:
+            logger.debug("Cache HIT for query: %.50s...", query)
+            return embedding
         
-        logger.debug(f"Cache MISS for query: {query[:50]}...")
+        logger.debug("Cache MISS for query: %.50s...", query)
         return None
     
-    def set(self, query: str, model_name: str, embedding: List[float]):
+    def set(self, query: str, model_name: str, embedding: np.ndarray):
         """Store embedding in cache."""
-        if len(self._cache) >= self.max_size:
-            self._evict_least_used()
+        embedding = np.asarray(embedding, dtype=np.float32)
+        # A row view would keep its whole batch matrix alive
+        if isinstance(embedding.base, np.ndarray) and embedding.base.nbytes > embedding.nbytes:
+            embedding = embedding.copy()
+        embedding.setflags(write=False)
         
         key = self._generate_key(query, model_name)
-        self._cache[key] = embedding
-        self._access_count[key] = 1
-        logger.debug(f"Cache SET for query: {query[:50]}...")
+        size = estimate_bytes(key) + estimate_bytes(embedding)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        
+        with self._lock:
+            self._discard(key)
+            while self._cache and (
+                len(self._cache) >= self.max_size
+                or (self.max_bytes is not None and self.bytes_used + size > self.max_bytes)
+            ):
+                self._evict_least_used()
+            
+            self._cache[key] = embedding
+            self._access_count[key] = 1
+            self._sizes[key] = size
+            self.bytes_used += size
+        logger.debug("Cache SET for query: %.50s...", query)
+    
+    def _discard(self, key: str):
+        # Callers hold self._lock
+        if key in self._cache:
+            del self._cache[key]
+            del self._access_count[key]
+            self.bytes_used -= self._sizes.pop(key)
     
     def _evict_least_used(self):
-        """Remove least frequently used item."""
+        """Remove least frequently used item (caller holds self._lock)."""
         if not self._cache:
             return
         
         least_used_key = min(self._access_count, key=self._access_count.get)
-        del self._cache[least_used_key]
-        del self._access_count[least_used_key]
-        logger.debug(f"Evicted least used cache entry")
+        self._discard(least_used_key)
+        logger.debug("Evicted least used cache entry")
     
     def clear(self):
         """Clear all cached embeddings."""
-        self._cache.clear()
-        self._access_count.clear()
+        with self._lock:
+            self._cache.clear()
+            self._access_count.clear()
+            self._sizes.clear()
+            self.bytes_used = 0
         logger.info("Cache cleared")
     
     def stats(self) -> dict:
         """Return cache statistics."""
-        return {
-            "size": len(self._cache),
-            "max_size": self.max_size,
-            "total_accesses": sum(self._access_count.values())
-        }
\ No newline at end of file
+        with self._lock:
+            return {
+                "size": len(self._cache),
+                "max_size": self.max_size,
+                "bytes": self.bytes_used,
+                "max_bytes": self.max_bytes,
+                "total_accesses": sum(self._access_count.values())
+            }
\ No newline at end of file
@@ -0,0 +1,360 @@
+"""
+Local block-compressed store of chunk metadata (including text).
+
+Lets retrieval ask Pinecone for ids and scores only and resolve the chunk
+text locally. Chunks are packed into zlib-compressed blocks in one file
+that is memory-mapped; an id -> (block, offset, length) index locates each
+chunk, and hot decompressed chunks are kept in an LRU.
+
+Updates append new blocks and rewrite only the index. Replaced and deleted
+records stay in the data file as dead space until their share passes
+CHUNK_STORE_COMPACT_RATIO, when the store is rewritten.
+
+Usage:
+    # Rebuild the store for a namespace from Pinecone metadata
+    python chunk_store.py build --namespace cs101
+"""
+
+import json
+import logging
+import mmap
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from config import config
+from invalidation import get_generation, namespace_key
+from memory import estimate_bytes
+
+logger = logging.getLogger(__name__)
+
+
+class ChunkStore:
+    """
+    Read-mostly chunk store for a single namespace.
+
+    On disk (one directory per namespace):
+        chunks.bin   concatenated zlib-compressed blocks of JSON records
+        index.json   block spans, id -> [block, start, length] and the
+                     number of dead records in chunks.bin
+    """
+
+    def __init__(self, path: str, cache_size: int = None, cache_max_bytes: int = None):
+        self.path = path
+        self.cache_size = cache_size or config.CHUNK_STORE_CACHE_SIZE
+        self.cache_max_bytes = cache_max_bytes or config.CHUNK_STORE_CACHE_MAX_BYTES
+        self._lock = threading.Lock()
+
+        self._blocks: List[Tuple[int, int]] = []
+        self._chunks: Dict[str, Tuple[int, int, int]] = {}
+        self._dead = 0
+        self._file = None
+        self._mmap = None
+        self._cache: "OrderedDict[str, Tuple[Dict[str, Any], int]]" = OrderedDict()
+        self._cache_bytes = 0
+        self._hits = 0
+        self._misses = 0
+
+        self._load()
+
+    def _load(self):
+        """Open the index and memory-map the data file if present."""
+        index_path = os.path.join(self.path, "index.json")
+        data_path = os.path.join(self.path, "chunks.bin")
+        if not os.path.exists(index_path):
+            return
+
+        with open(index_path) as f:
+            index = json.load(f)
+
+        blocks = [tuple(span) for span in index["blocks"]]
+        chunks = {doc_id: tuple(loc) for doc_id, loc in index["chunks"].items()}
+
+        data_file = open(data_path, "rb")
+        data_map = mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ) if blocks else None
+
+        with self._lock:
+            self._close()
+            self._blocks = blocks
+            self._chunks = chunks
+            self._dead = index.get("dead", 0)
+            self._file = data_file
+            self._mmap = data_map
+            self._cache.clear()
+            self._cache_bytes = 0
+
+        logger.info(f"Loaded chunk store from {self.path}: {len(chunks)} chunks in {len(blocks)} blocks")
+
+    def _close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+        if self._file is not None:
+            self._file.close()
+        self._mmap = None
+        self._file = None
+
+    def close(self):
+        """Unmap the data file. The store reads as empty afterwards."""
+        with self._lock:
+            self._close()
+            self._blocks = []
+            self._chunks = {}
+            self._cache.clear()
+            self._cache_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._chunks)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._chunks
+
+    def get(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        """Return a chunk's metadata dict, or None if unknown."""
+        with self._lock:
+            cached = self._cache.get(doc_id)
+            if cached is not None:
+                self._cache.move_to_end(doc_id)
+                self._hits += 1
+                return cached[0]
+
+            location = self._chunks.get(doc_id)
+            if location is None:
+                return None
+
+            self._misses += 1
+            block_no, start, length = location
+            offset, size = self._blocks[block_no]
+            block = zlib.decompress(self._mmap[offset:offset + size])
+            metadata = json.loads(block[start:start + length])
+
+            size = estimate_bytes(metadata)
+            self._cache[doc_id] = (metadata, size)
+            self._cache_bytes += size
+            # Bounded by entries and by bytes; the newest entry always stays
+            while len(self._cache) > 1 and (
+                len(self._cache) > self.cache_size or self._cache_bytes > self.cache_max_bytes
+            ):
+                _, (_, evicted) = self._cache.popitem(last=False)
+                self._cache_bytes -= evicted
+
+            return metadata
+
+    def build(self, documents: Iterable[Tuple[str, Dict[str, Any]]], block_size: int = None):
+        """
+        Rewrite the store from (doc_id, metadata) pairs.
+        Files are replaced atomically, then the new store is mapped.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        tmp_data = os.path.join(self.path, "chunks.bin.tmp")
+
+        blocks: List[Tuple[int, int]] = []
+        chunks: Dict[str, Tuple[int, int, int]] = {}
+        with open(tmp_data, "wb") as out:
+            offset = self._write_blocks(out, documents, 0, blocks, chunks, block_size)
+
+        os.replace(tmp_data, os.path.join(self.path, "chunks.bin"))
+        self._write_index(blocks, chunks, dead=0)
+        self._load()
+
+        logger.info(f"Built chunk store at {self.path}: {len(chunks)} chunks, {offset} bytes compressed")
+
+    @staticmethod
+    def _write_blocks(
+        out,
+        documents: Iterable[Tuple[str, Dict[str, Any]]],
+        offset: int,
+        blocks: List[Tuple[int, int]],
+        chunks: Dict[str, Tuple[int, int, int]],
+        block_size: int = None
+    ) -> int:
+        """
+        Write (doc_id, metadata) pairs to out as compressed blocks starting
+        at offset, adding their spans and locations to blocks and chunks.
+
+        Returns:
+            Offset after the last block
+        """
+        block_size = block_size or config.CHUNK_STORE_BLOCK_SIZE
+        pending = bytearray()
+
+        def flush():
+            nonlocal offset
+            if not pending:
+                return
+            compressed = zlib.compress(bytes(pending), 6)
+            out.write(compressed)
+            blocks.append((offset, len(compressed)))
+            offset += len(compressed)
+            pending.clear()
+
+        for doc_id, metadata in documents:
+            record = json.dumps(metadata, separators=(",", ":")).encode()
+            chunks[doc_id] = (len(blocks), len(pending), len(record))
+            pending.extend(record)
+            if len(pending) >= block_size:
+                flush()
+        flush()
+        return offset
+
+    def _write_index(self, blocks: List[Tuple[int, int]], chunks: Dict[str, Tuple[int, int, int]], dead: int):
+        tmp_index = os.path.join(self.path, "index.json.tmp")
+        with open(tmp_index, "w") as f:
+            json.dump({"blocks": blocks, "chunks": chunks, "dead": dead}, f, separators=(",", ":"))
+        os.replace(tmp_index, os.path.join(self.path, "index.json"))
+
+    def items(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Iterate over (doc_id, metadata), block by block."""
+        by_block: Dict[int, List[Tuple[str, int, int]]] = {}
+        for doc_id, (block_no, start, length) in self._chunks.items():
+            by_block.setdefault(block_no, []).append((doc_id, start, length))
+
+        for block_no in sorted(by_block):
+            offset, size = self._blocks[block_no]
+            block = zlib.decompress(self._mmap[offset:offset + size])
+            for doc_id, start, length in by_block[block_no]:
+                yield doc_id, json.loads(block[start:start + length])
+
+    def update(
+        self,
+        upserts: Dict[str, Dict[str, Any]] = None,
+        deletes: Iterable[str] = ()
+    ):
+        """
+        Apply upserts/deletes.
+
+        New records are appended as blocks and the index is replaced
+        atomically; readers of the previous index never see the appended
+        bytes. Replaced and deleted records become dead space. Once dead
+        records reach CHUNK_STORE_COMPACT_RATIO of the file, the store is
+        rewritten, streaming unchanged chunks from the current file.
+        """
+        upserts = upserts or {}
+        skip = set(deletes) | set(upserts)
+        data_path = os.path.join(self.path, "chunks.bin")
+
+        chunks = {doc_id: location for doc_id, location in self._chunks.items() if doc_id not in skip}
+        dead = self._dead + len(self._chunks) - len(chunks)
+        live = len(chunks) + len(upserts)
+        if not self._blocks or not os.path.exists(data_path) or dead > (dead + live) * config.CHUNK_STORE_COMPACT_RATIO:
+            def merged():
+                for doc_id, metadata in self.items():
+                    if doc_id not in skip:
+                        yield doc_id, metadata
+                yield from upserts.items()
+
+            self.build(merged())
+            return
+
+        blocks = list(self._blocks)
+        if upserts:
+            with open(data_path, "ab") as out:
+                # Start at the real end of file in case an interrupted update left a tail
+                self._write_blocks(out, upserts.items(), out.seek(0, os.SEEK_END), blocks, chunks)
+                out.flush()
+                os.fsync(out.fileno())
+
+        self._write_index(blocks, chunks, dead)
+        self._load()
+
+    def stats(self) -> dict:
+        """Return store and cache statistics."""
+        return {
+            "chunks": len(self._chunks),
+            "blocks": len(self._blocks),
+            "dead_records": self._dead,
+            "cache_size": len(self._cache),
+            "cache_max_size": self.cache_size,
+            "cache_bytes": self._cache_bytes,
+            "cache_max_bytes": self.cache_max_bytes,
+            "cache_hits": self._hits,
+            "cache_misses": self._misses
+        }
+
+
+class ChunkStoreManager:
+    """
+    Holds one ChunkStore per Pinecone namespace under a base directory.
+    """
+
+    def __init__(self, base_dir: str = None):
+        self.base_dir = base_dir or config.CHUNK_STORE_DIR
+        self._stores: "OrderedDict[str, ChunkStore]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, namespace: Optional[str] = None) -> ChunkStore:
+        """Get (opening if needed) the store for a namespace."""
+        key = namespace_key(namespace)
+        generation = get_generation(namespace)
+        with self._lock:
+            # Reopen when another process re-indexed the namespace
+            if key not in self._stores or self._generations.get(key) != generation:
+                previous = self._stores.get(key)
+                self._stores[key] = ChunkStore(os.path.join(self.base_dir, key))
+                self._generations[key] = generation
+                if previous is not None:
+                    previous.close()
+            self._stores.move_to_end(key)
+            # Keep only the most recently used namespaces open
+            while len(self._stores) > config.LOCAL_INDEX_MAX_NAMESPACES:
+                evicted, store = self._stores.popitem(last=False)
+                self._generations.pop(evicted, None)
+                store.close()
+            return self._stores[key]
+
+    def resolve(
+        self,
+        documents: List[Dict[str, Any]],
+        namespace: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """
+        Fill in metadata for id/score-only matches.
+
+        Returns:
+            (documents, ids missing from the store)
+        """
+        store = self.get(namespace)
+        missing = []
+        for doc in documents:
+            metadata = store.get(doc["id"])
+            if metadata is None:
+                missing.append(doc["id"])
+            else:
+                doc["metadata"] = metadata
+        return documents, missing
+
+    def build(self, retrieval_service, namespace: Optional[str] = None) -> ChunkStore:
+        """Rebuild a namespace's store from Pinecone metadata."""
+        store = self.get(namespace)
+        store.build(
+            (doc["id"], doc["metadata"])
+            for doc in retrieval_service.iter_documents(namespace=namespace)
+        )
+        return store
+
+    def cache_bytes(self) -> int:
+        """Estimated bytes held by the caches of all opened stores."""
+        with self._lock:
+            return sum(store.stats()["cache_bytes"] for store in self._stores.values())
+
+    def stats(self) -> dict:
+        """Return statistics for opened stores."""
+        with self._lock:
+            return {key: store.stats() for key, store in self._stores.items()}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from retrieval_service import RetrievalService
+
+    logging.basicConfig(level=config.LOG_LEVEL)
+
+    parser = argparse.ArgumentParser(description="Local chunk store maintenance")
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument("--namespace", default=config.PINECONE_NAMESPACE)
+    args = parser.parse_args()
+
+    ChunkStoreManager().build(RetrievalService(), namespace=args.namespace)
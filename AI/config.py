@@ -19,19 +19,153 @@ class Config:
     EMBEDDING_BATCH_SIZE: int = 32
     NORMALIZE_EMBEDDINGS: bool = True
     
+    # Optional multi-process embedding pool for large batches (0 = disabled)
+    EMBEDDING_POOL_WORKERS: int = int(os.getenv("EMBEDDING_POOL_WORKERS", "0"))
+    EMBEDDING_POOL_MIN_BATCH: int = int(os.getenv("EMBEDDING_POOL_MIN_BATCH", "64"))
+    EMBEDDING_POOL_MAX_ROWS: int = int(os.getenv("EMBEDDING_POOL_MAX_ROWS", "512"))
+    EMBEDDING_POOL_BYTES_PER_TEXT: int = int(os.getenv("EMBEDDING_POOL_BYTES_PER_TEXT", "4096"))
+    
+    # Shared local embedding server (unset = each worker loads its own model)
+    EMBEDDING_SERVER_SOCKET: Optional[str] = os.getenv("EMBEDDING_SERVER_SOCKET") or None
+    EMBEDDING_SERVER_MAX_BATCH: int = int(os.getenv("EMBEDDING_SERVER_MAX_BATCH", "64"))
+    EMBEDDING_SERVER_MAX_WAIT_MS: float = float(os.getenv("EMBEDDING_SERVER_MAX_WAIT_MS", "5"))
+    EMBEDDING_SERVER_TIMEOUT: float = float(os.getenv("EMBEDDING_SERVER_TIMEOUT", "30"))
+    
     # Retrieval settings
     DEFAULT_TOP_K: int = 5
     MAX_TOP_K: int = 20
     
+    # Multi-namespace fan-out ("group=ns1,ns2;other=ns3")
+    NAMESPACE_GROUPS: dict = {
+        name.strip(): [ns.strip() for ns in members.split(",") if ns.strip()]
+        for name, _, members in (
+            group.partition("=") for group in os.getenv("NAMESPACE_GROUPS", "").split(";") if "=" in group
+        )
+    }
+    FANOUT_WORKERS: int = int(os.getenv("FANOUT_WORKERS", "16"))
+    
+    # Cached index stats / namespace catalog
+    INDEX_STATS_REFRESH_SECONDS: float = float(os.getenv("INDEX_STATS_REFRESH_SECONDS", "30"))
+    INDEX_CATALOG_RECHECK_SECONDS: float = float(os.getenv("INDEX_CATALOG_RECHECK_SECONDS", "5"))
+    NAMESPACE_VALIDATION: bool = os.getenv("NAMESPACE_VALIDATION", "true").lower() == "true"
+    
+    # Hedged Pinecone queries (duplicate a query slower than the observed percentile)
+    HEDGED_QUERIES: bool = os.getenv("HEDGED_QUERIES", "false").lower() == "true"
+    HEDGE_PERCENTILE: float = float(os.getenv("HEDGE_PERCENTILE", "95"))
+    HEDGE_BUDGET_RATIO: float = float(os.getenv("HEDGE_BUDGET_RATIO", "0.05"))
+    HEDGE_INITIAL_DELAY_MS: float = float(os.getenv("HEDGE_INITIAL_DELAY_MS", "200"))
+    HEDGE_MIN_DELAY_MS: float = float(os.getenv("HEDGE_MIN_DELAY_MS", "10"))
+    HEDGE_WINDOW: int = int(os.getenv("HEDGE_WINDOW", "1000"))
+    HEDGE_POOL_WORKERS: int = int(os.getenv("HEDGE_POOL_WORKERS", "16"))
+    
+    # Hybrid (BM25 + vector) retrieval settings
+    HYBRID_SEARCH: bool = os.getenv("HYBRID_SEARCH", "false").lower() == "true"
+    LEXICAL_INDEX_DIR: str = os.getenv("LEXICAL_INDEX_DIR", "data/lexical_index")
+    LEXICAL_TOP_K: int = int(os.getenv("LEXICAL_TOP_K", "10"))
+    RRF_K: int = int(os.getenv("RRF_K", "60"))
+    # BM25 saves append to a delta log; rewrite the segment once pending
+    # adds/deletes reach this share of its documents
+    LEXICAL_COMPACT_RATIO: float = float(os.getenv("LEXICAL_COMPACT_RATIO", "0.2"))
+    # Namespaces whose BM25 index / chunk store stay open per worker (LRU)
+    LOCAL_INDEX_MAX_NAMESPACES: int = int(os.getenv("LOCAL_INDEX_MAX_NAMESPACES", "32"))
+    
+    # Diversity (MMR) selection of context chunks for generation
+    MMR_DIVERSITY: bool = os.getenv("MMR_DIVERSITY", "false").lower() == "true"
+    MMR_LAMBDA: float = float(os.getenv("MMR_LAMBDA", "0.7"))
+    MMR_REDUNDANCY_THRESHOLD: float = float(os.getenv("MMR_REDUNDANCY_THRESHOLD", "0.9"))
+    # 1 drops redundant chunks from the top-k; >1 also backfills from lower-ranked candidates
+    MMR_CANDIDATE_MULTIPLIER: int = int(os.getenv("MMR_CANDIDATE_MULTIPLIER", "1"))
+    
+    # Lightweight retrieval: Pinecone returns ids/scores, text comes from a local chunk store
+    LIGHTWEIGHT_RETRIEVAL: bool = os.getenv("LIGHTWEIGHT_RETRIEVAL", "false").lower() == "true"
+    CHUNK_STORE_DIR: str = os.getenv("CHUNK_STORE_DIR", "data/chunk_store")
+    CHUNK_STORE_BLOCK_SIZE: int = int(os.getenv("CHUNK_STORE_BLOCK_SIZE", "65536"))
+    CHUNK_STORE_CACHE_SIZE: int = int(os.getenv("CHUNK_STORE_CACHE_SIZE", "2048"))
+    CHUNK_STORE_CACHE_MAX_BYTES: int = int(os.getenv("CHUNK_STORE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+    # Updates append blocks; rewrite the file once this share of its records is dead
+    CHUNK_STORE_COMPACT_RATIO: float = float(os.getenv("CHUNK_STORE_COMPACT_RATIO", "0.3"))
+    
+    # Ingestion settings
+    INGEST_CHUNK_SIZE: int = int(os.getenv("INGEST_CHUNK_SIZE", "1000"))  # characters
+    INGEST_CHUNK_OVERLAP: int = int(os.getenv("INGEST_CHUNK_OVERLAP", "200"))
+    INGEST_EMBED_WORKERS: int = int(os.getenv("INGEST_EMBED_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+    INGEST_EMBED_BATCH_SIZE: int = int(os.getenv("INGEST_EMBED_BATCH_SIZE", "256"))
+    INGEST_UPSERT_WORKERS: int = int(os.getenv("INGEST_UPSERT_WORKERS", "8"))
+    INGEST_UPSERT_BATCH_SIZE: int = int(os.getenv("INGEST_UPSERT_BATCH_SIZE", "100"))
+    INGEST_UPSERT_MAX_BYTES: int = int(os.getenv("INGEST_UPSERT_MAX_BYTES", "2000000"))  # Pinecone request limit is 2MB
+    INGEST_MAX_IN_FLIGHT: int = int(os.getenv("INGEST_MAX_IN_FLIGHT", "16"))
+    INGEST_CHECKPOINT_DIR: str = os.getenv("INGEST_CHECKPOINT_DIR", "data/ingest_checkpoints")
+    INDEX_MANIFEST_DIR: str = os.getenv("INDEX_MANIFEST_DIR", "data/manifests")
+    GENERATIONS_DIR: str = os.getenv("GENERATIONS_DIR", "data/generations")
+    
+    # Request deadlines (per-stage share of the remaining budget)
+    REQUEST_DEADLINE_MS: int = int(os.getenv("REQUEST_DEADLINE_MS", "20000"))
+    DEADLINE_STAGE_SHARES: dict = {"embed": 0.2, "retrieve": 0.5, "llm": 1.0}
+    DEADLINE_POOL_WORKERS: int = int(os.getenv("DEADLINE_POOL_WORKERS", "32"))
+    # Timed-out calls still running on the pool; beyond this, stages fail fast
+    DEADLINE_MAX_ABANDONED: int = int(os.getenv("DEADLINE_MAX_ABANDONED", "16"))
+    DEADLINE_MIN_LLM_MS: int = int(os.getenv("DEADLINE_MIN_LLM_MS", "1000"))
+    DEADLINE_MIN_ANSWER_TOKENS: int = int(os.getenv("DEADLINE_MIN_ANSWER_TOKENS", "64"))
+    LLM_FIRST_TOKEN_MS: int = int(os.getenv("LLM_FIRST_TOKEN_MS", "400"))
+    LLM_TOKENS_PER_SECOND: int = int(os.getenv("LLM_TOKENS_PER_SECOND", "250"))
+    
+    # Precomputed answer bank (built offline by answer_bank.py)
+    ANSWER_BANK: bool = os.getenv("ANSWER_BANK", "false").lower() == "true"
+    ANSWER_BANK_DIR: str = os.getenv("ANSWER_BANK_DIR", "data/answer_bank")
+    ANSWER_BANK_SIMILARITY: float = float(os.getenv("ANSWER_BANK_SIMILARITY", "0.95"))  # 1.0 = exact only
+    ANSWER_BANK_REQUESTS_PER_MINUTE: float = float(os.getenv("ANSWER_BANK_REQUESTS_PER_MINUTE", "30"))
+    ANSWER_BANK_STREAM_CHUNK_CHARS: int = int(os.getenv("ANSWER_BANK_STREAM_CHUNK_CHARS", "64"))
+    
     # Cache settings
     ENABLE_CACHE: bool = True
     CACHE_TTL: int = 3600  # 1 hour
     CACHE_MAX_SIZE: int = 1000
+    CACHE_MAX_BYTES: int = int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    
+    # Memory accounting (tracemalloc slows allocations; enable only to investigate)
+    MEMORY_TRACEMALLOC: bool = os.getenv("MEMORY_TRACEMALLOC", "false").lower() == "true"
+    MEMORY_TRACEMALLOC_FRAMES: int = int(os.getenv("MEMORY_TRACEMALLOC_FRAMES", "10"))
+    MEMORY_TOP_ALLOCATIONS: int = int(os.getenv("MEMORY_TOP_ALLOCATIONS", "15"))
     
     # API settings
     API_HOST: str = "0.0.0.0"
     API_PORT: int = 8000
     API_WORKERS: int = 4
+    
+    # Request log for load replay (disabled when empty)
+    REQUEST_LOG_PATH: str = os.getenv("REQUEST_LOG_PATH", "")
+    REQUEST_LOG_SAMPLE_RATE: float = float(os.getenv("REQUEST_LOG_SAMPLE_RATE", "1.0"))
+    
+    # Hot query log and startup cache warm-up (disabled when the path is empty)
+    HOT_QUERY_LOG_PATH: str = os.getenv("HOT_QUERY_LOG_PATH", "")
+    HOT_QUERY_LOG_MAX_BYTES: int = int(os.getenv("HOT_QUERY_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+    HOT_QUERY_LOG_BACKUPS: int = int(os.getenv("HOT_QUERY_LOG_BACKUPS", "3"))
+    HOT_QUERY_LOG_QUEUE_SIZE: int = int(os.getenv("HOT_QUERY_LOG_QUEUE_SIZE", "10000"))
+    WARMUP_TOP_N: int = int(os.getenv("WARMUP_TOP_N", "500"))
+    WARMUP_BUDGET_SECONDS: float = float(os.getenv("WARMUP_BUDGET_SECONDS", "30"))
+    WARMUP_BATCH_SIZE: int = int(os.getenv("WARMUP_BATCH_SIZE", "64"))
+    WARMUP_RETRIEVE: bool = os.getenv("WARMUP_RETRIEVE", "false").lower() == "true"
+    
+    # Tracing: Zipkin v2 JSON lines to a file or "stdout" (disabled when empty)
+    TRACE_EXPORT: str = os.getenv("TRACE_EXPORT", "")
+    TRACE_SAMPLE_RATE: float = float(os.getenv("TRACE_SAMPLE_RATE", "0.05"))
+    TRACE_SERVICE_NAME: str = os.getenv("TRACE_SERVICE_NAME", "rag-api")
+    TRACE_MAX_SPANS: int = int(os.getenv("TRACE_MAX_SPANS", "256"))
+    
+    # Sampling profiler (per-request via X-Profile admin header or sample rate, plus continuous mode)
+    PROFILE_DIR: str = os.getenv("PROFILE_DIR", "data/profiles")
+    PROFILE_ADMIN_TOKEN: str = os.getenv("PROFILE_ADMIN_TOKEN", "")
+    PROFILE_SAMPLE_RATE: float = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+    PROFILE_INTERVAL_MS: float = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+    PROFILE_MAX_CONCURRENT: int = int(os.getenv("PROFILE_MAX_CONCURRENT", "2"))
+    PROFILE_CONTINUOUS: bool = os.getenv("PROFILE_CONTINUOUS", "false").lower() == "true"
+    PROFILE_CONTINUOUS_INTERVAL_MS: float = float(os.getenv("PROFILE_CONTINUOUS_INTERVAL_MS", "100"))
+    PROFILE_CONTINUOUS_FLUSH_SECONDS: float = float(os.getenv("PROFILE_CONTINUOUS_FLUSH_SECONDS", "60"))
+    
+    # CPU thread budgeting across API workers
+    THREAD_BUDGETING: bool = os.getenv("THREAD_BUDGETING", "true").lower() == "true"
+    PIN_CPU_AFFINITY: bool = os.getenv("PIN_CPU_AFFINITY", "false").lower() == "true"
+    WORKER_SLOTS_DIR: str = os.getenv("WORKER_SLOTS_DIR", "data/worker_slots")
 
     # CORS settings (comma-separated origins in .env, e.g. "http://localhost:5173,http://localhost:5174")
     CORS_ORIGINS: list[str] = [
@@ -51,8 +185,35 @@ class Config:
     GROQ_TEMPERATURE: float = float(os.getenv("GROQ_TEMPERATURE", "0.7"))
     GROQ_MAX_TOKENS: int = int(os.getenv("GROQ_MAX_TOKENS", "1024"))
     
-    # Logging
-    LOG_LEVEL: str = "INFO"
+    # Model routing (opt-in): schemas marked "fast" use GROQ_FAST_MODEL; cascade
+    # re-asks GROQ_MODEL when the fast answer is missing a required section
+    GROQ_FAST_MODEL: str = os.getenv("GROQ_FAST_MODEL", "llama-3.1-8b-instant")
+    MODEL_ROUTING: bool = os.getenv("MODEL_ROUTING", "false").lower() == "true"
+    LLM_CASCADE: bool = os.getenv("LLM_CASCADE", "false").lower() == "true"
+    
+    # Cost accounting: USD per million input:output tokens ("model=0.59:0.79;other=0.05:0.08")
+    LLM_PRICES: dict = {
+        model.strip(): tuple(float(price) for price in prices.split(":", 1))
+        for model, _, prices in (
+            entry.partition("=") for entry in os.getenv("LLM_PRICES", "").split(";") if "=" in entry
+        )
+    }
+    
+    # Logging (queued and written off the request path; see log_setup.py)
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO").upper()
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "text")  # "text" or "json"
+    LOG_QUEUE_SIZE: int = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+    # Skip the per-record caller lookup (funcName/lineno become unavailable)
+    LOG_SKIP_CALLER_LOOKUP: bool = os.getenv("LOG_SKIP_CALLER_LOOKUP", "false").lower() == "true"
+    # Share of INFO/DEBUG records kept per logger ("retrieval_service=0.1;rag_pipeline=0.5")
+    LOG_SAMPLE_RATES: dict = {
+        name.strip(): float(rate)
+        for name, _, rate in (
+            entry.partition("=") for entry in os.getenv("LOG_SAMPLE_RATES", "").split(";") if "=" in entry
+        )
+    }
+    # Max INFO/DEBUG records per second for each message template (0 = unlimited)
+    LOG_RATE_LIMIT: float = float(os.getenv("LOG_RATE_LIMIT", "50"))
 
 
 config = Config()
\ No newline at end of file
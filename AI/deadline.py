@@ -0,0 +1,150 @@
+"""
+Per-request deadlines carried through every pipeline stage.
+
+A Deadline is created per request (X-Request-Deadline-Ms header, a
+deadline_ms field, or REQUEST_DEADLINE_MS). Each stage gets a share of the
+budget that remains when it starts. When the request sets a deadline,
+blocking calls without native timeouts (local encode, Pinecone) run on a
+shared thread pool and are abandoned when their share runs out, so a
+stalled dependency cannot hold the request indefinitely. The default
+deadline only shapes the LLM budget and is checked between stages; stages
+run inline.
+
+An abandoned call keeps its pool thread until it returns. Once
+DEADLINE_MAX_ABANDONED of them are outstanding, stages fail fast instead of
+queueing behind a stalled dependency. Misses are counted per stage for /stats.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, Optional
+
+from config import config
+from tracing import propagate
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(
+    max_workers=config.DEADLINE_POOL_WORKERS,
+    thread_name_prefix="deadline"
+)
+
+_misses: Dict[str, int] = {}
+_misses_lock = threading.Lock()
+_abandoned = {"running": 0, "total": 0, "rejected": 0}
+
+
+class DeadlineExceeded(Exception):
+    """A pipeline stage ran out of its deadline budget."""
+
+    def __init__(self, stage: str, budget: float):
+        self.stage = stage
+        self.budget = budget
+        super().__init__(f"Deadline exceeded in stage '{stage}' (budget {budget * 1000:.0f} ms)")
+
+
+class Deadline:
+    """
+    Absolute deadline for one request.
+    """
+
+    def __init__(self, budget_ms: float = None):
+        self.budget = (budget_ms or config.REQUEST_DEADLINE_MS) / 1000
+        self.expires_at = time.monotonic() + self.budget
+        # Only deadlines the caller asked for move stages onto the pool
+        self.enforced = bool(budget_ms)
+
+    @classmethod
+    def from_request(cls, header_ms: Optional[str] = None, field_ms: Optional[float] = None) -> "Deadline":
+        """Build from an explicit field, then the header, then the Config default."""
+        if field_ms:
+            return cls(field_ms)
+        if header_ms:
+            try:
+                return cls(float(header_ms))
+            except ValueError:
+                logger.warning("Ignoring invalid deadline header: %s", header_ms)
+        return cls()
+
+    def remaining(self) -> float:
+        """Seconds left (may be negative)."""
+        return self.expires_at - time.monotonic()
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def stage_timeout(self, stage: str) -> float:
+        """Seconds a stage may take: its configured share of what remains."""
+        share = config.DEADLINE_STAGE_SHARES.get(stage, 1.0)
+        return max(0.0, self.remaining() * share)
+
+
+def record_miss(stage: str):
+    """Count a deadline miss for a stage."""
+    with _misses_lock:
+        _misses[stage] = _misses.get(stage, 0) + 1
+    logger.warning("Deadline miss in stage '%s'", stage)
+
+
+def run_stage(
+    stage: str,
+    deadline: Optional[Deadline],
+    fn: Callable[..., Any],
+    *args,
+    **kwargs
+) -> Any:
+    """
+    Run fn within the stage's share of the deadline.
+    Without a deadline, fn runs inline at no extra cost; with the default
+    (unenforced) deadline it runs inline once the budget is checked.
+    """
+    if deadline is None:
+        return fn(*args, **kwargs)
+
+    timeout = deadline.stage_timeout(stage)
+    if timeout <= 0:
+        record_miss(stage)
+        raise DeadlineExceeded(stage, timeout)
+
+    if not deadline.enforced:
+        return fn(*args, **kwargs)
+
+    with _misses_lock:
+        saturated = _abandoned["running"] >= config.DEADLINE_MAX_ABANDONED
+        if saturated:
+            _abandoned["rejected"] += 1
+    if saturated:
+        # The pool is held by stalled calls; queueing would only burn the budget
+        record_miss(stage)
+        raise DeadlineExceeded(stage, timeout)
+
+    future = _executor.submit(propagate(fn), *args, **kwargs)
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeoutError:
+        # The call keeps running in the background; its result is discarded
+        if not future.cancel():
+            with _misses_lock:
+                _abandoned["running"] += 1
+                _abandoned["total"] += 1
+            future.add_done_callback(_release_abandoned)
+        record_miss(stage)
+        raise DeadlineExceeded(stage, timeout)
+
+
+def _release_abandoned(future):
+    with _misses_lock:
+        _abandoned["running"] -= 1
+
+
+def stats() -> dict:
+    """Deadline misses per stage and abandoned pool calls."""
+    with _misses_lock:
+        return {
+            "default_deadline_ms": config.REQUEST_DEADLINE_MS,
+            "misses": dict(_misses),
+            "abandoned": dict(_abandoned)
+        }
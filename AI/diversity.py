@@ -0,0 +1,82 @@
+"""
+Maximal Marginal Relevance selection over retrieved candidates.
+
+Overlapping chunk windows of the same page tend to fill the top-k with
+near-identical text. MMR picks candidates one at a time, trading relevance
+to the query against similarity to what is already picked:
+
+    mmr(d) = lambda * sim(q, d) - (1 - lambda) * max(sim(d, s) for s in selected)
+
+The candidate similarity matrix is computed once with NumPy, and each pick
+is a vectorized argmax over the running "closest selected" vector, so a
+selection over the usual 20-60 candidates costs well under a millisecond.
+"""
+
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+
+def mmr_select(
+    query_vector: Sequence[float],
+    candidate_vectors: Sequence[Sequence[float]],
+    k: int,
+    lambda_mult: float = 0.7,
+    token_costs: Optional[Sequence[int]] = None,
+    token_budget: Optional[int] = None,
+    redundancy_threshold: Optional[float] = None
+) -> List[int]:
+    """
+    Pick up to k diverse, relevant candidates.
+
+    Args:
+        query_vector: Query embedding
+        candidate_vectors: Candidate embeddings, one row per candidate
+        k: Maximum number of candidates to pick
+        lambda_mult: 1.0 ranks by relevance only, 0.0 by diversity only
+        token_costs: Estimated tokens per candidate (with token_budget)
+        token_budget: Skip candidates that no longer fit (the first pick always fits)
+        redundancy_threshold: Never pick a candidate this similar to a picked one
+
+    Returns:
+        Indices into candidate_vectors, in pick order
+    """
+    candidates = np.asarray(candidate_vectors, dtype=np.float32)
+    if candidates.ndim != 2 or len(candidates) == 0 or k <= 0:
+        return []
+
+    query = np.asarray(query_vector, dtype=np.float32)
+
+    # Cosine similarities (vectors may not be normalized, e.g. fetched values)
+    candidates = candidates / np.maximum(np.linalg.norm(candidates, axis=1, keepdims=True), 1e-12)
+    query = query / max(float(np.linalg.norm(query)), 1e-12)
+    relevance = candidates @ query
+    pairwise = candidates @ candidates.T
+
+    n = len(candidates)
+    available = np.ones(n, dtype=bool)
+    closest = np.full(n, -np.inf, dtype=np.float32)
+    costs = np.asarray(token_costs, dtype=np.int64) if token_costs is not None else None
+    remaining = token_budget
+
+    selected: List[int] = []
+    while len(selected) < k:
+        if selected:
+            if redundancy_threshold is not None:
+                available &= closest < redundancy_threshold
+            if costs is not None and remaining is not None:
+                available &= costs <= remaining
+        if not available.any():
+            break
+
+        diversity_penalty = np.where(np.isfinite(closest), closest, 0.0)
+        scores = lambda_mult * relevance - (1 - lambda_mult) * diversity_penalty
+        pick = int(np.argmax(np.where(available, scores, -np.inf)))
+
+        selected.append(pick)
+        available[pick] = False
+        np.maximum(closest, pairwise[pick], out=closest)
+        if costs is not None and remaining is not None:
+            remaining -= int(costs[pick])
+
+    return selected
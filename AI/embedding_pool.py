@@ -0,0 +1,333 @@
+"""
+Multi-process embedding pool for large embed_batch workloads.
+
+Each worker process holds its own copy of the model with a pinned torch
+thread count. Texts go to the workers and vectors come back through
+per-worker shared-memory buffers, so only small control messages (job ids,
+text lengths) cross the pipes and vectors are never pickled. Large batches
+are sharded across idle workers and reassembled in input order.
+
+A worker that dies (e.g. OOM-killed) is replaced with a fresh process and
+its jobs are retried. If no worker can be brought back, jobs fall back to
+the in-process model when the pool was given one.
+"""
+
+import logging
+import multiprocessing as mp
+import os
+import threading
+from multiprocessing import shared_memory
+from multiprocessing.connection import wait
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+from config import config
+import topology
+
+logger = logging.getLogger(__name__)
+
+
+def _worker_main(
+    conn,
+    model_name: str,
+    device: str,
+    threads: int,
+    input_name: str,
+    output_name: str,
+    dimension: int
+):
+    """Worker loop: decode texts from shared memory, encode, write vectors back."""
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    torch.set_num_threads(threads)
+    model = SentenceTransformer(model_name, device=device)
+
+    input_shm = shared_memory.SharedMemory(name=input_name)
+    output_shm = shared_memory.SharedMemory(name=output_name)
+    conn.send(("ready", None))
+
+    try:
+        while True:
+            message = conn.recv()
+            if message is None:
+                break
+
+            job_id, lengths = message
+            try:
+                texts = []
+                offset = 0
+                for length in lengths:
+                    texts.append(bytes(input_shm.buf[offset:offset + length]).decode("utf-8", errors="ignore"))
+                    offset += length
+
+                vectors = model.encode(
+                    texts,
+                    normalize_embeddings=config.NORMALIZE_EMBEDDINGS,
+                    batch_size=config.EMBEDDING_BATCH_SIZE,
+                    convert_to_numpy=True,
+                    show_progress_bar=False
+                )
+                out = np.ndarray((len(texts), dimension), dtype=np.float32, buffer=output_shm.buf)
+                out[:] = vectors
+                del out
+                conn.send(("done", job_id))
+            except Exception as e:
+                conn.send(("error", f"{job_id}: {e}"))
+    finally:
+        input_shm.close()
+        output_shm.close()
+
+
+class _Worker:
+    """Handle for one worker process and its shared buffers."""
+
+    def __init__(self, ctx, model_name: str, device: str, threads: int, dimension: int, max_rows: int, input_bytes: int):
+        self.dimension = dimension
+        self.max_rows = max_rows
+        self.input_shm = shared_memory.SharedMemory(create=True, size=input_bytes)
+        self.output_shm = shared_memory.SharedMemory(create=True, size=max_rows * dimension * 4)
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(child_conn, model_name, device, threads, self.input_shm.name, self.output_shm.name, dimension),
+            daemon=True
+        )
+        self.process.start()
+
+    def submit(self, job_id: int, encoded: List[bytes]):
+        offset = 0
+        for data in encoded:
+            self.input_shm.buf[offset:offset + len(data)] = data
+            offset += len(data)
+        self.conn.send((job_id, [len(data) for data in encoded]))
+
+    def read_output(self, rows: int) -> np.ndarray:
+        return np.ndarray((rows, self.dimension), dtype=np.float32, buffer=self.output_shm.buf)
+
+    def close(self):
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.conn.close()
+        for shm in (self.input_shm, self.output_shm):
+            shm.close()
+            shm.unlink()
+
+
+class EmbeddingPool:
+    """
+    Pool of embedding worker processes.
+    """
+
+    def __init__(
+        self,
+        dimension: int,
+        num_workers: int = None,
+        threads_per_worker: int = None,
+        model_name: str = None,
+        device: str = None,
+        max_rows: int = None,
+        fallback: Optional[Callable[[List[str]], np.ndarray]] = None
+    ):
+        """
+        Args:
+            dimension: Embedding dimension
+            num_workers: Worker processes (defaults to EMBEDDING_POOL_WORKERS)
+            threads_per_worker: Torch threads per worker
+            model_name: Model each worker loads
+            device: Device each worker uses
+            max_rows: Rows per job (sizes the shared buffers)
+            fallback: In-process encoder used when workers die and cannot be replaced
+        """
+        self.num_workers = num_workers or config.EMBEDDING_POOL_WORKERS
+        self.threads_per_worker = threads_per_worker or max(1, topology.thread_budget() // self.num_workers)
+        self.model_name = model_name or config.EMBEDDING_MODEL_NAME
+        self.device = device or config.EMBEDDING_DEVICE
+        self.dimension = dimension
+        self.max_rows = max_rows or config.EMBEDDING_POOL_MAX_ROWS
+        self.input_bytes = self.max_rows * config.EMBEDDING_POOL_BYTES_PER_TEXT
+        self.fallback = fallback
+        self._lock = threading.Lock()
+        self._respawned = 0
+        self._fallbacks = 0
+
+        logger.info(
+            f"Starting embedding pool: {self.num_workers} workers x "
+            f"{self.threads_per_worker} threads, {self.max_rows} rows per job"
+        )
+
+        # spawn: torch thread pools do not survive fork reliably
+        self._ctx = mp.get_context("spawn")
+        self._workers = [self._spawn() for _ in range(self.num_workers)]
+
+        for worker in self._workers:
+            status, _ = worker.conn.recv()
+            if status != "ready":
+                raise RuntimeError("Embedding worker failed to start")
+
+        logger.info("Embedding pool ready")
+
+    def _spawn(self) -> _Worker:
+        return _Worker(self._ctx, self.model_name, self.device, self.threads_per_worker,
+                       self.dimension, self.max_rows, self.input_bytes)
+
+    def _replace(self, dead: List[_Worker]):
+        """Swap dead workers for fresh processes (dropping any that fail to start)."""
+        for worker in dead:
+            self._workers.remove(worker)
+            worker.close()
+            try:
+                replacement = self._spawn()
+            except OSError as e:
+                logger.error(f"Could not respawn embedding worker: {str(e)}")
+                continue
+            try:
+                status, _ = replacement.conn.recv()
+            except (EOFError, OSError):
+                status = None
+            if status != "ready":
+                logger.error("Respawned embedding worker failed to start")
+                replacement.close()
+                continue
+            self._workers.append(replacement)
+            self._respawned += 1
+            logger.warning("Replaced a dead embedding worker")
+
+    def _shard(self, texts: List[str]) -> List[Tuple[int, List[bytes]]]:
+        """Split texts into jobs bounded by rows and input buffer bytes."""
+        jobs = []
+        # Spread evenly across workers, but never exceed a worker's buffers
+        rows_per_job = min(self.max_rows, max(1, -(-len(texts) // self.num_workers)))
+        start = 0
+        current: List[bytes] = []
+        current_bytes = 0
+
+        for text in texts:
+            data = text.encode("utf-8")[:self.input_bytes]
+            if current and (len(current) >= rows_per_job or current_bytes + len(data) > self.input_bytes):
+                jobs.append((start, current))
+                start += len(current)
+                current, current_bytes = [], 0
+            current.append(data)
+            current_bytes += len(data)
+
+        if current:
+            jobs.append((start, current))
+        return jobs
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """
+        Encode texts across the pool.
+
+        Returns:
+            float32 matrix of shape (len(texts), dimension), in input order
+        """
+        result = np.empty((len(texts), self.dimension), dtype=np.float32)
+        if not texts:
+            return result
+
+        with self._lock:
+            failed, error = self._run_jobs(self._shard(texts), result)
+
+            # Jobs lost with a dead worker: retry once on replaced workers
+            if failed and error is None:
+                failed, error = self._run_jobs(failed, result)
+
+            if failed and error is None:
+                if self.fallback is None:
+                    raise RuntimeError(
+                        f"Embedding pool has no live workers ({len(self._workers)} of {self.num_workers} running) "
+                        "and no in-process fallback"
+                    )
+                self._fallbacks += 1
+                logger.warning(f"Encoding {len(failed)} jobs in-process after embedding worker failures")
+                for start, encoded in failed:
+                    result[start:start + len(encoded)] = self.fallback(texts[start:start + len(encoded)])
+
+        if error is not None:
+            raise RuntimeError(f"Embedding worker error: {error}")
+
+        return result
+
+    def _run_jobs(
+        self,
+        jobs: List[Tuple[int, List[bytes]]],
+        result: np.ndarray
+    ) -> Tuple[List[Tuple[int, List[bytes]]], Optional[str]]:
+        """
+        Run jobs on idle workers, writing vectors into result.
+
+        Returns:
+            (jobs lost to dead workers, first worker-reported error)
+        """
+        idle = list(self._workers)
+        running = {}
+        dead: List[_Worker] = []
+        failed: List[Tuple[int, List[bytes]]] = []
+        next_job = 0
+        error = None
+
+        # On error, stop submitting but drain running jobs so pipes stay in sync
+        while (next_job < len(jobs) and error is None and idle) or running:
+            while idle and next_job < len(jobs) and error is None:
+                worker = idle.pop()
+                job = jobs[next_job]
+                next_job += 1
+                try:
+                    worker.submit(next_job, job[1])
+                except (BrokenPipeError, EOFError, OSError):
+                    dead.append(worker)
+                    failed.append(job)
+                    continue
+                running[worker.conn] = (worker, job)
+
+            for conn in wait(list(running)):
+                worker, job = running.pop(conn)
+                try:
+                    status, payload = conn.recv()
+                except (EOFError, OSError):
+                    # Worker died mid-job (e.g. OOM-killed)
+                    dead.append(worker)
+                    failed.append(job)
+                    continue
+                if status == "done":
+                    start, encoded = job
+                    result[start:start + len(encoded)] = worker.read_output(len(encoded))
+                else:
+                    error = payload
+                idle.append(worker)
+
+        # Every worker died before the queue drained
+        failed.extend(jobs[next_job:] if error is None else [])
+
+        if dead:
+            logger.error(f"{len(dead)} embedding workers died; respawning")
+            self._replace(dead)
+
+        return failed, error
+
+    def close(self):
+        """Stop workers and release shared memory."""
+        for worker in self._workers:
+            worker.close()
+        self._workers = []
+        logger.info("Embedding pool stopped")
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.num_workers,
+            "threads_per_worker": self.threads_per_worker,
+            "max_rows": self.max_rows,
+            "live_workers": len(self._workers),
+            "respawned": self._respawned,
+            "fallbacks": self._fallbacks
+        }
@@ -0,0 +1,331 @@
+"""
+Local embedding server shared by all API workers over a Unix socket.
+
+One process owns the model, the embedding cache and micro-batching; API
+workers connect with EmbeddingClient (EmbeddingService does this when
+EMBEDDING_SERVER_SOCKET is set). Requests arriving from any worker within
+EMBEDDING_SERVER_MAX_WAIT_MS are merged into one encode call, and the model
+stays warm across API worker restarts.
+
+Wire protocol (little-endian), every message framed as uint32 length + body:
+    request:  uint8 op | uint32 count | uint32[count] text lengths | utf-8 texts
+    response: uint8 status | uint32 count | uint32 dim | payload
+              payload = float32[count * dim] for embeddings,
+                        utf-8 JSON for info/stats, utf-8 message for errors
+
+Usage:
+    python embedding_server.py
+    python embedding_server.py --socket /run/rag/embed.sock
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+OP_EMBED = 1
+OP_EMBED_NOCACHE = 2
+OP_INFO = 3
+OP_STATS = 4
+OP_CLEAR_CACHE = 5
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+_FRAME = struct.Struct("<I")
+_REQUEST_HEADER = struct.Struct("<BI")
+_RESPONSE_HEADER = struct.Struct("<BII")
+
+
+def encode_request(op: int, texts: List[str] = ()) -> bytes:
+    encoded = [text.encode("utf-8") for text in texts]
+    body = b"".join([
+        _REQUEST_HEADER.pack(op, len(encoded)),
+        struct.pack(f"<{len(encoded)}I", *(len(data) for data in encoded)),
+        *encoded
+    ])
+    return _FRAME.pack(len(body)) + body
+
+
+def decode_request(body: bytes) -> Tuple[int, List[str]]:
+    op, count = _REQUEST_HEADER.unpack_from(body)
+    offset = _REQUEST_HEADER.size
+    lengths = struct.unpack_from(f"<{count}I", body, offset)
+    offset += 4 * count
+
+    texts = []
+    for length in lengths:
+        texts.append(body[offset:offset + length].decode("utf-8"))
+        offset += length
+    return op, texts
+
+
+def encode_response(status: int, vectors: Optional[np.ndarray] = None, payload: bytes = b"") -> bytes:
+    if vectors is not None:
+        vectors = np.ascontiguousarray(vectors, dtype="<f4")
+        count, dim = vectors.shape
+        payload = vectors.tobytes()
+    else:
+        count, dim = 0, 0
+    body = _RESPONSE_HEADER.pack(status, count, dim) + payload
+    return _FRAME.pack(len(body)) + body
+
+
+class EmbeddingServer:
+    """
+    Asyncio Unix-socket server with cross-client micro-batching.
+    """
+
+    def __init__(
+        self,
+        socket_path: str = None,
+        max_batch: int = None,
+        max_wait_ms: float = None
+    ):
+        from embedding_service import EmbeddingService
+
+        self.socket_path = socket_path or config.EMBEDDING_SERVER_SOCKET
+        self.max_batch = max_batch or config.EMBEDDING_SERVER_MAX_BATCH
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else config.EMBEDDING_SERVER_MAX_WAIT_MS) / 1000
+
+        # The server always encodes locally
+        self.service = EmbeddingService(server_socket="")
+        self.dimension = self.service.dimension
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._batches = 0
+        self._batched_texts = 0
+
+    async def serve(self):
+        """Run until cancelled."""
+        self._queue = asyncio.Queue()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        os.makedirs(os.path.dirname(self.socket_path) or ".", exist_ok=True)
+
+        server = await asyncio.start_unix_server(self._handle_client, path=self.socket_path)
+        batcher = asyncio.create_task(self._batch_loop())
+        logger.info(f"Embedding server listening on {self.socket_path}")
+
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+            self.service.close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                header = await reader.readexactly(_FRAME.size)
+                (length,) = _FRAME.unpack(header)
+                body = await reader.readexactly(length)
+                writer.write(await self._dispatch(body))
+                await writer.drain()
+        except asyncio.IncompleteReadError:
+            pass
+        except Exception as e:
+            logger.error(f"Embedding server connection error: {str(e)}")
+        finally:
+            writer.close()
+
+    async def _dispatch(self, body: bytes) -> bytes:
+        try:
+            op, texts = decode_request(body)
+
+            if op in (OP_EMBED, OP_EMBED_NOCACHE):
+                vectors = await self._embed(texts, use_cache=op == OP_EMBED)
+                return encode_response(STATUS_OK, vectors=vectors)
+
+            if op == OP_INFO:
+                info = {"model": self.service.model_name, "dimension": self.dimension}
+                return encode_response(STATUS_OK, payload=json.dumps(info).encode())
+
+            if op == OP_STATS:
+                stats = self.service.get_cache_stats()
+                stats["server_batches"] = self._batches
+                stats["server_batched_texts"] = self._batched_texts
+                return encode_response(STATUS_OK, payload=json.dumps(stats).encode())
+
+            if op == OP_CLEAR_CACHE:
+                self.service.clear_cache()
+                return encode_response(STATUS_OK)
+
+            raise ValueError(f"Unknown op {op}")
+
+        except Exception as e:
+            return encode_response(STATUS_ERROR, payload=str(e).encode())
+
+    async def _embed(self, texts: List[str], use_cache: bool) -> np.ndarray:
+        """Serve cache hits directly and queue misses for the batcher."""
+        result = np.empty((len(texts), self.dimension), dtype=np.float32)
+        cache = self.service.cache if use_cache else None
+
+        misses = []
+        for i, text in enumerate(texts):
+            cached = cache.get(text, self.service.model_name) if cache else None
+            if cached is not None:
+                result[i] = cached
+            else:
+                misses.append(i)
+
+        if misses:
+            future = asyncio.get_running_loop().create_future()
+            await self._queue.put(([texts[i] for i in misses], future))
+            vectors = await future
+            result[misses] = vectors
+            if cache:
+                for i, vector in zip(misses, vectors):
+                    cache.set(texts[i], self.service.model_name, vector)
+
+        return result
+
+    async def _batch_loop(self):
+        """Merge queued requests into one encode call per window."""
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self._queue.get()]
+            count = len(items[0][0])
+            deadline = loop.time() + self.max_wait
+
+            while count < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                items.append(item)
+                count += len(item[0])
+
+            texts = [text for item_texts, _ in items for text in item_texts]
+            try:
+                vectors = await loop.run_in_executor(None, self.service.encode_array, texts)
+            except Exception as e:
+                for _, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self._batches += 1
+            self._batched_texts += len(texts)
+
+            offset = 0
+            for item_texts, future in items:
+                if not future.done():
+                    future.set_result(vectors[offset:offset + len(item_texts)])
+                offset += len(item_texts)
+
+
+class EmbeddingClient:
+    """
+    Blocking client for EmbeddingServer.
+    One persistent connection per thread, re-established on failure.
+    """
+
+    def __init__(self, socket_path: str = None, timeout: float = None):
+        self.socket_path = socket_path or config.EMBEDDING_SERVER_SOCKET
+        self.timeout = timeout or config.EMBEDDING_SERVER_TIMEOUT
+        self._local = threading.local()
+
+    def _connection(self) -> socket.socket:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            conn.settimeout(self.timeout)
+            conn.connect(self.socket_path)
+            self._local.conn = conn
+        return conn
+
+    def _reset(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+        self._local.conn = None
+
+    def _recv_exactly(self, conn: socket.socket, size: int) -> bytes:
+        buf = bytearray(size)
+        view = memoryview(buf)
+        received = 0
+        while received < size:
+            n = conn.recv_into(view[received:])
+            if n == 0:
+                raise ConnectionError("Embedding server closed the connection")
+            received += n
+        return bytes(buf)
+
+    def _call(self, op: int, texts: List[str] = ()) -> Tuple[int, int, bytes]:
+        request = encode_request(op, texts)
+
+        # One retry covers a server restart between calls
+        for attempt in range(2):
+            try:
+                conn = self._connection()
+                conn.sendall(request)
+                (length,) = _FRAME.unpack(self._recv_exactly(conn, _FRAME.size))
+                body = self._recv_exactly(conn, length)
+                break
+            except (ConnectionError, socket.timeout, OSError):
+                self._reset()
+                if attempt == 1:
+                    raise
+
+        status, count, dim = _RESPONSE_HEADER.unpack_from(body)
+        payload = body[_RESPONSE_HEADER.size:]
+        if status != STATUS_OK:
+            raise RuntimeError(f"Embedding server error: {payload.decode('utf-8', errors='replace')}")
+        return count, dim, payload
+
+    def embed(self, texts: List[str], use_cache: bool = True) -> np.ndarray:
+        """Embed texts; returns a (len(texts), dim) float32 matrix."""
+        count, dim, payload = self._call(OP_EMBED if use_cache else OP_EMBED_NOCACHE, texts)
+        return np.frombuffer(payload, dtype="<f4").reshape(count, dim)
+
+    def info(self) -> dict:
+        return json.loads(self._call(OP_INFO)[2])
+
+    def stats(self) -> dict:
+        return json.loads(self._call(OP_STATS)[2])
+
+    def clear_cache(self):
+        self._call(OP_CLEAR_CACHE)
+
+    def wait_until_ready(self, timeout: float = 60.0):
+        """Block until the server answers (used at API startup)."""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                return self.info()
+            except (OSError, RuntimeError):
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.5)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(
+        level=config.LOG_LEVEL,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    parser = argparse.ArgumentParser(description="Shared local embedding server")
+    parser.add_argument("--socket", default=config.EMBEDDING_SERVER_SOCKET or "/tmp/rag-embedding.sock")
+    args = parser.parse_args()
+
+    asyncio.run(EmbeddingServer(socket_path=args.socket).serve())
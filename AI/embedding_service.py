@@ -1,9 +1,14 @@
 import logging
-from typing import List, Union
+from typing import List
+
+import numpy as np
 from sentence_transformers import SentenceTransformer
 
 from config import config
 from cache_manager import EmbeddingCache
+from embedding_pool import EmbeddingPool
+from embedding_server import EmbeddingClient
+import tracing
 
 logger = logging.getLogger(__name__)
 
@@ -12,26 +17,66 @@ class EmbeddingService:
     """
     Service for generating embeddings with caching support.
     Loaded once at application startup.
+    
+    With EMBEDDING_SERVER_SOCKET set it is a thin client of the shared
+    embedding server, which then owns the model, batching and cache.
+    
+    Embeddings are float32 numpy arrays end to end: the array returned by
+    the model is what the cache holds and what retrieval receives (batch
+    rows are views into one matrix). Conversion to Python lists happens
+    only at the Pinecone client boundary. Returned arrays may be shared
+    with the cache and are read-only.
     """
     
     def __init__(
         self,
         model_name: str = None,
         device: str = None,
-        enable_cache: bool = None
+        enable_cache: bool = None,
+        pool_workers: int = None,
+        server_socket: str = None
     ):
         self.model_name = model_name or config.EMBEDDING_MODEL_NAME
         self.device = device or config.EMBEDDING_DEVICE
         self.enable_cache = enable_cache if enable_cache is not None else config.ENABLE_CACHE
+        self.server_socket = server_socket if server_socket is not None else config.EMBEDDING_SERVER_SOCKET
+        self.pool = None
+        self.client = None
+        
+        # Thin-client mode: no local model or cache
+        if self.server_socket:
+            self.model = None
+            self.cache = None
+            self.client = EmbeddingClient(self.server_socket)
+            info = self.client.wait_until_ready()
+            self.model_name = info["model"]
+            self.dimension = info["dimension"]
+            logger.info(f"Using embedding server at {self.server_socket} ({self.model_name})")
+            return
         
         # Initialize cache
         if self.enable_cache:
-            self.cache = EmbeddingCache(max_size=config.CACHE_MAX_SIZE)
+            self.cache = EmbeddingCache(
+                max_size=config.CACHE_MAX_SIZE,
+                max_bytes=config.CACHE_MAX_BYTES
+            )
         else:
             self.cache = None
         
         # Load model (happens once)
         self._load_model()
+        self.dimension = self.model.get_sentence_embedding_dimension()
+        
+        # Optional worker pool for large batches
+        pool_workers = pool_workers if pool_workers is not None else config.EMBEDDING_POOL_WORKERS
+        if pool_workers > 0:
+            self.pool = EmbeddingPool(
+                dimension=self.dimension,
+                num_workers=pool_workers,
+                model_name=self.model_name,
+                device=self.device,
+                fallback=self._encode_local
+            )
     
     def _load_model(self):
         """Load the embedding model."""
@@ -45,56 +90,130 @@ class EmbeddingService:
         
         logger.info("Embedding model loaded successfully")
     
-    def embed_single(self, query: str) -> List[float]:
+    def _encode_one(self, text: str) -> np.ndarray:
+        """Encode one text into a read-only float32 vector (no copy for float32 output)."""
+        embedding = np.asarray(self.model.encode(
+            text,
+            normalize_embeddings=config.NORMALIZE_EMBEDDINGS,
+            show_progress_bar=False
+        ), dtype=np.float32)
+        embedding.setflags(write=False)
+        return embedding
+    
+    def embed_single(self, query: str) -> np.ndarray:
         """
         Generate embedding for a single query.
         Uses cache if enabled.
         """
-        # Check cache first
-        if self.cache:
-            cached_embedding = self.cache.get(query, self.model_name)
-            if cached_embedding is not None:
-                return cached_embedding
-        
-        # Generate embedding
-        embedding = self.model.encode(
-            query,
-            normalize_embeddings=config.NORMALIZE_EMBEDDINGS,
-            show_progress_bar=False
-        )
-        
-        embedding_list = embedding.tolist()
-        
-        # Store in cache
-        if self.cache:
-            self.cache.set(query, self.model_name, embedding_list)
+        with tracing.span("embed", model=self.model_name, server=bool(self.client)):
+            if self.client:
+                return self.client.embed([query])[0]
+            
+            # Check cache first
+            if self.cache:
+                with tracing.span("embedding_cache.get") as lookup:
+                    cached_embedding = self.cache.get(query, self.model_name)
+                    lookup.set("hit", cached_embedding is not None)
+                if cached_embedding is not None:
+                    return cached_embedding
+            
+            # Generate embedding
+            with tracing.span("encode", device=self.device):
+                embedding = self._encode_one(query)
+            
+            # Store in cache (the same buffer is returned to the caller)
+            if self.cache:
+                self.cache.set(query, self.model_name, embedding)
+            
+            return embedding
+    
+    def embed_uncached(self, text: str) -> np.ndarray:
+        """Generate an embedding, bypassing the cache."""
+        if self.client:
+            return self.client.embed([text], use_cache=False)[0]
         
-        return embedding_list
+        return self._encode_one(text)
     
-    def embed_batch(self, queries: List[str]) -> List[List[float]]:
+    def encode_array(self, texts: List[str]) -> np.ndarray:
         """
-        Generate embeddings for multiple queries in batch.
-        Much faster than individual encoding.
+        Encode texts into a float32 matrix (no cache).
+        Uses the embedding server or worker pool when configured.
         """
-        logger.info(f"Batch encoding {len(queries)} queries")
+        if self.client:
+            return self.client.embed(texts, use_cache=False)
+        
+        if self.pool is not None and len(texts) >= config.EMBEDDING_POOL_MIN_BATCH:
+            return self.pool.encode(texts)
         
-        embeddings = self.model.encode(
-            queries,
+        return self._encode_local(texts)
+    
+    def _encode_local(self, texts: List[str]) -> np.ndarray:
+        """Encode texts with the in-process model."""
+        return np.asarray(self.model.encode(
+            texts,
             normalize_embeddings=config.NORMALIZE_EMBEDDINGS,
             batch_size=config.EMBEDDING_BATCH_SIZE,
             show_progress_bar=False
-        )
-        
-        return [emb.tolist() for emb in embeddings]
+        ), dtype=np.float32)
     
+    def embed_batch(self, queries: List[str]) -> np.ndarray:
+        """
+        Generate embeddings for multiple queries in batch.
+        Much faster than individual encoding.
+        Large batches are sharded across the worker pool when enabled.
+        
+        Returns:
+            (len(queries), dimension) float32 matrix; iterating it yields row views
+        """
+        logger.info("Batch encoding %d queries", len(queries))
+        
+        return self.encode_array(queries)
+
+    def prefill_cache(self, queries: List[str]) -> int:
+        """
+        Embed queries in one batch and store them in the cache (warm-up).
+        Queries already cached are skipped.
+
+        Returns:
+            Number of queries embedded
+        """
+        if self.client:
+            # The server caches what it embeds
+            self.client.embed(queries)
+            return len(queries)
+
+        if not self.cache:
+            return 0
+
+        missing = [query for query in queries if self.cache.get(query, self.model_name) is None]
+        if not missing:
+            return 0
+
+        for query, embedding in zip(missing, self.embed_batch(missing)):
+            self.cache.set(query, self.model_name, embedding)
+        return len(missing)
+
     def get_cache_stats(self) -> dict:
         """Return cache statistics."""
+        if self.client:
+            return self.client.stats()
+        
         if self.cache:
             return self.cache.stats()
         return {"cache_enabled": False}
     
+    def close(self):
+        """Stop the worker pool, if any."""
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+    
     def clear_cache(self):
         """Clear the embedding cache."""
+        if self.client:
+            self.client.clear_cache()
+            logger.info("Embedding server cache cleared")
+        
         if self.cache:
             self.cache.clear()
             logger.info("Embedding cache cleared")
\ No newline at end of file
@@ -0,0 +1,213 @@
+"""
+Hedged requests for tail-latency-sensitive backend calls.
+
+A call that has not returned by an adaptive threshold (a percentile of
+recently observed latencies) gets a duplicate; whichever attempt finishes
+first wins and the other is ignored. A token budget caps the extra load:
+every call earns HEDGE_BUDGET_RATIO tokens and every hedge spends one, so
+at most that fraction of calls is duplicated even when the backend is slow
+across the board.
+
+FakeIndex is a local stand-in for a Pinecone index with an injected latency
+distribution, used by `python benchmark.py hedging`.
+"""
+
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from config import config
+from tracing import propagate
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyTracker:
+    """
+    Sliding window of call latencies with a cached percentile.
+    """
+
+    def __init__(self, window: int = None, percentile: float = None, min_samples: int = 50):
+        self.percentile = percentile or config.HEDGE_PERCENTILE
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window or config.HEDGE_WINDOW)
+        self._threshold: Optional[float] = None
+        self._since_refresh = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+            self._since_refresh += 1
+            # Recomputing on every sample would cost more than it saves
+            if len(self._samples) >= self.min_samples and (
+                self._threshold is None or self._since_refresh >= self.min_samples
+            ):
+                self._threshold = float(np.percentile(self._samples, self.percentile))
+                self._since_refresh = 0
+
+    def threshold(self) -> Optional[float]:
+        """Current percentile in seconds, or None until enough samples exist."""
+        return self._threshold
+
+
+class HedgeBudget:
+    """
+    Token bucket limiting hedges to a fraction of calls.
+    """
+
+    def __init__(self, ratio: float = None, burst: float = 10.0):
+        self.ratio = config.HEDGE_BUDGET_RATIO if ratio is None else ratio
+        self.burst = burst
+        self._tokens = burst
+        self._lock = threading.Lock()
+
+    def on_call(self):
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return True
+            return False
+
+
+class Hedger:
+    """
+    Runs calls with an optional hedge after the adaptive threshold.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        percentile: float = None,
+        budget_ratio: float = None,
+        max_workers: int = None
+    ):
+        self.name = name
+        self.tracker = LatencyTracker(percentile=percentile)
+        self.budget = HedgeBudget(ratio=budget_ratio)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or config.HEDGE_POOL_WORKERS,
+            thread_name_prefix=f"hedge-{name}"
+        )
+        self._counts = {"calls": 0, "hedged": 0, "hedge_wins": 0, "budget_denied": 0}
+        self._counts_lock = threading.Lock()
+
+    def _count(self, key: str):
+        with self._counts_lock:
+            self._counts[key] += 1
+
+    def _delay(self) -> float:
+        threshold = self.tracker.threshold()
+        if threshold is None:
+            threshold = config.HEDGE_INITIAL_DELAY_MS / 1000
+        return max(threshold, config.HEDGE_MIN_DELAY_MS / 1000)
+
+    def _submit(self, fn: Callable[..., Any], *args, **kwargs):
+        start = time.perf_counter()
+
+        def timed():
+            result = fn(*args, **kwargs)
+            # Every completed attempt feeds the distribution, including losers
+            self.tracker.record(time.perf_counter() - start)
+            return result
+
+        return self._executor.submit(propagate(timed))
+
+    def call(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Call fn, hedging once if it is slower than the threshold.
+        Raises only if every attempt fails.
+        """
+        self._count("calls")
+        self.budget.on_call()
+
+        primary = self._submit(fn, *args, **kwargs)
+        done, _ = wait([primary], timeout=self._delay())
+        if done:
+            return primary.result()
+
+        if not self.budget.try_spend():
+            self._count("budget_denied")
+            return primary.result()
+
+        self._count("hedged")
+        hedge = self._submit(fn, *args, **kwargs)
+        pending = {primary, hedge}
+        error = None
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self._count("hedge_wins")
+                    # The other attempt finishes in the background and is ignored
+                    for other in pending:
+                        other.cancel()
+                    return future.result()
+                error = future.exception()
+
+        raise error
+
+    def stats(self) -> Dict[str, Any]:
+        with self._counts_lock:
+            counts = dict(self._counts)
+        threshold = self.tracker.threshold()
+        counts["hedge_rate"] = counts["hedged"] / counts["calls"] if counts["calls"] else 0.0
+        counts["threshold_ms"] = threshold * 1000 if threshold is not None else None
+        counts["percentile"] = self.tracker.percentile
+        return counts
+
+
+class FakeIndex:
+    """
+    Local stand-in for a Pinecone index with injected latency.
+
+    Latency is lognormal around median_ms, with a tail_probability chance of
+    an extra tail_ms stall (a GC pause, a slow replica).
+    """
+
+    def __init__(
+        self,
+        median_ms: float = 20.0,
+        sigma: float = 0.3,
+        tail_probability: float = 0.03,
+        tail_ms: float = 400.0,
+        seed: int = None
+    ):
+        self.median_ms = median_ms
+        self.sigma = sigma
+        self.tail_probability = tail_probability
+        self.tail_ms = tail_ms
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample_latency(self) -> float:
+        """One latency draw in seconds."""
+        with self._lock:
+            ms = self.median_ms * self._random.lognormvariate(0.0, self.sigma)
+            if self._random.random() < self.tail_probability:
+                ms += self.tail_ms
+        return ms / 1000
+
+    def query(self, vector: List[float], top_k: int, **kwargs) -> Dict[str, Any]:
+        time.sleep(self.sample_latency())
+        return {
+            "matches": [
+                {"id": f"fake-{i}", "score": 1.0 - i * 0.01, "metadata": {"text": f"fake chunk {i}"}}
+                for i in range(top_k)
+            ]
+        }
+
+    def describe_index_stats(self) -> Dict[str, Any]:
+        return {"dimension": None, "total_vector_count": 0, "namespaces": {}}
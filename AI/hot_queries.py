@@ -0,0 +1,227 @@
+"""
+Hot query log and cache warm-up.
+
+After a deploy every cache starts empty, so the first requests for popular
+questions pay for embedding (and retrieval) again. With HOT_QUERY_LOG_PATH
+set, the API records each query to a size-rotated JSONL file:
+
+    {"ts": 1718000000.1, "normalized": "what is paging", "query": "What is paging?",
+     "marks": 5, "namespace": "os"}
+
+Recording only queues the raw values. Normalization, serialization and
+file writes happen on a listener thread, and records are dropped rather
+than blocking when the queue is full.
+
+At startup, CacheWarmer reads the log (including rotated files), ranks
+(normalized query, marks, namespace) by frequency and re-embeds the top
+WARMUP_TOP_N in batches through embed_batch to fill the embedding cache.
+With WARMUP_RETRIEVE it also runs retrieval for them. Warming runs in the
+background within WARMUP_BUDGET_SECONDS. /ready reports 503 until it
+finishes or runs out of budget.
+"""
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from logging.handlers import QueueListener, RotatingFileHandler
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import config
+from answer_bank import normalize_query
+from log_setup import DroppingQueueHandler
+
+logger = logging.getLogger(__name__)
+
+
+class _HotQueryFormatter(logging.Formatter):
+    """Serializes the queued (ts, query, marks, namespace) tuple on the listener thread."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        ts, query, marks, namespace = record.hot_query
+        return json.dumps({
+            "ts": round(ts, 3),
+            "normalized": normalize_query(query),
+            "query": query,
+            "marks": marks,
+            "namespace": namespace
+        }, ensure_ascii=False)
+
+
+class HotQueryLog:
+    """
+    Asynchronous, size-rotated log of served queries.
+    """
+
+    def __init__(self, path: str = None, max_bytes: int = None, backups: int = None, queue_size: int = None):
+        """
+        Args:
+            path: Log file (defaults to HOT_QUERY_LOG_PATH)
+            max_bytes: Rotate after this many bytes
+            backups: Rotated files to keep (path.1 ... path.N)
+            queue_size: Records buffered before new ones are dropped
+        """
+        self.path = path or config.HOT_QUERY_LOG_PATH
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+
+        output = RotatingFileHandler(
+            self.path,
+            maxBytes=max_bytes or config.HOT_QUERY_LOG_MAX_BYTES,
+            backupCount=config.HOT_QUERY_LOG_BACKUPS if backups is None else backups,
+            encoding="utf-8"
+        )
+        output.setFormatter(_HotQueryFormatter())
+
+        self._handler = DroppingQueueHandler(queue.Queue(maxsize=queue_size or config.HOT_QUERY_LOG_QUEUE_SIZE))
+        self._listener = QueueListener(self._handler.queue, output)
+        self._listener.start()
+        self.recorded = 0
+
+    def record(self, query: str, marks: Optional[int] = None, namespace: Optional[str] = None):
+        """Queue one served query (non-blocking)."""
+        if not query:
+            return
+        # Skip LogRecord.__init__ (caller, thread and process lookups); only
+        # the handler's error path reads these fields
+        record = logging.LogRecord.__new__(logging.LogRecord)
+        record.levelno, record.msg, record.args, record.exc_info = logging.INFO, "hot query", None, None
+        record.hot_query = (time.time(), query, marks, namespace)
+        self._handler.enqueue(record)
+        self.recorded += 1
+
+    def close(self):
+        """Flush queued records and stop the writer thread."""
+        self._listener.stop()
+        for handler in self._listener.handlers:
+            handler.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "recorded": self.recorded,
+            "queued": self._handler.queue.qsize(),
+            "dropped": self._handler.dropped
+        }
+
+
+def read_hot_queries(path: str, limit: int) -> List[Dict[str, Any]]:
+    """
+    Most frequent queries in a hot query log and its rotated files.
+
+    Entries are grouped by (normalized query, marks, namespace). Each keeps
+    the most recently seen raw spelling, since caches are keyed on raw text.
+
+    Returns:
+        Up to `limit` {"query", "marks", "namespace", "count"} dicts, hottest first
+    """
+    counts: Counter = Counter()
+    latest: Dict[Tuple[str, Any, Any], Tuple[float, str]] = {}
+
+    files = [f"{path}.{i}" for i in range(config.HOT_QUERY_LOG_BACKUPS, 0, -1)] + [path]
+    for file_path in files:
+        if not os.path.exists(file_path):
+            continue
+        with open(file_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    key = (entry["normalized"], entry.get("marks"), entry.get("namespace"))
+                    ts, query = entry["ts"], entry["query"]
+                except (ValueError, KeyError, TypeError):
+                    continue
+                if not key[0]:
+                    continue
+                counts[key] += 1
+                if key not in latest or ts >= latest[key][0]:
+                    latest[key] = (ts, query)
+
+    return [
+        {"query": latest[key][1], "marks": key[1], "namespace": key[2], "count": count}
+        for key, count in counts.most_common(limit)
+    ]
+
+
+class CacheWarmer:
+    """
+    Background cache warm-up from the hot query log.
+    """
+
+    def __init__(
+        self,
+        rag_pipeline,
+        path: str = None,
+        top_n: int = None,
+        budget_seconds: float = None,
+        batch_size: int = None,
+        retrieve: bool = None
+    ):
+        """
+        Args:
+            rag_pipeline: Pipeline whose caches are warmed
+            path: Hot query log (defaults to HOT_QUERY_LOG_PATH)
+            top_n: Queries to warm (capped at the embedding cache size)
+            budget_seconds: Stop warming after this long
+            batch_size: Queries per embed_batch call
+            retrieve: Also run retrieval for each warmed query
+        """
+        self.rag_pipeline = rag_pipeline
+        self.path = path or config.HOT_QUERY_LOG_PATH
+        self.top_n = min(top_n or config.WARMUP_TOP_N, config.CACHE_MAX_SIZE)
+        self.budget_seconds = config.WARMUP_BUDGET_SECONDS if budget_seconds is None else budget_seconds
+        self.batch_size = batch_size or config.WARMUP_BATCH_SIZE
+        self.retrieve = config.WARMUP_RETRIEVE if retrieve is None else retrieve
+
+        self.ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats: Dict[str, Any] = {
+            "candidates": 0, "embedded": 0, "retrieved": 0,
+            "elapsed_ms": None, "budget_exhausted": False, "error": None
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name="cache-warmer", daemon=True)
+        self._thread.start()
+
+    def run(self):
+        """Warm the caches; sets `ready` when done, out of budget or failed."""
+        start = time.perf_counter()
+        deadline = start + self.budget_seconds
+
+        try:
+            entries = read_hot_queries(self.path, self.top_n) if os.path.exists(self.path) else []
+            self._stats["candidates"] = len(entries)
+
+            queries = list(dict.fromkeys(entry["query"] for entry in entries))
+            for i in range(0, len(queries), self.batch_size):
+                if time.perf_counter() >= deadline:
+                    self._stats["budget_exhausted"] = True
+                    break
+                embedded = self.rag_pipeline.embedding_service.prefill_cache(queries[i:i + self.batch_size])
+                self._stats["embedded"] += embedded
+
+            if self.retrieve and not self._stats["budget_exhausted"]:
+                for entry in entries:
+                    if time.perf_counter() >= deadline:
+                        self._stats["budget_exhausted"] = True
+                        break
+                    self.rag_pipeline.retrieve(entry["query"], namespace=entry["namespace"])
+                    self._stats["retrieved"] += 1
+
+        except Exception as e:
+            self._stats["error"] = str(e)
+            logger.warning(f"Cache warm-up failed: {str(e)}")
+
+        finally:
+            self._stats["elapsed_ms"] = (time.perf_counter() - start) * 1000
+            self.ready.set()
+            logger.info(
+                "Cache warm-up: %d candidates, %d embedded, %d retrieved in %.0f ms",
+                self._stats["candidates"], self._stats["embedded"],
+                self._stats["retrieved"], self._stats["elapsed_ms"]
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        return {"ready": self.ready.is_set(), **self._stats}
@@ -0,0 +1,229 @@
+"""
+Incremental re-indexing driven by chunk content hashes.
+
+A local manifest records, per namespace and document, the content hash of
+every chunk that was upserted. Re-indexing a directory only reads documents
+whose file fingerprint changed, re-embeds chunks that are new, deletes
+vectors for chunks that disappeared, and leaves everything else alone, so
+the cost scales with the size of the edit rather than the corpus.
+
+Usage:
+    python incremental_index.py --source notes/cs101 --namespace cs101
+    python incremental_index.py --source notes/cs101 --namespace cs101 --dry-run
+"""
+
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from config import config
+from ingestion import Chunk, chunk_document, content_hash, iter_source_documents, upsert_batches
+from invalidation import invalidate_namespace, namespace_key
+
+logger = logging.getLogger(__name__)
+
+
+class IndexManifest:
+    """
+    Chunk content hashes per document for one namespace.
+
+    Layout:
+        {"namespace": ..., "documents": {doc_key: {"fingerprint": ..., "chunks": {chunk_id: sha1}}}}
+    """
+
+    def __init__(self, path: str, namespace: Optional[str], documents: Dict[str, Dict[str, Any]] = None):
+        self.path = path
+        self.namespace = namespace
+        self.documents = documents or {}
+
+    @classmethod
+    def load(cls, namespace: Optional[str] = None, path: str = None) -> "IndexManifest":
+        path = path or os.path.join(config.INDEX_MANIFEST_DIR, f"{namespace_key(namespace)}.json")
+        documents = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                documents = json.load(f).get("documents", {})
+        return cls(path, namespace, documents)
+
+    def set_document(self, doc_key: str, fingerprint: str, chunks: Dict[str, str]):
+        self.documents[doc_key] = {"fingerprint": fingerprint, "chunks": chunks}
+
+    def remove_document(self, doc_key: str):
+        self.documents.pop(doc_key, None)
+
+    def save(self):
+        """Write the manifest atomically."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"namespace": self.namespace, "documents": self.documents}, f)
+        os.replace(tmp_path, self.path)
+
+
+@dataclass
+class ReindexPlan:
+    """Minimal set of changes to bring a namespace in line with a directory."""
+    upserts: List[Chunk] = field(default_factory=list)
+    deletes: List[str] = field(default_factory=list)
+    changed_documents: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    removed_documents: List[str] = field(default_factory=list)
+    unchanged_documents: int = 0
+
+    @property
+    def is_empty(self) -> bool:
+        return not (self.upserts or self.deletes or self.changed_documents or self.removed_documents)
+
+    def summary(self) -> dict:
+        return {
+            "upserts": len(self.upserts),
+            "deletes": len(self.deletes),
+            "changed_documents": len(self.changed_documents),
+            "removed_documents": len(self.removed_documents),
+            "unchanged_documents": self.unchanged_documents
+        }
+
+
+class IncrementalIndexer:
+    """
+    Applies content-hash diffs between a directory and a namespace.
+    """
+
+    def __init__(
+        self,
+        retrieval_service=None,
+        embedding_service=None,
+        namespace: Optional[str] = None,
+        manifest_path: str = None,
+        chunk_size: int = None,
+        chunk_overlap: int = None
+    ):
+        if retrieval_service is None:
+            from retrieval_service import RetrievalService
+            retrieval_service = RetrievalService()
+
+        self.retrieval_service = retrieval_service
+        self._embedding_service = embedding_service
+        self.namespace = namespace
+        self.manifest = IndexManifest.load(namespace, manifest_path)
+        self.chunk_size = chunk_size or config.INGEST_CHUNK_SIZE
+        self.chunk_overlap = config.INGEST_CHUNK_OVERLAP if chunk_overlap is None else chunk_overlap
+
+    @property
+    def embedding_service(self):
+        """Loaded on first use; a no-op re-index never loads the model."""
+        if self._embedding_service is None:
+            from embedding_service import EmbeddingService
+            self._embedding_service = EmbeddingService(enable_cache=False)
+        return self._embedding_service
+
+    def plan(self, directory: str) -> ReindexPlan:
+        """Diff a directory against the manifest."""
+        plan = ReindexPlan()
+        seen = set()
+
+        for doc in iter_source_documents(directory):
+            seen.add(doc.key)
+            previous = self.manifest.documents.get(doc.key)
+            if previous and previous["fingerprint"] == doc.fingerprint:
+                plan.unchanged_documents += 1
+                continue
+
+            old_chunks = previous["chunks"] if previous else {}
+            new_chunks = chunk_document(doc, self.chunk_size, self.chunk_overlap)
+            new_hashes = {chunk.id: content_hash(chunk.metadata["text"]) for chunk in new_chunks}
+
+            plan.upserts.extend(
+                chunk for chunk in new_chunks
+                if old_chunks.get(chunk.id) != new_hashes[chunk.id]
+            )
+            plan.deletes.extend(chunk_id for chunk_id in old_chunks if chunk_id not in new_hashes)
+            plan.changed_documents[doc.key] = {"fingerprint": doc.fingerprint, "chunks": new_hashes}
+
+        for doc_key, entry in self.manifest.documents.items():
+            if doc_key not in seen:
+                plan.removed_documents.append(doc_key)
+                plan.deletes.extend(entry["chunks"])
+
+        return plan
+
+    def apply(self, plan: ReindexPlan, update_local_indexes: bool = True) -> dict:
+        """
+        Execute a plan: upsert new chunks first, then delete stale ones,
+        then persist the manifest and invalidate namespace caches.
+        """
+        start = time.perf_counter()
+
+        batch_size = config.INGEST_EMBED_BATCH_SIZE
+        for i in range(0, len(plan.upserts), batch_size):
+            chunks = plan.upserts[i:i + batch_size]
+            vectors = self.embedding_service.embed_batch([chunk.metadata["text"] for chunk in chunks])
+            for batch in upsert_batches(chunks, vectors):
+                self.retrieval_service.upsert(
+                    [
+                        {"id": chunk.id, "values": values, "metadata": chunk.metadata}
+                        for chunk, values in batch
+                    ],
+                    namespace=self.namespace
+                )
+
+        if plan.deletes:
+            self.retrieval_service.delete(plan.deletes, namespace=self.namespace)
+
+        for doc_key, entry in plan.changed_documents.items():
+            self.manifest.set_document(doc_key, entry["fingerprint"], entry["chunks"])
+        for doc_key in plan.removed_documents:
+            self.manifest.remove_document(doc_key)
+        self.manifest.save()
+
+        if update_local_indexes and not plan.is_empty:
+            self._update_local_indexes(plan)
+
+        if not plan.is_empty:
+            invalidate_namespace(self.namespace)
+
+        summary = plan.summary()
+        summary["seconds"] = round(time.perf_counter() - start, 2)
+        logger.info(f"Incremental re-index of namespace={self.namespace}: {summary}")
+        return summary
+
+    def _update_local_indexes(self, plan: ReindexPlan):
+        from chunk_store import ChunkStoreManager
+        from lexical_index import LexicalIndexManager
+
+        lexical = LexicalIndexManager().get(self.namespace)
+        lexical.delete_documents(plan.deletes)
+        lexical.add_documents((chunk.id, chunk.metadata["text"]) for chunk in plan.upserts)
+        lexical.save()
+
+        ChunkStoreManager().get(self.namespace).update(
+            upserts={chunk.id: chunk.metadata for chunk in plan.upserts},
+            deletes=plan.deletes
+        )
+
+    def run(self, directory: str, dry_run: bool = False) -> dict:
+        """Plan and (unless dry_run) apply a re-index."""
+        plan = self.plan(directory)
+        if dry_run:
+            return plan.summary()
+        return self.apply(plan)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(
+        level=config.LOG_LEVEL,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    parser = argparse.ArgumentParser(description="Incrementally re-index a namespace")
+    parser.add_argument("--source", required=True, help="Directory of .txt/.md/.pdf files")
+    parser.add_argument("--namespace", default=config.PINECONE_NAMESPACE)
+    parser.add_argument("--dry-run", action="store_true", help="Only print the planned changes")
+    args = parser.parse_args()
+
+    indexer = IncrementalIndexer(namespace=args.namespace)
+    print(json.dumps(indexer.run(args.source, dry_run=args.dry_run), indent=2))
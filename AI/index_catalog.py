@@ -0,0 +1,192 @@
+"""
+Cached Pinecone index stats and namespace catalog.
+
+describe_index_stats is a network round trip, so /stats should not call it
+on every hit. IndexCatalog keeps the last result and refreshes it on a
+background thread every INDEX_STATS_REFRESH_SECONDS. The same snapshot is
+a catalog of namespaces and their vector counts. Requests naming a
+namespace that is missing or empty can then be rejected locally, without
+querying Pinecone for an empty result.
+
+The catalog can lag behind the index by up to one refresh interval. Before
+rejecting a namespace it does not know, it refreshes once, at most every
+INDEX_CATALOG_RECHECK_SECONDS. Ingestion invalidating a namespace in this
+process also forces the next lookup to refresh.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+
+class NamespaceNotFound(ValueError):
+    """The namespace does not exist in the index, or holds no vectors."""
+
+
+def _vector_count(summary: Any) -> int:
+    # Pinecone returns NamespaceSummary objects; FakeIndex returns dicts
+    if isinstance(summary, dict):
+        return int(summary.get("vector_count") or 0)
+    return int(getattr(summary, "vector_count", 0) or 0)
+
+
+class IndexCatalog:
+    """
+    Index stats snapshot refreshed in the background.
+    """
+
+    def __init__(self, index, refresh_seconds: float = None, recheck_seconds: float = None):
+        """
+        Args:
+            index: Pinecone index (or anything with describe_index_stats)
+            refresh_seconds: Background refresh interval (defaults to config)
+            recheck_seconds: Minimum gap between on-demand refreshes for unknown namespaces
+        """
+        self.index = index
+        self.refresh_seconds = refresh_seconds or config.INDEX_STATS_REFRESH_SECONDS
+        self.recheck_seconds = config.INDEX_CATALOG_RECHECK_SECONDS if recheck_seconds is None else recheck_seconds
+
+        self._snapshot: Optional[Dict[str, Any]] = None
+        self._refreshed_at = 0.0
+        self._stale = False
+        self._refresh_lock = threading.Lock()
+        self._check_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {"refreshes": 0, "refresh_errors": 0, "rejected": 0, "unchecked": 0, "last_error": None}
+
+    def start(self):
+        """Load the catalog and keep it fresh on a daemon thread."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._refresh_loop, name="index-catalog", daemon=True)
+        self._thread.start()
+        logger.info("Refreshing index stats every %.0fs", self.refresh_seconds)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _refresh_loop(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception:
+                pass  # already logged and counted; keep serving the last snapshot
+            if self._stop.wait(self.refresh_seconds):
+                return
+
+    def refresh(self) -> Dict[str, Any]:
+        """Fetch index stats from Pinecone now and replace the snapshot."""
+        with self._refresh_lock:
+            try:
+                stats = self.index.describe_index_stats()
+            except Exception as e:
+                self._stats["refresh_errors"] += 1
+                self._stats["last_error"] = str(e)
+                logger.warning("Index stats refresh failed: %s", e)
+                raise
+
+            self._snapshot = {
+                "dimension": stats.get("dimension"),
+                "total_vector_count": stats.get("total_vector_count"),
+                "namespaces": {
+                    name: {"vector_count": _vector_count(summary)}
+                    for name, summary in (stats.get("namespaces") or {}).items()
+                }
+            }
+            self._refreshed_at = time.time()
+            self._stale = False
+            self._stats["refreshes"] += 1
+            return self._snapshot
+
+    def mark_stale(self, namespace: Optional[str] = None):
+        """Refresh on the next lookup (usable as an invalidation hook)."""
+        self._stale = True
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Cached index stats, loading them first if needed.
+
+        Falls back to the last good snapshot when a forced refresh fails.
+        """
+        if self._snapshot is None or self._stale:
+            try:
+                return self.refresh()
+            except Exception:
+                if self._snapshot is None:
+                    raise
+        return self._snapshot
+
+    @property
+    def age_seconds(self) -> Optional[float]:
+        return time.time() - self._refreshed_at if self._snapshot is not None else None
+
+    def namespaces(self, non_empty: bool = True) -> List[str]:
+        """Namespace names in the index, sorted."""
+        return sorted(
+            name for name, summary in self.snapshot()["namespaces"].items()
+            if summary["vector_count"] > 0 or not non_empty
+        )
+
+    def vector_count(self, namespace: str) -> Optional[int]:
+        """Vectors in a namespace, or None if the catalog does not list it."""
+        summary = self.snapshot()["namespaces"].get(namespace)
+        return summary["vector_count"] if summary is not None else None
+
+    def _known(self, namespace: str) -> bool:
+        summary = self._snapshot["namespaces"].get(namespace) if self._snapshot is not None else None
+        return summary is not None and summary["vector_count"] > 0
+
+    def check_namespace(self, namespace: str):
+        """
+        Raise NamespaceNotFound if the namespace is unknown or empty.
+
+        An unknown namespace triggers one refresh (rate-limited) before it
+        is rejected, so a namespace created since the last refresh is not
+        refused. Concurrent callers share that refresh. If Pinecone cannot
+        be reached to load the catalog at all, nothing is rejected.
+        """
+        if self._snapshot is not None and not self._stale and self._known(namespace):
+            return
+
+        seen = self._refreshed_at
+        with self._check_lock:
+            # Callers that queued behind a refresh reuse its result
+            if self._refreshed_at == seen and (
+                self._snapshot is None or self._stale
+                or time.time() - self._refreshed_at >= self.recheck_seconds
+            ):
+                try:
+                    self.refresh()
+                except Exception:
+                    # refresh() logged and counted the failure
+                    if self._snapshot is None:
+                        self._stats["unchecked"] += 1
+                        logger.warning("Index catalog unavailable; not validating namespace '%s'", namespace)
+                        return
+
+            summary = self._snapshot["namespaces"].get(namespace)
+            count = summary["vector_count"] if summary is not None else None
+            if count is None:
+                self._stats["rejected"] += 1
+                raise NamespaceNotFound(f"Unknown namespace '{namespace}'")
+            if count == 0:
+                self._stats["rejected"] += 1
+                raise NamespaceNotFound(f"Namespace '{namespace}' is empty")
+
+    def stats(self) -> Dict[str, Any]:
+        age = self.age_seconds
+        return {
+            "refresh_seconds": self.refresh_seconds,
+            "age_seconds": round(age, 1) if age is not None else None,
+            **self._stats
+        }
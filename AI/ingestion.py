@@ -0,0 +1,613 @@
+"""
+Bulk document ingestion: chunk, embed in parallel, upsert in batches.
+
+Streams documents from a directory, splits them into overlapping chunks,
+embeds the chunks in large batches across a process pool and upserts the
+vectors to Pinecone from a thread pool. In-flight work is bounded on both
+pools (backpressure), and completed documents are checkpointed so an
+interrupted run resumes where it stopped. The checkpoint keeps each
+document's chunk ids. A resumed run re-chunks (without re-embedding)
+documents that were upserted but never reached the local indexes, so the
+BM25 index, chunk store and manifest catch up.
+
+Usage:
+    python ingestion.py --source notes/cs101 --namespace cs101
+    python ingestion.py --source notes/cs101 --namespace cs101 --fresh
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+import zlib
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from config import config
+from invalidation import invalidate_namespace
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTENSIONS = (".txt", ".md", ".pdf")
+
+
+@dataclass
+class SourceDocument:
+    """A file to ingest."""
+    key: str
+    path: str
+    fingerprint: str
+
+
+@dataclass
+class Chunk:
+    """A chunk of a document, ready to embed."""
+    id: str
+    doc_key: str
+    metadata: Dict[str, Any]
+
+
+@dataclass
+class IngestionStats:
+    """Counters for one ingestion run."""
+    documents: int = 0
+    skipped_documents: int = 0
+    chunks: int = 0
+    upserted: int = 0
+    seconds: float = 0.0
+    failed_documents: List[str] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        return {
+            "documents": self.documents,
+            "skipped_documents": self.skipped_documents,
+            "chunks": self.chunks,
+            "upserted": self.upserted,
+            "seconds": round(self.seconds, 2),
+            "chunks_per_second": round(self.upserted / self.seconds, 1) if self.seconds else 0.0,
+            "failed_documents": self.failed_documents
+        }
+
+
+def iter_source_documents(directory: str) -> Iterator[SourceDocument]:
+    """Walk a directory (sorted, for stable resume) yielding supported files."""
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if not name.lower().endswith(SUPPORTED_EXTENSIONS):
+                continue
+            path = os.path.join(root, name)
+            stat = os.stat(path)
+            yield SourceDocument(
+                key=os.path.relpath(path, directory).replace(os.sep, "/"),
+                path=path,
+                fingerprint=f"{stat.st_size}:{stat.st_mtime_ns}"
+            )
+
+
+def read_document(path: str) -> str:
+    """Extract plain text from a supported file."""
+    if path.lower().endswith(".pdf"):
+        from pypdf import PdfReader
+
+        reader = PdfReader(path)
+        return "\n\n".join(page.extract_text() or "" for page in reader.pages)
+
+    with open(path, encoding="utf-8", errors="replace") as f:
+        return f.read()
+
+
+def _split_window(text: str, chunk_size: int, overlap: int) -> List[str]:
+    """
+    Split one long paragraph into overlapping character windows.
+    Window ends snap back to the last whitespace so words are not cut.
+    """
+    pieces = []
+    start = 0
+
+    while start < len(text):
+        end = min(start + chunk_size, len(text))
+        if end < len(text):
+            split = text.rfind(" ", start + overlap + 1, end)
+            if split != -1:
+                end = split
+
+        piece = text[start:end].strip()
+        if piece:
+            pieces.append(piece)
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+
+    return pieces
+
+
+def _overlap_tail(text: str, overlap: int) -> str:
+    """Last ~overlap characters of text, starting on a word boundary."""
+    if overlap <= 0 or len(text) <= overlap:
+        return ""
+    tail = text[-overlap:]
+    space = tail.find(" ")
+    return tail[space + 1:] if space != -1 else tail
+
+
+def chunk_text(text: str, chunk_size: int = None, overlap: int = None) -> List[str]:
+    """
+    Split text into chunks of up to ~chunk_size characters.
+
+    Paragraphs are packed into chunks and a chunk may only end on a
+    "boundary" paragraph (chosen by content hash) once it is half full.
+    Boundaries therefore depend on local content, so an edit only changes
+    the chunks around it instead of shifting every later chunk; this keeps
+    incremental re-indexing proportional to the edit. Consecutive chunks
+    share an `overlap`-character tail.
+    """
+    chunk_size = chunk_size or config.INGEST_CHUNK_SIZE
+    overlap = config.INGEST_CHUNK_OVERLAP if overlap is None else overlap
+    if overlap >= chunk_size:
+        raise ValueError("chunk overlap must be smaller than chunk size")
+
+    pieces = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = " ".join(paragraph.split())
+        if paragraph:
+            pieces.extend(_split_window(paragraph, chunk_size, overlap))
+
+    chunks = []
+    current: List[str] = []
+    current_len = 0
+
+    def close():
+        nonlocal current, current_len
+        chunks.append(" ".join(current))
+        current, current_len = [], 0
+
+    for piece in pieces:
+        if current and current_len + len(piece) + 1 > chunk_size:
+            close()
+        if not current and chunks:
+            tail = _overlap_tail(chunks[-1], overlap)
+            if tail and len(tail) + len(piece) + 1 <= chunk_size:
+                current.append(tail)
+                current_len = len(tail)
+        current.append(piece)
+        current_len += len(piece) + 1
+        if current_len >= chunk_size // 2 and zlib.crc32(piece.encode()) % 3 == 0:
+            close()
+
+    if current:
+        close()
+
+    return chunks
+
+
+def content_hash(text: str) -> str:
+    """SHA-1 of a chunk's text."""
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def chunk_id(doc_key: str, text: str) -> str:
+    """
+    Stable ASCII vector id for a document chunk.
+    Content-addressed, so unchanged chunks keep their id across edits.
+    """
+    digest = hashlib.sha1(doc_key.encode()).hexdigest()[:16]
+    return f"{digest}-{content_hash(text)[:16]}"
+
+
+class Checkpoint:
+    """
+    Records documents whose vectors were fully upserted, with their chunk ids.
+    Written atomically after every completed document.
+    """
+
+    def __init__(self, path: str, namespace: Optional[str]):
+        self.path = path
+        self.namespace = namespace
+        self.documents: Dict[str, str] = {}
+        self.chunks: Dict[str, List[str]] = {}
+
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            if data.get("namespace") == namespace:
+                self.documents = data.get("documents", {})
+                self.chunks = data.get("chunks", {})
+            else:
+                logger.warning(f"Checkpoint {path} is for another namespace, ignoring it")
+
+    def is_done(self, doc: SourceDocument) -> bool:
+        return self.documents.get(doc.key) == doc.fingerprint
+
+    def mark_done(self, doc: SourceDocument, chunk_ids: List[str]):
+        self.documents[doc.key] = doc.fingerprint
+        self.chunks[doc.key] = chunk_ids
+        self.save()
+
+    def forget(self, doc_key: str):
+        self.documents.pop(doc_key, None)
+        self.chunks.pop(doc_key, None)
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"namespace": self.namespace, "documents": self.documents, "chunks": self.chunks}, f)
+        os.replace(tmp_path, self.path)
+
+
+def chunk_document(
+    doc: SourceDocument,
+    chunk_size: int = None,
+    overlap: int = None
+) -> List[Chunk]:
+    """Read and chunk one document."""
+    chunks = {}
+    for text in chunk_text(read_document(doc.path), chunk_size, overlap):
+        doc_chunk_id = chunk_id(doc.key, text)
+        # Identical repeated chunks collapse onto one vector
+        if doc_chunk_id not in chunks:
+            chunks[doc_chunk_id] = Chunk(
+                id=doc_chunk_id,
+                doc_key=doc.key,
+                metadata={"text": text, "source": doc.key}
+            )
+    return list(chunks.values())
+
+
+def upsert_batches(
+    chunks: List[Chunk],
+    vectors: np.ndarray,
+    batch_size: int = None
+) -> Iterator[List[Tuple[Chunk, np.ndarray]]]:
+    """Split into batches bounded by vector count and estimated request bytes."""
+    batch_size = batch_size or config.INGEST_UPSERT_BATCH_SIZE
+    batch: List[Tuple[Chunk, np.ndarray]] = []
+    batch_bytes = 0
+
+    for chunk, values in zip(chunks, vectors):
+        # ~12 bytes per serialized float plus metadata
+        item_bytes = len(values) * 12 + len(chunk.metadata["text"]) + 128
+        if batch and (
+            len(batch) >= batch_size
+            or batch_bytes + item_bytes > config.INGEST_UPSERT_MAX_BYTES
+        ):
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.append((chunk, values))
+        batch_bytes += item_bytes
+
+    if batch:
+        yield batch
+
+
+# Per-process embedding service for pool workers
+_worker_embedding_service = None
+
+
+def _init_embed_worker(model_name: str, device: str, threads: int):
+    """Load the embedding model once per worker process."""
+    global _worker_embedding_service
+
+    import torch
+    torch.set_num_threads(threads)
+
+    from embedding_service import EmbeddingService
+    _worker_embedding_service = EmbeddingService(
+        model_name=model_name,
+        device=device,
+        enable_cache=False,
+        pool_workers=0,
+        server_socket=""
+    )
+
+
+def _embed_texts(texts: List[str]) -> np.ndarray:
+    return _worker_embedding_service.embed_batch(texts)
+
+
+class IngestionPipeline:
+    """
+    Streams a directory into a Pinecone namespace.
+    """
+
+    def __init__(
+        self,
+        retrieval_service=None,
+        namespace: Optional[str] = None,
+        chunk_size: int = None,
+        chunk_overlap: int = None,
+        embed_workers: int = None,
+        embed_batch_size: int = None,
+        upsert_workers: int = None,
+        upsert_batch_size: int = None,
+        max_in_flight: int = None,
+        checkpoint_path: str = None
+    ):
+        if retrieval_service is None:
+            from retrieval_service import RetrievalService
+            retrieval_service = RetrievalService()
+
+        self.retrieval_service = retrieval_service
+        self.namespace = namespace
+        self.chunk_size = chunk_size or config.INGEST_CHUNK_SIZE
+        self.chunk_overlap = config.INGEST_CHUNK_OVERLAP if chunk_overlap is None else chunk_overlap
+        self.embed_workers = embed_workers or config.INGEST_EMBED_WORKERS
+        self.embed_batch_size = embed_batch_size or config.INGEST_EMBED_BATCH_SIZE
+        self.upsert_workers = upsert_workers or config.INGEST_UPSERT_WORKERS
+        self.upsert_batch_size = upsert_batch_size or config.INGEST_UPSERT_BATCH_SIZE
+        self.max_in_flight = max_in_flight or config.INGEST_MAX_IN_FLIGHT
+        self.checkpoint = Checkpoint(
+            checkpoint_path or os.path.join(config.INGEST_CHECKPOINT_DIR, f"{namespace or 'default'}.json"),
+            namespace
+        )
+
+        # Chunk metadata upserted during the run, for local index updates
+        self.ingested: Dict[str, Dict[str, Any]] = {}
+        # Fully upserted documents: key -> (fingerprint, chunk ids)
+        self.completed: Dict[str, Tuple[str, List[str]]] = {}
+
+    def run(self, directory: str) -> IngestionStats:
+        """Ingest every supported file under a directory."""
+        stats = IngestionStats()
+        start = time.perf_counter()
+
+        threads_per_worker = max(1, (os.cpu_count() or 1) // self.embed_workers)
+        logger.info(
+            f"Ingesting {directory} into namespace={self.namespace}: "
+            f"{self.embed_workers} embed workers x {threads_per_worker} threads, "
+            f"{self.upsert_workers} upsert workers"
+        )
+
+        from incremental_index import IndexManifest
+        manifest = IndexManifest.load(self.namespace)
+
+        documents: Dict[str, SourceDocument] = {}
+        remaining: Dict[str, int] = {}
+        embed_futures: Deque[Tuple[Future, List[Chunk]]] = deque()
+        upsert_futures: Dict[Future, List[Chunk]] = {}
+
+        def complete_upserts(block: bool):
+            if not upsert_futures:
+                return
+            done, _ = wait(list(upsert_futures), timeout=None if block else 0, return_when=FIRST_COMPLETED)
+            for future in done:
+                chunks = upsert_futures.pop(future)
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(f"Upsert failed for {len(chunks)} chunks: {str(e)}")
+                    fail_chunks(chunks)
+                    continue
+
+                stats.upserted += len(chunks)
+                for chunk in chunks:
+                    self.ingested[chunk.id] = chunk.metadata
+                    if chunk.doc_key not in remaining:
+                        continue
+                    remaining[chunk.doc_key] -= 1
+                    if remaining[chunk.doc_key] == 0:
+                        del remaining[chunk.doc_key]
+                        self.checkpoint.mark_done(documents.pop(chunk.doc_key), self.completed[chunk.doc_key][1])
+
+        def fail_chunks(chunks: List[Chunk]):
+            for chunk in chunks:
+                if chunk.doc_key not in stats.failed_documents:
+                    stats.failed_documents.append(chunk.doc_key)
+                remaining.pop(chunk.doc_key, None)
+                documents.pop(chunk.doc_key, None)
+
+        def complete_oldest_embed(upsert_pool: ThreadPoolExecutor):
+            future, chunks = embed_futures.popleft()
+            try:
+                vectors = future.result()
+            except Exception as e:
+                # One failed batch (e.g. a crashed embed worker) only fails its documents
+                logger.error(f"Embedding failed for {len(chunks)} chunks: {str(e)}")
+                fail_chunks(chunks)
+                return
+            for batch in upsert_batches(chunks, vectors, self.upsert_batch_size):
+                # Backpressure: bound queued upserts
+                while len(upsert_futures) >= self.max_in_flight:
+                    complete_upserts(block=True)
+                batch_chunks = [chunk for chunk, _ in batch]
+                payload = [
+                    {"id": chunk.id, "values": values, "metadata": chunk.metadata}
+                    for chunk, values in batch
+                ]
+                upsert_futures[upsert_pool.submit(self._upsert, payload)] = batch_chunks
+            complete_upserts(block=False)
+
+        with ProcessPoolExecutor(
+            max_workers=self.embed_workers,
+            initializer=_init_embed_worker,
+            initargs=(config.EMBEDDING_MODEL_NAME, config.EMBEDDING_DEVICE, threads_per_worker)
+        ) as embed_pool, ThreadPoolExecutor(max_workers=self.upsert_workers) as upsert_pool:
+
+            def submit_embed(chunks: List[Chunk]):
+                # Backpressure: bound queued embedding batches
+                while len(embed_futures) >= self.max_in_flight:
+                    complete_oldest_embed(upsert_pool)
+                texts = [chunk.metadata["text"] for chunk in chunks]
+                try:
+                    embed_futures.append((embed_pool.submit(_embed_texts, texts), chunks))
+                except Exception as e:
+                    # A broken pool refuses new work; fail these documents and keep draining
+                    logger.error(f"Could not submit {len(chunks)} chunks for embedding: {str(e)}")
+                    fail_chunks(chunks)
+
+            pending: List[Chunk] = []
+            for doc in iter_source_documents(directory):
+                if self.checkpoint.is_done(doc):
+                    if self._recover_document(doc, manifest):
+                        stats.skipped_documents += 1
+                        continue
+
+                try:
+                    chunks = self.chunk_document(doc)
+                except Exception as e:
+                    logger.error(f"Failed to read {doc.key}: {str(e)}")
+                    stats.failed_documents.append(doc.key)
+                    continue
+
+                stats.documents += 1
+                stats.chunks += len(chunks)
+                self.completed[doc.key] = (doc.fingerprint, [chunk.id for chunk in chunks])
+                if not chunks:
+                    self.checkpoint.mark_done(doc, [])
+                    continue
+
+                documents[doc.key] = doc
+                remaining[doc.key] = len(chunks)
+                pending.extend(chunks)
+
+                while len(pending) >= self.embed_batch_size:
+                    submit_embed(pending[:self.embed_batch_size])
+                    pending = pending[self.embed_batch_size:]
+
+            if pending:
+                submit_embed(pending)
+            while embed_futures:
+                complete_oldest_embed(upsert_pool)
+            while upsert_futures:
+                complete_upserts(block=True)
+
+        stats.seconds = time.perf_counter() - start
+        logger.info(f"Ingestion finished: {stats.to_dict()}")
+        return stats
+
+    def _recover_document(self, doc: SourceDocument, manifest) -> bool:
+        """
+        Re-queue a checkpointed document for the local indexes if needed.
+
+        A document upserted by an interrupted run is in the checkpoint but
+        not in the manifest. Its chunks are re-read (not re-embedded) so
+        update_local_indexes picks them up.
+
+        Returns:
+            False if the document must be ingested again
+        """
+        previous = manifest.documents.get(doc.key)
+        if previous and previous["fingerprint"] == doc.fingerprint:
+            return True
+
+        try:
+            chunks = self.chunk_document(doc)
+        except Exception as e:
+            logger.warning(f"Failed to re-read checkpointed {doc.key}: {str(e)}")
+            chunks = None
+
+        chunk_ids = [chunk.id for chunk in chunks] if chunks is not None else None
+        if chunk_ids is None or chunk_ids != self.checkpoint.chunks.get(doc.key):
+            # Older checkpoint or different chunking: the vectors on record do not match
+            self.checkpoint.forget(doc.key)
+            return False
+
+        for chunk in chunks:
+            self.ingested[chunk.id] = chunk.metadata
+        self.completed[doc.key] = (doc.fingerprint, chunk_ids)
+        return True
+
+    def chunk_document(self, doc: SourceDocument) -> List[Chunk]:
+        """Read and chunk one document."""
+        return chunk_document(doc, self.chunk_size, self.chunk_overlap)
+
+    def _upsert(self, vectors: List[Dict[str, Any]]):
+        self.retrieval_service.upsert(vectors, namespace=self.namespace)
+
+    def update_local_indexes(self):
+        """
+        Push this run's chunks into the local BM25 index, chunk store and manifest.
+
+        Chunk ids are content-addressed, so a re-ingested document that was
+        edited gets new ids. Ids its previous manifest entry lists but this
+        run did not produce are deleted from Pinecone and the local indexes
+        before the manifest entry is replaced.
+        """
+        from chunk_store import ChunkStoreManager
+        from incremental_index import IndexManifest
+        from lexical_index import LexicalIndexManager
+
+        manifest = IndexManifest.load(self.namespace)
+        finished = {
+            doc_key: (fingerprint, chunk_ids)
+            for doc_key, (fingerprint, chunk_ids) in self.completed.items()
+            if doc_key in self.checkpoint.documents
+        }
+        stale: List[str] = []
+        for doc_key, (_, chunk_ids) in finished.items():
+            previous = manifest.documents.get(doc_key)
+            if previous:
+                current = set(chunk_ids)
+                stale.extend(old_id for old_id in previous["chunks"] if old_id not in current)
+
+        if not (self.ingested or stale):
+            return
+
+        if stale:
+            self.retrieval_service.delete(stale, namespace=self.namespace)
+
+        lexical = LexicalIndexManager().get(self.namespace)
+        lexical.delete_documents(stale)
+        lexical.add_documents((doc_id, metadata["text"]) for doc_id, metadata in self.ingested.items())
+        lexical.save()
+
+        ChunkStoreManager().get(self.namespace).update(upserts=self.ingested, deletes=stale)
+
+        # Record chunk hashes so later runs can re-index incrementally
+        for doc_key, (fingerprint, chunk_ids) in finished.items():
+            manifest.set_document(doc_key, fingerprint, {
+                doc_chunk_id: content_hash(self.ingested[doc_chunk_id]["text"])
+                for doc_chunk_id in chunk_ids
+                if doc_chunk_id in self.ingested
+            })
+        manifest.save()
+
+        invalidate_namespace(self.namespace)
+        logger.info(f"Updated local indexes with {len(self.ingested)} chunks, removed {len(stale)} stale chunks")
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(
+        level=config.LOG_LEVEL,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    parser = argparse.ArgumentParser(description="Bulk ingest documents into Pinecone")
+    parser.add_argument("--source", required=True, help="Directory of .txt/.md/.pdf files")
+    parser.add_argument("--namespace", default=config.PINECONE_NAMESPACE)
+    parser.add_argument("--chunk-size", type=int, default=config.INGEST_CHUNK_SIZE)
+    parser.add_argument("--chunk-overlap", type=int, default=config.INGEST_CHUNK_OVERLAP)
+    parser.add_argument("--embed-workers", type=int, default=config.INGEST_EMBED_WORKERS)
+    parser.add_argument("--upsert-workers", type=int, default=config.INGEST_UPSERT_WORKERS)
+    parser.add_argument("--checkpoint", default=None, help="Checkpoint file path")
+    parser.add_argument("--fresh", action="store_true", help="Ignore an existing checkpoint")
+    parser.add_argument("--skip-local-indexes", action="store_true", help="Do not update the BM25 index / chunk store / manifest")
+    args = parser.parse_args()
+
+    pipeline = IngestionPipeline(
+        namespace=args.namespace,
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+        embed_workers=args.embed_workers,
+        upsert_workers=args.upsert_workers,
+        checkpoint_path=args.checkpoint
+    )
+    if args.fresh:
+        pipeline.checkpoint.documents = {}
+        pipeline.checkpoint.chunks = {}
+
+    result = pipeline.run(args.source)
+    if not args.skip_local_indexes:
+        pipeline.update_local_indexes()
+
+    print(json.dumps(result.to_dict(), indent=2))
@@ -0,0 +1,92 @@
+"""
+Per-namespace cache invalidation.
+
+Re-indexing runs out of process (CLI), so API workers learn about changed
+namespaces through a generation file per namespace. Anything caching
+namespace data compares the generation it loaded with the current one
+(one os.stat) and reloads when it moved. In-process hooks run immediately.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from typing import Callable, List, Optional
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_NAMESPACE_KEY = "__default__"
+
+# Names used verbatim as file and directory names; anything else is hashed
+_SAFE_NAMESPACE = re.compile(r"[A-Za-z0-9][A-Za-z0-9_.-]{0,127}")
+
+_hooks: List[Callable[[Optional[str]], None]] = []
+_hooks_lock = threading.Lock()
+
+
+def resolve_namespace(namespace: Optional[str]) -> Optional[str]:
+    """
+    Namespace a request or CLI run without one uses: PINECONE_NAMESPACE if
+    set, else Pinecone's default namespace (None).
+    """
+    return namespace or config.PINECONE_NAMESPACE or None
+
+
+def namespace_key(namespace: Optional[str]) -> str:
+    """
+    Filesystem-safe key for a namespace (None resolves to the default namespace).
+
+    Plain names ("os", "dbms-2024") are used as is. Any other Pinecone
+    namespace (spaces, "/", "..", non-ASCII, very long) maps to "~" plus
+    its SHA-1, which is a single path component and cannot collide with a
+    plain name.
+    """
+    namespace = resolve_namespace(namespace)
+    if not namespace:
+        return DEFAULT_NAMESPACE_KEY
+    if _SAFE_NAMESPACE.fullmatch(namespace):
+        return namespace
+    return "~" + hashlib.sha1(namespace.encode("utf-8")).hexdigest()
+
+
+def _generation_path(namespace: Optional[str]) -> str:
+    return os.path.join(config.GENERATIONS_DIR, namespace_key(namespace))
+
+
+def get_generation(namespace: Optional[str] = None) -> int:
+    """Current generation of a namespace (0 if never invalidated)."""
+    try:
+        return os.stat(_generation_path(namespace)).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+def on_invalidate(hook: Callable[[Optional[str]], None]):
+    """Register a callback run when a namespace is invalidated in this process."""
+    with _hooks_lock:
+        _hooks.append(hook)
+
+
+def invalidate_namespace(namespace: Optional[str] = None):
+    """
+    Mark a namespace's cached data as stale.
+    Bumps the on-disk generation and runs in-process hooks.
+    """
+    path = _generation_path(namespace)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(str(time.time_ns()))
+
+    with _hooks_lock:
+        hooks = list(_hooks)
+    for hook in hooks:
+        try:
+            hook(namespace)
+        except Exception as e:
+            logger.error(f"Invalidation hook failed for namespace={namespace}: {str(e)}")
+
+    logger.info(f"Invalidated caches for namespace={namespace}")
@@ -0,0 +1,491 @@
+"""
+Local BM25 lexical index over chunk texts.
+
+Complements dense retrieval for exact-term queries (algorithm names,
+acronyms, formula symbols). Each namespace gets a compact on-disk segment
+that is memory-mapped for queries, plus an in-memory delta for incremental
+updates. save() appends the delta to a log that is replayed on load, and
+merges it into a new segment once it reaches LEXICAL_COMPACT_RATIO of the
+segment's documents.
+
+Usage:
+    # Build (or rebuild) the index for a namespace from Pinecone metadata
+    python lexical_index.py build --namespace cs101
+"""
+
+import json
+import logging
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from config import config
+from invalidation import get_generation, namespace_key
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9_+#]+")
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has in is it its of on or that the "
+    "this to was were what which with".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens; keeps symbols like c++, c#, o_n."""
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    BM25 inverted index for a single namespace.
+
+    On disk (one directory per namespace):
+        meta.json          doc ids, term -> [offset, length], parameters
+        doc_lens.npy       uint32 document lengths
+        postings_docs.npy  uint32 doc indices, grouped by term
+        postings_tfs.npy   uint16 term frequencies, aligned with docs
+        delta.jsonl        adds ({"add", "len", "tf"}) and deletes ({"delete"})
+                           saved since the segment was written
+    """
+
+    def __init__(self, path: str, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+
+        # Base segment (memory-mapped once loaded)
+        self._terms: Dict[str, Tuple[int, int]] = {}
+        self._postings_docs = np.zeros(0, dtype=np.uint32)
+        self._postings_tfs = np.zeros(0, dtype=np.uint16)
+        self._base_doc_count = 0
+
+        # All documents (base + delta), indexed by doc_idx
+        self._doc_ids: List[str] = []
+        self._doc_lens: List[int] = []
+        self._doc_lens_arr: Optional[np.ndarray] = None
+        self._id_to_idx: Dict[str, int] = {}
+
+        # Incremental state
+        self._delta: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self._deleted: set = set()
+        self._total_len = 0
+        self._log: List[Dict[str, Any]] = []
+
+        self._load()
+
+    def _load(self):
+        """Memory-map the base segment if it exists and replay the delta log."""
+        meta_path = os.path.join(self.path, "meta.json")
+        if not os.path.exists(meta_path):
+            return
+
+        with open(meta_path) as f:
+            meta = json.load(f)
+
+        self._terms = {term: tuple(span) for term, span in meta["terms"].items()}
+        self._doc_ids = list(meta["doc_ids"])
+        self._postings_docs = np.load(os.path.join(self.path, "postings_docs.npy"), mmap_mode="r")
+        self._postings_tfs = np.load(os.path.join(self.path, "postings_tfs.npy"), mmap_mode="r")
+        self._doc_lens = np.load(os.path.join(self.path, "doc_lens.npy")).tolist()
+        self._id_to_idx = {doc_id: i for i, doc_id in enumerate(self._doc_ids)}
+        self._base_doc_count = len(self._doc_ids)
+        self._total_len = sum(self._doc_lens)
+
+        replayed = 0
+        log_path = os.path.join(self.path, "delta.jsonl")
+        if os.path.exists(log_path):
+            with open(log_path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # torn final line of an interrupted save
+                    if "delete" in entry:
+                        self._delete_one(entry["delete"])
+                    else:
+                        self._add_counts(entry["add"], entry["len"], entry["tf"])
+                    replayed += 1
+
+        logger.info(
+            "Loaded BM25 index from %s: %d docs, %d terms, %d logged updates",
+            self.path, self._base_doc_count, len(self._terms), replayed
+        )
+
+    def _close(self):
+        """Drop the segment's memory maps (released once no view refers to them)."""
+        self._terms = {}
+        self._postings_docs = np.zeros(0, dtype=np.uint32)
+        self._postings_tfs = np.zeros(0, dtype=np.uint16)
+        self._base_doc_count = 0
+        self._doc_ids = []
+        self._doc_lens = []
+        self._doc_lens_arr = None
+        self._id_to_idx = {}
+        self._delta = defaultdict(list)
+        self._deleted = set()
+        self._total_len = 0
+        self._log = []
+
+    def close(self):
+        """Unmap the segment. The index reads as empty afterwards."""
+        with self._lock:
+            self._close()
+
+    @property
+    def doc_count(self) -> int:
+        """Number of live documents."""
+        return len(self._doc_ids) - len(self._deleted)
+
+    def add_documents(self, documents: Iterable[Tuple[str, str]]):
+        """
+        Add or replace documents.
+
+        Args:
+            documents: (doc_id, text) pairs
+        """
+        with self._lock:
+            for doc_id, text in documents:
+                counts = Counter(tokenize(text))
+                doc_len = sum(counts.values())
+                self._add_counts(doc_id, doc_len, counts)
+                self._log.append({"add": doc_id, "len": doc_len, "tf": counts})
+
+    def _add_counts(self, doc_id: str, doc_len: int, counts: Dict[str, int]):
+        self._delete_one(doc_id)
+
+        doc_idx = len(self._doc_ids)
+        self._doc_ids.append(doc_id)
+        self._doc_lens.append(doc_len)
+        self._doc_lens_arr = None
+        self._id_to_idx[doc_id] = doc_idx
+        self._total_len += doc_len
+
+        for term, tf in counts.items():
+            self._delta[term].append((doc_idx, min(tf, 65535)))
+
+    def delete_documents(self, doc_ids: Iterable[str]):
+        """Remove documents by id."""
+        with self._lock:
+            for doc_id in doc_ids:
+                if doc_id in self._id_to_idx:
+                    self._delete_one(doc_id)
+                    self._log.append({"delete": doc_id})
+
+    def clear(self):
+        """Remove every document (takes effect on disk at save())."""
+        self.delete_documents(list(self._id_to_idx))
+
+    def _delete_one(self, doc_id: str):
+        doc_idx = self._id_to_idx.pop(doc_id, None)
+        if doc_idx is not None:
+            self._deleted.add(doc_idx)
+            self._total_len -= self._doc_lens[doc_idx]
+
+    def _postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Doc indices and term frequencies for a term (base + delta)."""
+        docs_parts, tfs_parts = [], []
+
+        span = self._terms.get(term)
+        if span:
+            offset, length = span
+            docs_parts.append(self._postings_docs[offset:offset + length])
+            tfs_parts.append(self._postings_tfs[offset:offset + length])
+
+        delta = self._delta.get(term)
+        if delta:
+            delta_arr = np.asarray(delta, dtype=np.int64)
+            docs_parts.append(delta_arr[:, 0])
+            tfs_parts.append(delta_arr[:, 1])
+
+        if not docs_parts:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        return (
+            np.concatenate(docs_parts).astype(np.int64, copy=False),
+            np.concatenate(tfs_parts).astype(np.float32, copy=False)
+        )
+
+    def search(self, query: str, top_k: int = 10) -> List[Dict[str, Any]]:
+        """
+        Score documents against a query with BM25.
+
+        Returns:
+            List of {"id", "score"} dicts, best first
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+
+        with self._lock:
+            n_docs = self.doc_count
+            if n_docs == 0:
+                return []
+
+            avgdl = self._total_len / n_docs
+            if self._doc_lens_arr is None:
+                self._doc_lens_arr = np.asarray(self._doc_lens, dtype=np.float32)
+            doc_lens = self._doc_lens_arr
+            scores = np.zeros(len(self._doc_ids), dtype=np.float32)
+
+            # Deleted documents stay in the postings until compaction; keep them out of df
+            live = None
+            if self._deleted:
+                live = np.ones(len(self._doc_ids), dtype=bool)
+                live[list(self._deleted)] = False
+
+            for term in terms:
+                docs, tfs = self._postings(term)
+                df = int(live[docs].sum()) if live is not None else docs.size
+                if df == 0:
+                    continue
+
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                norm = self.k1 * (1 - self.b + self.b * doc_lens[docs] / avgdl)
+                np.add.at(scores, docs, idf * tfs * (self.k1 + 1) / (tfs + norm))
+
+            if self._deleted:
+                scores[list(self._deleted)] = 0
+
+            candidates = np.flatnonzero(scores)
+            if candidates.size == 0:
+                return []
+
+            if candidates.size > top_k:
+                part = np.argpartition(-scores[candidates], top_k - 1)[:top_k]
+                candidates = candidates[part]
+
+            ranked = candidates[np.argsort(-scores[candidates], kind="stable")]
+            return [
+                {"id": self._doc_ids[i], "score": float(scores[i])}
+                for i in ranked
+            ]
+
+    def save(self, compact: bool = None):
+        """
+        Persist pending updates.
+
+        Small deltas are appended to delta.jsonl. Once pending adds and
+        deletes reach LEXICAL_COMPACT_RATIO of the segment's documents (or
+        with compact=True, or before a segment exists), the delta is merged
+        into a new compacted segment instead.
+
+        Args:
+            compact: Force (True) or skip (False) compaction
+        """
+        with self._lock:
+            pending = len(self._doc_ids) - self._base_doc_count + len(self._deleted)
+            if compact is None:
+                compact = pending > self._base_doc_count * config.LEXICAL_COMPACT_RATIO
+            has_segment = os.path.exists(os.path.join(self.path, "meta.json"))
+            if has_segment and not compact:
+                self._append_log()
+                return
+            self._compact()
+
+    def _append_log(self):
+        if not self._log:
+            return
+        with open(os.path.join(self.path, "delta.jsonl"), "a") as f:
+            for entry in self._log:
+                f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        logger.info("Logged %d BM25 updates to %s", len(self._log), self.path)
+        self._log = []
+
+    def _compact(self):
+        """
+        Merge the delta into a new compacted base segment and write it.
+        Files are replaced atomically, then the delta log is dropped.
+        """
+        with self._lock:
+            live = [i for i in range(len(self._doc_ids)) if i not in self._deleted]
+            remap = np.full(len(self._doc_ids), -1, dtype=np.int64)
+            remap[live] = np.arange(len(live))
+
+            all_terms = set(self._terms) | set(self._delta)
+            terms_meta: Dict[str, List[int]] = {}
+            docs_parts, tfs_parts = [], []
+            offset = 0
+
+            for term in sorted(all_terms):
+                docs, tfs = self._postings(term)
+                new_docs = remap[docs]
+                keep = new_docs >= 0
+                if not keep.any():
+                    continue
+
+                new_docs = new_docs[keep]
+                order = np.argsort(new_docs, kind="stable")
+                docs_parts.append(new_docs[order].astype(np.uint32))
+                tfs_parts.append(tfs[keep][order].astype(np.uint16))
+                terms_meta[term] = [offset, int(keep.sum())]
+                offset += int(keep.sum())
+
+            os.makedirs(self.path, exist_ok=True)
+            postings_docs = np.concatenate(docs_parts) if docs_parts else np.zeros(0, dtype=np.uint32)
+            postings_tfs = np.concatenate(tfs_parts) if tfs_parts else np.zeros(0, dtype=np.uint16)
+            doc_lens = np.asarray([self._doc_lens[i] for i in live], dtype=np.uint32)
+
+            self._atomic_save_npy("postings_docs.npy", postings_docs)
+            self._atomic_save_npy("postings_tfs.npy", postings_tfs)
+            self._atomic_save_npy("doc_lens.npy", doc_lens)
+
+            meta = {
+                "k1": self.k1,
+                "b": self.b,
+                "doc_ids": [self._doc_ids[i] for i in live],
+                "terms": terms_meta
+            }
+            tmp_meta = os.path.join(self.path, "meta.json.tmp")
+            with open(tmp_meta, "w") as f:
+                json.dump(meta, f, separators=(",", ":"))
+            os.replace(tmp_meta, os.path.join(self.path, "meta.json"))
+            # Replaying a stale log over the new segment is harmless (adds
+            # replace, deletes of missing ids are no-ops), so remove it last
+            log_path = os.path.join(self.path, "delta.jsonl")
+            if os.path.exists(log_path):
+                os.remove(log_path)
+
+            # Release the old segment and map the new one
+            self._close()
+            self._load()
+
+            logger.info(f"Saved BM25 index to {self.path}: {len(live)} docs, {len(terms_meta)} terms")
+
+    def _atomic_save_npy(self, name: str, array: np.ndarray):
+        tmp_path = os.path.join(self.path, f"{name}.tmp")
+        with open(tmp_path, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp_path, os.path.join(self.path, name))
+
+    def stats(self) -> dict:
+        """Return index statistics."""
+        return {
+            "documents": self.doc_count,
+            "terms": len(set(self._terms) | set(self._delta)),
+            "pending_updates": len(self._doc_ids) - self._base_doc_count + len(self._deleted)
+        }
+
+
+class LexicalIndexManager:
+    """
+    Holds one BM25Index per Pinecone namespace under a base directory.
+    """
+
+    def __init__(self, base_dir: str = None):
+        self.base_dir = base_dir or config.LEXICAL_INDEX_DIR
+        self._indexes: "OrderedDict[str, BM25Index]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, namespace: Optional[str] = None) -> BM25Index:
+        """Get (loading if needed) the index for a namespace."""
+        key = namespace_key(namespace)
+        generation = get_generation(namespace)
+        with self._lock:
+            # Reload when another process re-indexed the namespace
+            if key not in self._indexes or self._generations.get(key) != generation:
+                previous = self._indexes.get(key)
+                self._indexes[key] = BM25Index(os.path.join(self.base_dir, key))
+                self._generations[key] = generation
+                if previous is not None:
+                    previous.close()
+            self._indexes.move_to_end(key)
+            # Keep only the most recently used namespaces open
+            while len(self._indexes) > config.LOCAL_INDEX_MAX_NAMESPACES:
+                evicted, index = self._indexes.popitem(last=False)
+                self._generations.pop(evicted, None)
+                index.close()
+            return self._indexes[key]
+
+    def search(self, query: str, namespace: Optional[str] = None, top_k: int = 10) -> List[Dict[str, Any]]:
+        """BM25 search within a namespace."""
+        return self.get(namespace).search(query, top_k=top_k)
+
+    def build(self, retrieval_service, namespace: Optional[str] = None) -> BM25Index:
+        """
+        Rebuild a namespace's index from chunk texts in Pinecone metadata.
+        """
+        key = namespace_key(namespace)
+        index = BM25Index(os.path.join(self.base_dir, key))
+        index.clear()
+
+        count = 0
+        batch = []
+        for doc in retrieval_service.iter_documents(namespace=namespace):
+            text = doc["metadata"].get("text", "")
+            if text:
+                batch.append((doc["id"], text))
+            if len(batch) >= 1000:
+                index.add_documents(batch)
+                count += len(batch)
+                batch = []
+        index.add_documents(batch)
+        count += len(batch)
+
+        index.save(compact=True)
+        with self._lock:
+            previous = self._indexes.get(key)
+            self._indexes[key] = index
+            self._generations[key] = get_generation(namespace)
+            if previous is not None:
+                previous.close()
+
+        logger.info(f"Built BM25 index for namespace={namespace}: {count} chunks")
+        return index
+
+    def stats(self) -> dict:
+        """Return statistics for loaded indexes."""
+        with self._lock:
+            return {key: index.stats() for key, index in self._indexes.items()}
+
+
+def reciprocal_rank_fusion(
+    result_lists: List[List[Dict[str, Any]]],
+    k: int = None,
+    top_k: int = None
+) -> List[Tuple[str, float]]:
+    """
+    Fuse ranked result lists with reciprocal-rank fusion.
+
+    Args:
+        result_lists: Ranked lists of dicts with an "id" key
+        k: RRF constant (dampens the weight of top ranks)
+        top_k: Number of fused ids to return
+
+    Returns:
+        (id, fused_score) pairs, best first
+    """
+    k = k or config.RRF_K
+    fused: Dict[str, float] = defaultdict(float)
+
+    for results in result_lists:
+        for rank, doc in enumerate(results):
+            fused[doc["id"]] += 1.0 / (k + rank + 1)
+
+    ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)
+    return ranked[:top_k] if top_k else ranked
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from retrieval_service import RetrievalService
+
+    logging.basicConfig(level=config.LOG_LEVEL)
+
+    parser = argparse.ArgumentParser(description="Local BM25 index maintenance")
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument("--namespace", default=config.PINECONE_NAMESPACE)
+    args = parser.parse_args()
+
+    LexicalIndexManager().build(RetrievalService(), namespace=args.namespace)
@@ -1,8 +1,12 @@
 import logging
-from typing import List, Dict, Any, Optional
+import threading
+import time
+from typing import Callable, List, Dict, Any, Optional, Tuple
 from groq import Groq
 
 from config import config
+import tracing
+import usage as usage_accounting
 
 logger = logging.getLogger(__name__)
 
@@ -11,6 +15,12 @@ class LLMService:
     """
     Service for generating responses using Groq API.
     Supports various Groq models with streaming capabilities.
+    
+    Routes each request to a model tier: "large" (GROQ_MODEL) or "fast"
+    (GROQ_FAST_MODEL), with per-model call latency and routing counts.
+    
+    Pass a dict as `usage` to generate() or generate_stream() to receive
+    token counts and timings for the call (see usage.py).
     """
     
     def __init__(
@@ -24,6 +34,14 @@ class LLMService:
         self.model = model or config.GROQ_MODEL
         self.temperature = temperature if temperature is not None else config.GROQ_TEMPERATURE
         self.max_tokens = max_tokens or config.GROQ_MAX_TOKENS
+        self.models = {
+            "large": self.model,
+            "fast": config.GROQ_FAST_MODEL or self.model
+        }
+        
+        self._model_stats: Dict[str, Dict[str, float]] = {}
+        self._routes: Dict[str, int] = {}
+        self._stats_lock = threading.Lock()
         
         # Initialize Groq client
         self._initialize_client()
@@ -36,13 +54,37 @@ class LLMService:
         
         logger.info("Groq client initialized successfully")
     
+    def model_for(self, tier: str) -> str:
+        """Model for a schema tier; the large model when routing is off."""
+        if not config.MODEL_ROUTING:
+            return self.model
+        return self.models.get(tier, self.model)
+    
+    def _record_call(self, model: str, seconds: float, ok: bool):
+        with self._stats_lock:
+            stats = self._model_stats.setdefault(
+                model, {"calls": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0}
+            )
+            stats["calls"] += 1
+            if not ok:
+                stats["errors"] += 1
+            stats["total_ms"] += seconds * 1000
+            stats["max_ms"] = max(stats["max_ms"], seconds * 1000)
+    
+    def _record_route(self, route: str):
+        with self._stats_lock:
+            self._routes[route] = self._routes.get(route, 0) + 1
+    
     def generate(
         self,
         prompt: str,
         system_prompt: str = None,
         temperature: float = None,
         max_tokens: int = None,
-        stop_sequences: List[str] = None
+        stop_sequences: List[str] = None,
+        timeout: float = None,
+        model: str = None,
+        usage: Dict[str, Any] = None
     ) -> str:
         """
         Generate a response using Groq API.
@@ -53,6 +95,9 @@ class LLMService:
             temperature: Sampling temperature (0-2)
             max_tokens: Maximum tokens to generate
             stop_sequences: Sequences where generation should stop
+            timeout: Request timeout in seconds (client default if None)
+            model: Model to use (defaults to GROQ_MODEL)
+            usage: Optional dict filled with token counts and timings
         
         Returns:
             Generated text response
@@ -75,27 +120,92 @@ class LLMService:
         # Use instance defaults or override
         temp = temperature if temperature is not None else self.temperature
         max_tok = max_tokens or self.max_tokens
+        model = model or self.model
+        start = time.perf_counter()
         
         try:
-            logger.info(f"Generating response with model: {self.model}")
+            logger.info("Generating response with model: %s", model)
             
-            completion = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=temp,
-                max_tokens=max_tok,
-                stop=stop_sequences
-            )
+            request_params = {}
+            if timeout is not None:
+                request_params["timeout"] = timeout
+            
+            with tracing.span("llm.generate", model=model, max_tokens=max_tok) as span:
+                completion = self.client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=temp,
+                    max_tokens=max_tok,
+                    stop=stop_sequences,
+                    **request_params
+                )
+                completion_usage = getattr(completion, "usage", None)
+                span.set("prompt_tokens", getattr(completion_usage, "prompt_tokens", None))
+                span.set("completion_tokens", getattr(completion_usage, "completion_tokens", None))
             
             response = completion.choices[0].message.content
+            elapsed = time.perf_counter() - start
+            self._record_call(model, elapsed, ok=True)
+            
+            if usage is not None:
+                usage.update(usage_accounting.from_completion(model, completion_usage, total_seconds=elapsed))
             
-            logger.info(f"Generated {len(response)} characters")
+            logger.info("Generated %d characters", len(response))
             return response
         
         except Exception as e:
-            logger.error(f"Error generating response: {str(e)}")
+            self._record_call(model, time.perf_counter() - start, ok=False)
+            logger.error("Error generating response: %s", e)
             raise
     
+    def generate_routed(
+        self,
+        prompt: str,
+        tier: str,
+        check: Callable[[str], bool] = None,
+        **kwargs
+    ) -> Tuple[str, Dict[str, Any]]:
+        """
+        Generate with the model for a schema tier.
+        
+        In cascade mode (LLM_CASCADE), an answer from a smaller model that
+        fails check() is regenerated with the large model, within what is
+        left of `timeout`.
+        
+        Args:
+            prompt: User prompt
+            tier: Schema model tier ("fast" or "large")
+            check: Cheap structural check on the answer
+            **kwargs: Passed to generate()
+        
+        Returns:
+            (answer, route) where route records tier, model, fallback and
+            usage (summed over both calls after a fallback)
+        """
+        model = self.model_for(tier)
+        calls = [{}]
+        start = time.perf_counter()
+        answer = self.generate(prompt=prompt, model=model, usage=calls[0], **kwargs)
+        route = {"tier": tier, "model": model, "fallback": False}
+        
+        if config.LLM_CASCADE and check is not None and model != self.model and not check(answer):
+            # The fallback only gets what is left of the caller's timeout
+            timeout = kwargs.get("timeout")
+            if timeout is not None:
+                kwargs["timeout"] = timeout - (time.perf_counter() - start)
+            if timeout is not None and kwargs["timeout"] <= 0:
+                logger.info("Answer from %s failed structure check, no time left to fall back", model)
+            else:
+                logger.info("Answer from %s failed structure check, falling back to %s", model, self.model)
+                calls.append({})
+                answer = self.generate(prompt=prompt, model=self.model, usage=calls[1], **kwargs)
+                route.update(model=self.model, fallback=True)
+        
+        route["usage"] = usage_accounting.combine(calls)
+        
+        self._record_route(f"{tier}:{route['model']}" + (" (fallback)" if route["fallback"] else ""))
+        return answer, route
+    
     def generate_with_context(
         self,
         query: str,
@@ -147,7 +257,10 @@ Answer:"""
         prompt: str,
         system_prompt: str = None,
         temperature: float = None,
-        max_tokens: int = None
+        max_tokens: int = None,
+        timeout: float = None,
+        model: str = None,
+        usage: Dict[str, Any] = None
     ):
         """
         Generate a streaming response using Groq API.
@@ -157,6 +270,11 @@ Answer:"""
             system_prompt: System instructions
             temperature: Sampling temperature
             max_tokens: Maximum tokens to generate
+            timeout: Request timeout in seconds (client default if None)
+            model: Model to use (defaults to GROQ_MODEL)
+            usage: Optional dict filled when the stream ends or is closed.
+                Token counts come from the final chunk, so they are
+                missing (and "truncated" is set) if the consumer stops early.
         
         Yields:
             Text chunks as they are generated
@@ -176,25 +294,73 @@ Answer:"""
         
         temp = temperature if temperature is not None else self.temperature
         max_tok = max_tokens or self.max_tokens
+        model = model or self.model
+        start = time.perf_counter()
+        first_token = last_token = None
+        completion_usage = None
+        stream = None
+        finished = False
+        # Ended manually: the stream is consumed across separate executor calls
+        span = tracing.span("llm.stream", model=model, max_tokens=max_tok)
         
         try:
-            logger.info(f"Starting streaming generation with model: {self.model}")
+            logger.info("Starting streaming generation with model: %s", model)
+            
+            request_params = {}
+            if timeout is not None:
+                request_params["timeout"] = timeout
             
             stream = self.client.chat.completions.create(
-                model=self.model,
+                model=model,
                 messages=messages,
                 temperature=temp,
                 max_tokens=max_tok,
-                stream=True
+                stream=True,
+                **request_params
             )
             
             for chunk in stream:
-                if chunk.choices[0].delta.content:
+                # Groq reports usage on the last chunk
+                x_groq = getattr(chunk, "x_groq", None)
+                completion_usage = getattr(x_groq, "usage", None) or getattr(chunk, "usage", None) or completion_usage
+                
+                if chunk.choices and chunk.choices[0].delta.content:
+                    last_token = time.perf_counter() - start
+                    if first_token is None:
+                        first_token = last_token
                     yield chunk.choices[0].delta.content
+            
+            finished = True
+            self._record_call(model, time.perf_counter() - start, ok=True)
         
         except Exception as e:
-            logger.error(f"Error in streaming generation: {str(e)}")
+            self._record_call(model, time.perf_counter() - start, ok=False)
+            logger.error("Error in streaming generation: %s", e)
             raise
+        
+        finally:
+            if stream is not None and not finished:
+                # Consumer stopped early (disconnect, deadline): release the HTTP connection
+                try:
+                    stream.close()
+                except Exception as e:
+                    logger.warning("Could not close Groq stream: %s", e)
+            
+            stream_usage = usage_accounting.from_completion(
+                model, completion_usage,
+                total_seconds=time.perf_counter() - start,
+                first_token_seconds=first_token,
+                last_token_seconds=last_token
+            )
+            stream_usage["truncated"] = not finished
+            if usage is not None:
+                usage.update(stream_usage)
+            
+            span.set("time_to_first_token_ms", stream_usage["time_to_first_token_ms"])
+            span.set("prompt_tokens", stream_usage["prompt_tokens"])
+            span.set("completion_tokens", stream_usage["completion_tokens"])
+            span.set("truncated", stream_usage["truncated"])
+            span.end()
     
     def chat(
         self,
@@ -217,7 +383,7 @@ Answer:"""
         max_tok = max_tokens or self.max_tokens
         
         try:
-            logger.info(f"Processing chat with {len(messages)} messages")
+            logger.info("Processing chat with %d messages", len(messages))
             
             completion = self.client.chat.completions.create(
                 model=self.model,
@@ -229,5 +395,24 @@ Answer:"""
             return completion.choices[0].message.content
         
         except Exception as e:
-            logger.error(f"Error in chat: {str(e)}")
-            raise
\ No newline at end of file
+            logger.error("Error in chat: %s", e)
+            raise
+    
+    def stats(self) -> Dict[str, Any]:
+        """Per-model call latency and routing decisions."""
+        with self._stats_lock:
+            models = {}
+            for model, stats in self._model_stats.items():
+                models[model] = {
+                    "calls": stats["calls"],
+                    "errors": stats["errors"],
+                    "avg_ms": stats["total_ms"] / stats["calls"] if stats["calls"] else 0.0,
+                    "max_ms": stats["max_ms"]
+                }
+            return {
+                "routing": config.MODEL_ROUTING,
+                "cascade": config.LLM_CASCADE,
+                "tiers": dict(self.models),
+                "models": models,
+                "routes": dict(self._routes)
+            }
\ No newline at end of file
@@ -0,0 +1,374 @@
+"""
+Open-loop load generation and request-log replay against a running API.
+
+Arrivals are scheduled up front (Poisson at the target RPS, or the recorded
+timestamps of a request log) and each request is sent at its scheduled time
+whether or not earlier ones have finished, so a slow server cannot throttle
+the offered load. Latency is measured from the scheduled send time, which
+keeps queueing delay inside the generator visible instead of hiding it
+(coordinated omission).
+
+Used through `python main.py load`.
+"""
+
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+import numpy as np
+
+from request_log import read_request_log
+
+logger = logging.getLogger(__name__)
+
+ENDPOINTS = {
+    "query": ("POST", "/query"),
+    "batch": ("POST", "/query/batch"),
+    "generate": ("POST", "/generate"),
+    "stream": ("POST", "/generate/stream"),
+}
+
+DEFAULT_MIX = "query=6,generate=2,stream=1,batch=1"
+
+DEFAULT_QUERIES = [
+    "What is a binary search tree?",
+    "Explain the working of Dijkstra's shortest path algorithm",
+    "Define normalization in DBMS",
+    "Differentiate between process and thread",
+    "What is deadlock? Explain the necessary conditions",
+    "Explain the OSI reference model with a neat diagram",
+    "What is virtual memory?",
+    "Compare TCP and UDP",
+    "Explain quicksort with an example",
+    "What is polymorphism in object oriented programming?",
+    "Explain paging and segmentation",
+    "What are ACID properties of transactions?",
+    "Describe the working of a hash table and collision handling",
+    "What is a semaphore?",
+    "Explain dynamic programming with the knapsack problem",
+    "What is the difference between stack and queue?",
+]
+
+# Mark allocations as students actually request them: short answers dominate
+MARKS_WEIGHTS = {2: 4, 3: 2, 5: 3, 7: 1, 10: 1, 15: 0.5}
+
+# Histogram bucket upper bounds in milliseconds
+HISTOGRAM_BOUNDS_MS = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, float("inf")]
+
+
+@dataclass
+class PlannedRequest:
+    offset: float  # seconds after start
+    label: str
+    method: str
+    path: str
+    body: Optional[Dict[str, Any]] = None
+    query: str = ""
+
+
+@dataclass
+class Outcome:
+    label: str
+    latency_ms: float
+    status: int
+    first_byte_ms: Optional[float] = None
+    error: Optional[str] = None
+
+
+@dataclass
+class StepReport:
+    target_rps: Optional[float]
+    duration: float
+    outcomes: List[Outcome] = field(default_factory=list)
+    dropped: int = 0
+
+
+def load_queries(path: Optional[str]) -> List[str]:
+    """Query corpus: one query per line, or JSONL with a "query" field."""
+    if not path:
+        return list(DEFAULT_QUERIES)
+
+    queries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                try:
+                    line = json.loads(line).get("query", "")
+                except ValueError:
+                    continue
+            if line:
+                queries.append(line)
+
+    if not queries:
+        raise ValueError(f"No queries found in {path}")
+    return queries
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    """Parse "query=6,generate=2" into endpoint weights."""
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint '{name}' (choose from {', '.join(ENDPOINTS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def _request_body(label: str, queries: List[str], rng: random.Random) -> Dict[str, Any]:
+    if label == "query":
+        return {"query": rng.choice(queries)}
+    if label == "batch":
+        return {"queries": rng.sample(queries, min(len(queries), rng.randint(2, 5)))}
+
+    marks = rng.choices(list(MARKS_WEIGHTS), weights=list(MARKS_WEIGHTS.values()))[0]
+    return {"query": rng.choice(queries), "marks": marks}
+
+
+def poisson_plan(
+    rps: float,
+    duration: float,
+    mix: Dict[str, float],
+    queries: List[str],
+    rng: random.Random
+) -> List[PlannedRequest]:
+    """Poisson arrivals at rps for duration seconds, endpoints drawn from mix."""
+    labels = list(mix)
+    weights = list(mix.values())
+    plan = []
+    offset = rng.expovariate(rps)
+    while offset < duration:
+        label = rng.choices(labels, weights=weights)[0]
+        method, path = ENDPOINTS[label]
+        plan.append(PlannedRequest(offset, label, method, path, _request_body(label, queries, rng)))
+        offset += rng.expovariate(rps)
+    return plan
+
+
+def replay_plan(log_path: str, speed: float = 1.0, limit: int = None) -> List[PlannedRequest]:
+    """Recorded requests scheduled at their original spacing divided by speed."""
+    plan = []
+    start_ts = None
+    for record in read_request_log(log_path):
+        if start_ts is None:
+            start_ts = record["ts"]
+        plan.append(PlannedRequest(
+            offset=(record["ts"] - start_ts) / speed,
+            label=record["path"],
+            method=record.get("method", "POST"),
+            path=record["path"],
+            body=record.get("body"),
+            query=record.get("query", "")
+        ))
+        if limit and len(plan) >= limit:
+            break
+    plan.sort(key=lambda request: request.offset)
+    return plan
+
+
+async def _send(client: httpx.AsyncClient, request: PlannedRequest, scheduled: float) -> Outcome:
+    url = request.path + (f"?{request.query}" if request.query else "")
+    first_byte = None
+    try:
+        async with client.stream(request.method, url, json=request.body) as response:
+            async for _ in response.aiter_bytes():
+                if first_byte is None:
+                    first_byte = time.perf_counter()
+            status = response.status_code
+        error = None if status < 400 else f"HTTP {status}"
+    except httpx.HTTPError as e:
+        status = 0
+        error = type(e).__name__
+
+    done = time.perf_counter()
+    return Outcome(
+        label=request.label,
+        latency_ms=(done - scheduled) * 1000,
+        status=status,
+        first_byte_ms=(first_byte - scheduled) * 1000 if first_byte is not None else None,
+        error=error
+    )
+
+
+async def execute_plan(
+    base_url: str,
+    plan: List[PlannedRequest],
+    timeout: float,
+    max_in_flight: int,
+    target_rps: float = None,
+    duration: float = None
+) -> StepReport:
+    """
+    Send every planned request at its offset (open loop).
+    Requests that would exceed max_in_flight are dropped and counted, which
+    is itself a saturation signal.
+    """
+    report = StepReport(target_rps=target_rps, duration=duration or (plan[-1].offset if plan else 0.0))
+    in_flight = 0
+    tasks = []
+
+    async def run(request: PlannedRequest, scheduled: float):
+        nonlocal in_flight
+        try:
+            report.outcomes.append(await _send(client, request, scheduled))
+        finally:
+            in_flight -= 1
+
+    limits = httpx.Limits(max_connections=max_in_flight, max_keepalive_connections=max_in_flight)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        start = time.perf_counter()
+        for request in plan:
+            scheduled = start + request.offset
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            if in_flight >= max_in_flight:
+                report.dropped += 1
+                continue
+            in_flight += 1
+            tasks.append(asyncio.create_task(run(request, scheduled)))
+
+        if tasks:
+            await asyncio.gather(*tasks)
+        if duration is None:
+            report.duration = time.perf_counter() - start
+
+    return report
+
+
+def histogram(latencies_ms: List[float]) -> List[Tuple[str, int]]:
+    """Bucket latencies into HISTOGRAM_BOUNDS_MS."""
+    counts = np.histogram(latencies_ms, bins=[0.0] + HISTOGRAM_BOUNDS_MS)[0]
+    rows = []
+    lower = 0
+    for bound, count in zip(HISTOGRAM_BOUNDS_MS, counts):
+        label = f">{lower}ms" if bound == float("inf") else f"<={bound:g}ms"
+        rows.append((label, int(count)))
+        lower = bound
+    return rows
+
+
+def summarize(report: StepReport) -> Dict[str, Any]:
+    """Per-endpoint latency percentiles, error rates and achieved throughput."""
+    by_label = defaultdict(list)
+    for outcome in report.outcomes:
+        by_label[outcome.label].append(outcome)
+
+    endpoints = {}
+    for label, outcomes in sorted(by_label.items()):
+        ok = [o.latency_ms for o in outcomes if o.error is None]
+        errors = defaultdict(int)
+        for o in outcomes:
+            if o.error is not None:
+                errors[o.error] += 1
+        row = {
+            "requests": len(outcomes),
+            "error_rate": (len(outcomes) - len(ok)) / len(outcomes),
+            "errors": dict(errors)
+        }
+        if ok:
+            p50, p90, p99 = np.percentile(ok, [50, 90, 99])
+            row.update({"p50_ms": p50, "p90_ms": p90, "p99_ms": p99, "max_ms": max(ok)})
+        first_bytes = [o.first_byte_ms for o in outcomes if o.error is None and o.first_byte_ms is not None]
+        if label in ("stream", "/generate/stream") and first_bytes:
+            row["p50_first_byte_ms"] = float(np.percentile(first_bytes, 50))
+        endpoints[label] = row
+
+    completed = [o for o in report.outcomes if o.error is None]
+    return {
+        "target_rps": report.target_rps,
+        "offered": len(report.outcomes) + report.dropped,
+        "dropped": report.dropped,
+        "achieved_rps": len(completed) / report.duration if report.duration else 0.0,
+        "error_rate": 1 - len(completed) / len(report.outcomes) if report.outcomes else 0.0,
+        "endpoints": endpoints,
+        "histogram": histogram([o.latency_ms for o in completed]) if completed else []
+    }
+
+
+def print_summary(summary: Dict[str, Any]):
+    target = summary["target_rps"]
+    print(
+        f"\n== target {target:g} rps ==" if target else "\n== replay ==",
+        f"offered={summary['offered']} dropped={summary['dropped']}"
+        f" achieved={summary['achieved_rps']:.1f} rps errors={summary['error_rate']:.1%}"
+    )
+    print(f"  {'endpoint':<18} {'n':>6} {'err':>6} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}")
+    for label, row in summary["endpoints"].items():
+        if "p50_ms" in row:
+            timings = " ".join(f"{row[key]:>7.0f}ms" for key in ("p50_ms", "p90_ms", "p99_ms", "max_ms"))
+        else:
+            timings = f"{'-':>9} {'-':>9} {'-':>9} {'-':>9}"
+        print(f"  {label:<18} {row['requests']:>6} {row['error_rate']:>6.1%} {timings}")
+        if row["errors"]:
+            print(f"  {'':<18} errors: {row['errors']}")
+
+    rows = summary["histogram"]
+    while rows and rows[-1][1] == 0:
+        rows = rows[:-1]
+    total = sum(count for _, count in rows) or 1
+    print("  latency histogram:")
+    for label, count in rows:
+        bar = "#" * round(40 * count / total)
+        print(f"    {label:>10} {count:>6} {bar}")
+
+
+def saturation_note(summaries: List[Dict[str, Any]]) -> Optional[str]:
+    """First step where the server stopped keeping up with the offered load."""
+    for summary in summaries:
+        target = summary["target_rps"]
+        if not target:
+            continue
+        if summary["dropped"] or summary["error_rate"] > 0.01 or summary["achieved_rps"] < 0.9 * target:
+            return (
+                f"Saturation at ~{target:g} rps: achieved {summary['achieved_rps']:.1f} rps, "
+                f"{summary['error_rate']:.1%} errors, {summary['dropped']} dropped"
+            )
+    return None
+
+
+def run_load(args) -> List[Dict[str, Any]]:
+    """Entry point for `main.py load`."""
+    rng = random.Random(args.seed)
+    summaries = []
+
+    if args.replay:
+        plan = replay_plan(args.replay, speed=args.speed, limit=args.limit)
+        print(f"Replaying {len(plan)} requests from {args.replay} at {args.speed:g}x")
+        report = asyncio.run(execute_plan(args.url, plan, args.timeout, args.max_in_flight))
+        summaries.append(summarize(report))
+    else:
+        queries = load_queries(args.queries)
+        mix = parse_mix(args.mix)
+        for rps in (float(step) for step in args.rps.split(",")):
+            plan = poisson_plan(rps, args.duration, mix, queries, rng)
+            print(f"Offering {rps:g} rps for {args.duration:g}s ({len(plan)} requests, mix {args.mix})")
+            report = asyncio.run(execute_plan(
+                args.url, plan, args.timeout, args.max_in_flight, target_rps=rps, duration=args.duration
+            ))
+            summaries.append(summarize(report))
+
+    for summary in summaries:
+        print_summary(summary)
+
+    note = saturation_note(summaries)
+    if note:
+        print(f"\n{note}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summaries, f, indent=2)
+        print(f"\nWrote results to {args.output}")
+
+    return summaries
@@ -0,0 +1,206 @@
+"""
+Non-blocking, rate-limited logging for the API process.
+
+configure_logging() replaces direct handlers on the root logger with a
+QueueHandler. Request threads only append the unformatted record to a
+bounded queue. A QueueListener thread formats and writes it, as text or
+as JSON lines (LOG_FORMAT). When the queue is full, records are dropped
+and counted rather than blocking the request.
+
+Hot-path log calls use %-style arguments, so a message is only formatted
+if it is actually written, and then on the listener thread.
+
+High-volume INFO/DEBUG messages are sampled per logger (LOG_SAMPLE_RATES,
+e.g. "retrieval_service=0.1") and rate-limited per message template
+(LOG_RATE_LIMIT per second). Warnings and errors are never dropped.
+Suppressed counts are reported in /stats.
+"""
+
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional, Tuple
+
+from config import config
+import tracing  # noqa: F401  (stamps request_id on every record)
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s"
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional["DroppingQueueHandler"] = None
+_setup_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage()
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            payload["exc"] = record.exc_text
+        return json.dumps(payload, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Drops a share of INFO/DEBUG records per logger and caps each message
+    template at `rate_limit` records per second. WARNING and above pass.
+    """
+
+    def __init__(self, sample_rates: Dict[str, float] = None, rate_limit: float = None):
+        super().__init__()
+        self.sample_rates = config.LOG_SAMPLE_RATES if sample_rates is None else sample_rates
+        self.rate_limit = config.LOG_RATE_LIMIT if rate_limit is None else rate_limit
+        self._windows: Dict[Tuple[str, Any], Tuple[int, int]] = {}
+        self.suppressed: Dict[str, int] = {}
+
+    def _sample_rate(self, name: str) -> float:
+        # Most specific configured prefix wins ("a.b" over "a")
+        while True:
+            if name in self.sample_rates:
+                return self.sample_rates[name]
+            if "." not in name:
+                return 1.0
+            name = name.rsplit(".", 1)[0]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+
+        rate = self._sample_rate(record.name) if self.sample_rates else 1.0
+        if rate < 1.0 and random.random() >= rate:
+            self._suppress(record.name)
+            return False
+
+        if self.rate_limit:
+            key = (record.name, record.msg)
+            second = int(record.created)
+            window, count = self._windows.get(key, (second, 0))
+            if window != second:
+                window, count = second, 0
+                # f-string messages are unique per call; keep the table bounded
+                if len(self._windows) > 10000:
+                    self._windows.clear()
+            if count >= self.rate_limit:
+                self._suppress(record.name)
+                return False
+            self._windows[key] = (window, count + 1)
+
+        return True
+
+    def _suppress(self, name: str):
+        self.suppressed[name] = self.suppressed.get(name, 0) + 1
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    QueueHandler that hands the raw record to the listener (formatting
+    happens there) and drops records instead of blocking when full.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Tracebacks hold frames alive; render them before crossing threads
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def skip_unused_record_fields(skip_caller: bool = None):
+    """
+    Stop filling LogRecord fields neither format prints.
+
+    The caller lookup (sys._getframe per record) is the most expensive part
+    of creating a record, but turning it off relies on a private logging
+    attribute and blanks funcName/lineno for every handler, so it is only
+    done with LOG_SKIP_CALLER_LOOKUP.
+
+    Args:
+        skip_caller: Also skip the caller lookup (defaults to config)
+    """
+    if config.LOG_SKIP_CALLER_LOOKUP if skip_caller is None else skip_caller:
+        logging._srcfile = None
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+    logging.logAsyncioTasks = False
+
+
+def configure_logging(level: str = None, fmt: str = None):
+    """
+    Route all logging through a background writer thread. Idempotent.
+
+    Args:
+        level: Root log level (defaults to LOG_LEVEL)
+        fmt: "text" or "json" (defaults to LOG_FORMAT)
+    """
+    global _listener, _queue_handler
+
+    with _setup_lock:
+        if _listener is not None:
+            return
+
+        output = logging.StreamHandler(sys.stderr)
+        if (fmt or config.LOG_FORMAT).lower() == "json":
+            output.setFormatter(JsonFormatter())
+        else:
+            output.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+        _queue_handler = DroppingQueueHandler(queue.Queue(maxsize=config.LOG_QUEUE_SIZE))
+        _queue_handler.addFilter(SamplingFilter())
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(_queue_handler)
+        root.setLevel(level or config.LOG_LEVEL)
+        skip_unused_record_fields()
+
+        _listener = QueueListener(_queue_handler.queue, output, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def stats() -> Dict[str, Any]:
+    """Queue depth and dropped/suppressed record counts."""
+    if _queue_handler is None:
+        return {"async": False}
+    sampling = _queue_handler.filters[0]
+    return {
+        "async": True,
+        "format": config.LOG_FORMAT,
+        "queued": _queue_handler.queue.qsize(),
+        "dropped": _queue_handler.dropped,
+        "suppressed": dict(sampling.suppressed)
+    }
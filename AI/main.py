@@ -4,22 +4,70 @@ Entry point for running the RAG API server.
 Usage:
     # Development
     python main.py
-    
-    # Production with multiple workers
-    uvicorn api:app --host 0.0.0.0 --port 8000 --workers 4
-    
+
+    # Production with multiple workers (WEB_CONCURRENCY splits cores between them)
+    WEB_CONCURRENCY=4 uvicorn api:app --host 0.0.0.0 --port 8000
+
     # With GPU and multiple workers
-    uvicorn api:app --host 0.0.0.0 --port 8000 --workers 4
+    WEB_CONCURRENCY=4 uvicorn api:app --host 0.0.0.0 --port 8000
+
+    # Open-loop load at stepped rates against a running instance
+    python main.py load --rps 5,10,20 --duration 60
+
+    # Replay a recorded request log (REQUEST_LOG_PATH) at twice the original speed
+    python main.py load --replay data/requests.jsonl --speed 2
 """
 
+import argparse
+
 import uvicorn
 from config import config
+import topology
+
+
+def serve(args: argparse.Namespace):
+    # Single worker here; thread env must be set before workers import torch
+    topology.export_process_defaults(workers=1)
 
-if __name__ == "__main__":
     uvicorn.run(
         "api:app",
         host=config.API_HOST,
         port=config.API_PORT,
         reload=False,  # Set to True for development
-        log_level=config.LOG_LEVEL.lower()    
+        log_level=config.LOG_LEVEL.lower()
     )
+
+
+def load(args: argparse.Namespace):
+    from load_generator import DEFAULT_MIX, run_load
+
+    args.mix = args.mix or DEFAULT_MIX
+    run_load(args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="RAG API server and tools")
+    subparsers = parser.add_subparsers(dest="command")
+
+    subparsers.add_parser("serve", help="Run the API server (default)")
+
+    load_parser = subparsers.add_parser("load", help="Generate load against a running server")
+    load_parser.add_argument("--url", default=f"http://localhost:{config.API_PORT}")
+    load_parser.add_argument("--rps", default="5", help="Target rate, or comma-separated steps (e.g. 5,10,20)")
+    load_parser.add_argument("--duration", type=float, default=30.0, help="Seconds per rate step")
+    load_parser.add_argument("--mix", default=None, help="Endpoint weights, e.g. query=6,generate=2,stream=1,batch=1")
+    load_parser.add_argument("--queries", default=None, help="Query corpus (one per line or JSONL)")
+    load_parser.add_argument("--replay", default=None, help="Recorded request log to replay instead")
+    load_parser.add_argument("--speed", type=float, default=1.0, help="Replay speed multiplier")
+    load_parser.add_argument("--limit", type=int, default=None, help="Replay at most this many requests")
+    load_parser.add_argument("--timeout", type=float, default=60.0)
+    load_parser.add_argument("--max-in-flight", type=int, default=256)
+    load_parser.add_argument("--seed", type=int, default=None)
+    load_parser.add_argument("--output", default=None, help="Write JSON results here")
+
+    args = parser.parse_args()
+
+    if args.command == "load":
+        load(args)
+    else:
+        serve(args)
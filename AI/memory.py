@@ -0,0 +1,157 @@
+"""
+Per-worker memory accounting for /stats.
+
+Reports process RSS, the estimated bytes held by each in-process cache, the
+embedding model's parameter memory and (when torch has a GPU allocator in
+use) allocator usage. The remainder of RSS that none of these explain is
+reported as unaccounted, which covers in-flight requests, the interpreter
+and native libraries.
+
+With MEMORY_TRACEMALLOC enabled, tracemalloc runs from startup and /stats
+also lists the top Python allocation sites. It slows allocation-heavy code
+noticeably, so leave it off outside of investigations.
+"""
+
+import logging
+import resource
+import sys
+import tracemalloc
+from typing import Any, Dict, List
+
+import numpy as np
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# CPython object sizes used by the estimates below
+_FLOAT_BYTES = sys.getsizeof(0.0)
+_NDARRAY_OVERHEAD = sys.getsizeof(np.empty(0, dtype=np.float32))
+
+
+def estimate_bytes(value: Any) -> int:
+    """
+    Approximate bytes held by a cached value.
+    Exact for arrays and strings, close for lists of floats and flat dicts.
+    """
+    if isinstance(value, np.ndarray):
+        return _NDARRAY_OVERHEAD + value.nbytes
+    if isinstance(value, (str, bytes)):
+        return sys.getsizeof(value)
+    if isinstance(value, list):
+        if value and isinstance(value[0], float):
+            return sys.getsizeof(value) + _FLOAT_BYTES * len(value)
+        return sys.getsizeof(value) + sum(estimate_bytes(item) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(
+            estimate_bytes(key) + estimate_bytes(item) for key, item in value.items()
+        )
+    return sys.getsizeof(value)
+
+
+def process_memory() -> Dict[str, int]:
+    """Current and peak resident set size of this worker."""
+    result = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    key, value = line.split(":", 1)
+                    name = "rss_bytes" if key == "VmRSS" else "peak_rss_bytes"
+                    result[name] = int(value.split()[0]) * 1024
+    except OSError:
+        pass
+
+    if "peak_rss_bytes" not in result:
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        result["peak_rss_bytes"] = peak if sys.platform == "darwin" else peak * 1024
+
+    return result
+
+
+def model_memory(model) -> Dict[str, Any]:
+    """Parameter and buffer bytes of a torch module (e.g. SentenceTransformer)."""
+    if model is None:
+        return {"loaded": False}
+
+    param_bytes = sum(p.numel() * p.element_size() for p in model.parameters())
+    buffer_bytes = sum(b.numel() * b.element_size() for b in model.buffers())
+    dtypes = sorted({str(p.dtype).replace("torch.", "") for p in model.parameters()})
+    return {
+        "loaded": True,
+        "parameter_bytes": param_bytes,
+        "buffer_bytes": buffer_bytes,
+        "dtypes": dtypes
+    }
+
+
+def torch_allocator() -> Dict[str, Any]:
+    """CUDA caching-allocator usage, if torch is loaded and using a GPU."""
+    torch = sys.modules.get("torch")
+    if torch is None or not torch.cuda.is_available() or not torch.cuda.is_initialized():
+        return {"device": "cpu"}
+
+    return {
+        "device": "cuda",
+        "allocated_bytes": torch.cuda.memory_allocated(),
+        "reserved_bytes": torch.cuda.memory_reserved(),
+        "peak_allocated_bytes": torch.cuda.max_memory_allocated()
+    }
+
+
+def start_tracemalloc(frames: int = None):
+    """Begin tracing allocations (call once, as early as possible)."""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames or config.MEMORY_TRACEMALLOC_FRAMES)
+        logger.info("tracemalloc started")
+
+
+def top_allocations(limit: int = None) -> List[Dict[str, Any]]:
+    """Largest live allocation sites by source line."""
+    if not tracemalloc.is_tracing():
+        return []
+
+    snapshot = tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ])
+    return [
+        {
+            "site": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+            "size_bytes": stat.size,
+            "count": stat.count
+        }
+        for stat in snapshot.statistics("lineno")[:limit or config.MEMORY_TOP_ALLOCATIONS]
+    ]
+
+
+def memory_report(embedding_service, rag_pipeline) -> Dict[str, Any]:
+    """Memory breakdown for this worker."""
+    report = process_memory()
+
+    caches = {}
+    if embedding_service is not None and embedding_service.cache is not None:
+        caches["embedding"] = embedding_service.cache.bytes_used
+    if rag_pipeline is not None and rag_pipeline.chunk_store is not None:
+        caches["chunk_store"] = rag_pipeline.chunk_store.cache_bytes()
+    report["caches"] = caches
+
+    model = embedding_service.model if embedding_service is not None else None
+    report["model"] = model_memory(model)
+    report["torch_allocator"] = torch_allocator()
+
+    if "rss_bytes" in report:
+        accounted = sum(caches.values()) + report["model"].get("parameter_bytes", 0) \
+            + report["model"].get("buffer_bytes", 0)
+        report["unaccounted_bytes"] = max(0, report["rss_bytes"] - accounted)
+
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        report["tracemalloc"] = {
+            "current_bytes": current,
+            "peak_bytes": peak,
+            "top": top_allocations()
+        }
+
+    return report
@@ -0,0 +1,234 @@
+"""
+Sampling profiler hooks for individual requests and continuous aggregation.
+
+Per-request: when a request carries `X-Profile: <PROFILE_ADMIN_TOKEN>`, or is
+picked by PROFILE_SAMPLE_RATE, ProfilingMiddleware samples Python stacks while
+the request runs. It writes folded stacks (one "frame;frame;frame count"
+line per stack, the input format of flamegraph.pl and speedscope) to
+PROFILE_DIR and links the file in an `X-Profile` response header.
+
+Continuous: with PROFILE_CONTINUOUS, a background sampler runs at a low
+rate and periodically rewrites PROFILE_DIR/continuous.folded with hot
+stacks aggregated across all requests.
+
+Samples cover every busy thread in the process (the event loop and the
+executor threads that pipeline stages run on), so concurrent requests show
+up in each other's profiles. When neither mode is enabled, the middleware
+and sampler are not installed and the hot path is unchanged.
+"""
+
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Dict, List, Optional
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "x-profile"
+
+# Leaf frames that mean a thread is parked, not working
+_IDLE_FILES = ("threading.py", "selectors.py", "queue.py", "base_events.py")
+_IDLE_FUNCTIONS = {"select", "poll", "epoll", "wait", "_worker"}
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _is_idle(frame) -> bool:
+    code = frame.f_code
+    return code.co_name in _IDLE_FUNCTIONS or os.path.basename(code.co_filename) in _IDLE_FILES
+
+
+def _folded_stack(frame) -> str:
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class SamplingProfiler:
+    """
+    Background thread sampling all busy Python threads at a fixed interval.
+    """
+
+    def __init__(self, interval_ms: float = None):
+        self.interval = (interval_ms or config.PROFILE_INTERVAL_MS) / 1000
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                self.samples += 1
+                for thread_id, frame in frames.items():
+                    if thread_id != own_id and not _is_idle(frame):
+                        self.stacks[_folded_stack(frame)] += 1
+
+    def snapshot(self) -> Counter:
+        with self._lock:
+            return Counter(self.stacks)
+
+    def take(self) -> Counter:
+        """Return collected stacks and reset."""
+        with self._lock:
+            stacks, self.stacks = self.stacks, Counter()
+            return stacks
+
+
+def write_folded(stacks: Counter, path: str):
+    """Write stacks in folded format, hottest first."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for stack, count in stacks.most_common():
+            f.write(f"{stack} {count}\n")
+    os.replace(tmp_path, path)
+
+
+def profile_path(name: str) -> Optional[str]:
+    """Resolve a profile name to its file, rejecting anything outside PROFILE_DIR."""
+    if os.path.basename(name) != name or not name.endswith(".folded"):
+        return None
+    path = os.path.join(config.PROFILE_DIR, name)
+    return path if os.path.exists(path) else None
+
+
+def is_admin(token: Optional[str]) -> bool:
+    return bool(config.PROFILE_ADMIN_TOKEN) and token == config.PROFILE_ADMIN_TOKEN
+
+
+def request_profiling_enabled() -> bool:
+    return bool(config.PROFILE_ADMIN_TOKEN) or config.PROFILE_SAMPLE_RATE > 0
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware that profiles selected requests end to end,
+    including the streamed body of /generate/stream.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._active = 0
+        self._active_lock = threading.Lock()
+
+    def _selected(self, scope) -> bool:
+        for name, value in scope.get("headers", []):
+            if name == PROFILE_HEADER.encode() and is_admin(value.decode("latin-1")):
+                return True
+        return random.random() < config.PROFILE_SAMPLE_RATE
+
+    def _acquire(self) -> bool:
+        with self._active_lock:
+            if self._active >= config.PROFILE_MAX_CONCURRENT:
+                return False
+            self._active += 1
+            return True
+
+    def _release(self):
+        with self._active_lock:
+            self._active -= 1
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._selected(scope) or not self._acquire():
+            await self.app(scope, receive, send)
+            return
+
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.folded"
+        link = f"/profiles/{name}".encode()
+        profiler = SamplingProfiler()
+        start = time.perf_counter()
+
+        async def profiled_send(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(PROFILE_HEADER.encode(), link)]
+            await send(message)
+
+        profiler.start()
+        try:
+            await self.app(scope, receive, profiled_send)
+        finally:
+            profiler.stop()
+            self._release()
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            try:
+                write_folded(profiler.take(), os.path.join(config.PROFILE_DIR, name))
+                logger.info(
+                    f"Profiled {scope['method']} {scope['path']} in {elapsed_ms:.0f} ms "
+                    f"({profiler.samples} samples): {name}"
+                )
+            except OSError as e:
+                logger.warning("Could not write profile %s: %s", name, e)
+
+
+class ContinuousProfiler:
+    """
+    Low-rate always-on sampler aggregating hot stacks across requests.
+    """
+
+    FILENAME = "continuous.folded"
+
+    def __init__(self, interval_ms: float = None, flush_seconds: float = None):
+        self.sampler = SamplingProfiler(interval_ms or config.PROFILE_CONTINUOUS_INTERVAL_MS)
+        self.flush_seconds = flush_seconds or config.PROFILE_CONTINUOUS_FLUSH_SECONDS
+        self.totals: Counter = Counter()
+        self._stop = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+
+    def start(self):
+        self.sampler.start()
+        self._flusher = threading.Thread(target=self._flush_loop, name="profile-flusher", daemon=True)
+        self._flusher.start()
+        logger.info("Continuous profiling every %.0f ms", self.sampler.interval * 1000)
+
+    def stop(self):
+        self._stop.set()
+        self.sampler.stop()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_seconds):
+            self.flush()
+
+    def flush(self):
+        self.totals.update(self.sampler.take())
+        try:
+            write_folded(self.totals, os.path.join(config.PROFILE_DIR, self.FILENAME))
+        except OSError as e:
+            logger.warning("Could not write continuous profile: %s", e)
+
+    def top(self, limit: int = 10) -> List[Dict[str, object]]:
+        """Hottest leaf frames so far, for /stats."""
+        leaves: Counter = Counter()
+        for stack, count in (self.totals + self.sampler.snapshot()).items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        total = sum(leaves.values()) or 1
+        return [
+            {"frame": frame, "samples": count, "share": count / total}
+            for frame, count in leaves.most_common(limit)
+        ]
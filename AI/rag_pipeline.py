@@ -1,17 +1,24 @@
 import logging
-from typing import List, Dict, Any, Optional
+import threading
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
 
 from config import config
+from answer_bank import AnswerBank
+from chunk_store import ChunkStoreManager
+from deadline import Deadline, DeadlineExceeded, record_miss, run_stage
+from diversity import mmr_select
 from embedding_service import EmbeddingService
-from retrieval_service import RetrievalService
+from lexical_index import LexicalIndexManager, reciprocal_rank_fusion
+from retrieval_service import RetrievalService, merge_top_k
 from llm_service import LLMService
-from schema_service import SchemaService
+from log_setup import configure_logging
+from schema_service import ResolvedSchema, SchemaService
+import tracing
 
 logger = logging.getLogger(__name__)
-logging.basicConfig(
-    level=config.LOG_LEVEL,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+configure_logging()
 
 
 class RAGPipeline:
@@ -24,7 +31,10 @@ class RAGPipeline:
         index_name: str = None,
         embedding_service: EmbeddingService = None,
         retrieval_service: RetrievalService = None,
-        llm_service: LLMService = None
+        llm_service: LLMService = None,
+        lexical_index: LexicalIndexManager = None,
+        chunk_store: ChunkStoreManager = None,
+        answer_bank: AnswerBank = None
     ):
         """
         Initialize RAG pipeline.
@@ -34,6 +44,9 @@ class RAGPipeline:
             embedding_service: Optional pre-initialized embedding service
             retrieval_service: Optional pre-initialized retrieval service
             llm_service: Optional pre-initialized LLM service
+            lexical_index: Optional BM25 index manager for hybrid search
+            chunk_store: Optional local chunk store for lightweight retrieval
+            answer_bank: Optional precomputed answer bank checked before generation
         """
         self.index_name = index_name or config.PINECONE_INDEX_NAME
         
@@ -42,6 +55,24 @@ class RAGPipeline:
         self.retrieval_service = retrieval_service or RetrievalService(self.index_name)
         self.llm_service = llm_service or LLMService()
         
+        # Hybrid lexical + vector retrieval
+        if lexical_index is None and config.HYBRID_SEARCH:
+            lexical_index = LexicalIndexManager()
+        self.lexical_index = lexical_index
+        
+        # Lightweight retrieval (ids/scores from Pinecone, text from local store)
+        if chunk_store is None and config.LIGHTWEIGHT_RETRIEVAL:
+            chunk_store = ChunkStoreManager()
+        self.chunk_store = chunk_store
+        
+        # Precomputed answers for known questions
+        if answer_bank is None and config.ANSWER_BANK:
+            answer_bank = AnswerBank()
+        self.answer_bank = answer_bank
+        
+        self._diversity_stats = {"requests": 0, "candidates": 0, "selected": 0, "tokens_saved": 0}
+        self._stats_lock = threading.Lock()
+        
         logger.info("RAG Pipeline initialized")
     
     def retrieve(
@@ -49,7 +80,10 @@ class RAGPipeline:
         query: str,
         top_k: int = None,
         namespace: str = None,
-        filter_metadata: Dict[str, Any] = None
+        filter_metadata: Dict[str, Any] = None,
+        deadline: Deadline = None,
+        namespaces: List[str] = None,
+        include_values: bool = False
     ) -> List[Dict[str, Any]]:
         """
         Retrieve relevant documents for a query.
@@ -59,30 +93,170 @@ class RAGPipeline:
             top_k: Number of results
             namespace: Pinecone namespace
             filter_metadata: Metadata filters
+            deadline: Optional request deadline (raises DeadlineExceeded)
+            namespaces: Search these namespaces instead (fan-out, merged top-k)
+            include_values: Attach each document's vector as "values"
         
         Returns:
             List of retrieved documents
         """
+        if namespaces:
+            return self.retrieve_namespaces(
+                query, namespaces, top_k, filter_metadata, deadline, include_values
+            )[0]
+        
         # Generate embedding
-        logger.info(f"Processing query: {query[:100]}...")
-        query_vector = self.embedding_service.embed_single(query)
+        logger.info("Processing query: %.100s...", query)
+        query_vector = run_stage("embed", deadline, self.embedding_service.embed_single, query)
         
         # Retrieve from Pinecone
+        return run_stage(
+            "retrieve", deadline, self._retrieve_vector,
+            query, query_vector, top_k, namespace, filter_metadata, include_values
+        )
+    
+    def retrieve_namespaces(
+        self,
+        query: str,
+        namespaces: List[str],
+        top_k: int = None,
+        filter_metadata: Dict[str, Any] = None,
+        deadline: Deadline = None,
+        include_values: bool = False
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+        """
+        Retrieve from several namespaces concurrently and merge into one top-k.
+        
+        Each namespace goes through the normal path (local chunk store,
+        hybrid fusion), then results are merged by score with duplicates
+        across namespaces removed.
+        
+        Returns:
+            (documents tagged with their namespace, per-namespace timings)
+        """
+        logger.info("Processing query across %d namespaces: %.100s...", len(namespaces), query)
+        query_vector = run_stage("embed", deadline, self.embedding_service.embed_single, query)
+        
+        top_k = min(top_k or config.DEFAULT_TOP_K, config.MAX_TOP_K)
+        result_lists, timings = run_stage(
+            "retrieve", deadline, self.retrieval_service.fan_out,
+            lambda namespace: self._retrieve_vector(
+                query, query_vector, top_k, namespace, filter_metadata, include_values
+            ),
+            namespaces
+        )
+        return merge_top_k(result_lists, top_k), timings
+    
+    def _retrieve_vector(
+        self,
+        query: str,
+        query_vector: np.ndarray,
+        top_k: int = None,
+        namespace: str = None,
+        filter_metadata: Dict[str, Any] = None,
+        include_values: bool = False
+    ) -> List[Dict[str, Any]]:
+        """Index query plus optional hybrid fusion for one query vector."""
+        documents = self._query_index(query_vector, top_k, namespace, filter_metadata, include_values)
+        return self._hybrid_merge(
+            query, query_vector, documents, top_k, namespace, filter_metadata, include_values
+        )
+    
+    def _query_index(
+        self,
+        query_vector: np.ndarray,
+        top_k: int = None,
+        namespace: str = None,
+        filter_metadata: Dict[str, Any] = None,
+        include_values: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        Query Pinecone, resolving chunk metadata locally when a chunk store is set.
+        """
+        if self.chunk_store is None:
+            return self.retrieval_service.query(
+                query_vector=query_vector,
+                top_k=top_k,
+                namespace=namespace,
+                filter_metadata=filter_metadata,
+                include_values=include_values
+            )
+        
         documents = self.retrieval_service.query(
             query_vector=query_vector,
             top_k=top_k,
             namespace=namespace,
-            filter_metadata=filter_metadata
+            filter_metadata=filter_metadata,
+            include_metadata=False,
+            include_values=include_values
         )
+        with tracing.span("chunk_store.resolve", documents=len(documents)) as span:
+            documents, missing = self.chunk_store.resolve(documents, namespace=namespace)
+            span.set("missing", len(missing))
+        
+        # Chunks newer than the local store fall back to a Pinecone fetch
+        if missing:
+            logger.warning("%d chunks missing from local store, fetching from Pinecone", len(missing))
+            fetched = {
+                doc["id"]: doc["metadata"]
+                for doc in self.retrieval_service.fetch(missing, namespace=namespace)
+            }
+            for doc in documents:
+                if doc["id"] in fetched:
+                    doc["metadata"] = fetched[doc["id"]]
         
         return documents
     
+    def _hybrid_merge(
+        self,
+        query: str,
+        query_vector: np.ndarray,
+        documents: List[Dict[str, Any]],
+        top_k: int = None,
+        namespace: str = None,
+        filter_metadata: Dict[str, Any] = None,
+        include_values: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        Fuse dense matches with BM25 matches using reciprocal-rank fusion.
+        
+        Lexical-only hits are fetched from Pinecone and given their cosine
+        score against the query vector, so score cutoffs still apply.
+        Skipped when hybrid search is off or metadata filters are set
+        (the local index cannot evaluate Pinecone filters).
+        """
+        if self.lexical_index is None or filter_metadata:
+            return documents
+        
+        top_k = min(top_k or config.DEFAULT_TOP_K, config.MAX_TOP_K)
+        with tracing.span("lexical.search", namespace=namespace) as span:
+            lexical = self.lexical_index.search(query, namespace=namespace, top_k=config.LEXICAL_TOP_K)
+            span.set("matches", len(lexical))
+        if not lexical:
+            return documents
+        
+        fused = reciprocal_rank_fusion([documents, lexical], top_k=top_k)
+        
+        by_id = {doc["id"]: doc for doc in documents}
+        missing = [doc_id for doc_id, _ in fused if doc_id not in by_id]
+        for doc in self.retrieval_service.fetch(missing, namespace=namespace, include_values=True):
+            values = doc["values"] if include_values else doc.pop("values")
+            doc["score"] = float(np.dot(query_vector, values))
+            by_id[doc["id"]] = doc
+        
+        return [
+            {**by_id[doc_id], "fusion_score": fusion_score}
+            for doc_id, fusion_score in fused
+            if doc_id in by_id
+        ]
+    
     def retrieve_batch(
         self,
         queries: List[str],
         top_k: int = None,
         namespace: str = None,
-        filter_metadata: Dict[str, Any] = None
+        filter_metadata: Dict[str, Any] = None,
+        deadline: Deadline = None
     ) -> List[List[Dict[str, Any]]]:
         """
         Retrieve documents for multiple queries in batch.
@@ -93,34 +267,256 @@ class RAGPipeline:
             top_k: Number of results per query
             namespace: Pinecone namespace
             filter_metadata: Metadata filters
+            deadline: Optional request deadline (raises DeadlineExceeded)
         
         Returns:
             List of document lists (one per query)
         """
-        logger.info(f"Processing batch of {len(queries)} queries")
+        logger.info("Processing batch of %d queries", len(queries))
         
         # Generate embeddings in batch
-        query_vectors = self.embedding_service.embed_batch(queries)
+        query_vectors = run_stage("embed", deadline, self.embedding_service.embed_batch, queries)
         
         # Retrieve for each query
         all_results = []
         for i, query_vector in enumerate(query_vectors):
-            logger.info(f"Retrieving for query {i+1}/{len(queries)}")
-            documents = self.retrieval_service.query(
-                query_vector=query_vector,
-                top_k=top_k,
-                namespace=namespace,
-                filter_metadata=filter_metadata
+            logger.debug("Retrieving for query %d/%d", i + 1, len(queries))
+            documents = run_stage(
+                "retrieve", deadline, self._retrieve_vector,
+                queries[i], query_vector, top_k, namespace, filter_metadata
             )
             all_results.append(documents)
         
         return all_results
     
+    def retrieve_for_schema(
+        self,
+        query: str,
+        schema: ResolvedSchema,
+        top_k: int = None,
+        namespace: str = None,
+        filter_metadata: Dict[str, Any] = None,
+        min_score: float = None,
+        deadline: Deadline = None,
+        namespaces: List[str] = None,
+        include_values: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        Retrieve documents using the schema's retrieval defaults.
+        
+        Args:
+            query: Search query
+            schema: Resolved mark schema
+            top_k: Number of results (overrides schema default)
+            namespace: Pinecone namespace
+            filter_metadata: Metadata filters
+            min_score: Minimum similarity score (overrides schema default)
+            deadline: Optional request deadline (raises DeadlineExceeded)
+            namespaces: Search these namespaces instead (fan-out, merged top-k)
+            include_values: Attach each document's vector as "values"
+        
+        Returns:
+            Retrieved documents scoring at or above the cutoff
+        """
+        if top_k is None:
+            top_k = schema.top_k
+        
+        if min_score is None:
+            min_score = schema.min_score
+        
+        documents = self.retrieve(
+            query=query,
+            top_k=top_k,
+            namespace=namespace,
+            filter_metadata=filter_metadata,
+            deadline=deadline,
+            namespaces=namespaces,
+            include_values=include_values
+        )
+        
+        return self.filter_by_score(documents, min_score)
+    
+    def retrieve_for_context(
+        self,
+        query: str,
+        schema: ResolvedSchema,
+        top_k: int = None,
+        namespace: str = None,
+        filter_metadata: Dict[str, Any] = None,
+        min_score: float = None,
+        context_tokens: int = None,
+        deadline: Deadline = None,
+        namespaces: List[str] = None,
+        diversify: bool = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """
+        Retrieve the documents to build a generation context from.
+        
+        With diversity on (MMR_DIVERSITY, or diversify=True), retrieves
+        MMR_CANDIDATE_MULTIPLIER times top_k candidates with their vectors
+        and keeps at most top_k of them, chosen by MMR within the context
+        budget. Candidates nearly identical to an already chosen one
+        (MMR_REDUNDANCY_THRESHOLD) are dropped, so the context is usually
+        smaller than plain top-k.
+        
+        Args:
+            Same as retrieve_for_schema, plus:
+            context_tokens: Context token budget (overrides schema default)
+            diversify: Override MMR_DIVERSITY for this request
+        
+        Returns:
+            (documents, diversity report or None when diversity is off)
+        """
+        if diversify is None:
+            diversify = config.MMR_DIVERSITY
+        
+        if not diversify:
+            documents = self.retrieve_for_schema(
+                query, schema, top_k, namespace, filter_metadata, min_score, deadline, namespaces
+            )
+            return documents, None
+        
+        top_k = top_k if top_k is not None else schema.top_k
+        candidates = self.retrieve_for_schema(
+            query=query,
+            schema=schema,
+            top_k=min(top_k * config.MMR_CANDIDATE_MULTIPLIER, config.MAX_TOP_K),
+            namespace=namespace,
+            filter_metadata=filter_metadata,
+            min_score=min_score,
+            deadline=deadline,
+            namespaces=namespaces,
+            include_values=True
+        )
+        
+        # The query embedding is a cache hit from retrieval
+        query_vector = run_stage("embed", deadline, self.embedding_service.embed_single, query)
+        return self.diversify(
+            query_vector, candidates, top_k,
+            context_tokens if context_tokens is not None else schema.context_tokens,
+            namespace
+        )
+    
+    def diversify(
+        self,
+        query_vector: np.ndarray,
+        candidates: List[Dict[str, Any]],
+        top_k: int,
+        max_tokens: int = None,
+        namespace: str = None
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        MMR selection of a diverse subset of candidates within a token budget.
+        
+        Candidates without vectors are fetched from Pinecone. Vectors are
+        stripped from all documents before returning.
+        
+        Returns:
+            (selected documents, report with tokens saved against plain top-k)
+        """
+        missing = [doc["id"] for doc in candidates if doc.get("values") is None]
+        if missing:
+            fetched = {
+                doc["id"]: doc["values"]
+                for doc in self.retrieval_service.fetch(missing, namespace=namespace, include_values=True)
+            }
+            for doc in candidates:
+                if doc.get("values") is None and doc["id"] in fetched:
+                    doc["values"] = fetched[doc["id"]]
+        
+        candidates = [doc for doc in candidates if doc["metadata"].get("text") and doc.get("values") is not None]
+        vectors = [doc.pop("values") for doc in candidates]
+        costs = [SchemaService.estimate_tokens(doc["metadata"]["text"]) for doc in candidates]
+        
+        with tracing.span("mmr", candidates=len(candidates)) as span:
+            picks = mmr_select(
+                query_vector, vectors, top_k,
+                lambda_mult=config.MMR_LAMBDA,
+                token_costs=costs,
+                token_budget=max_tokens,
+                redundancy_threshold=config.MMR_REDUNDANCY_THRESHOLD
+            )
+            span.set("selected", len(picks))
+        selected = [candidates[i] for i in picks]
+        
+        # What plain top-k would have put into the context under the same budget
+        baseline_tokens = 0
+        for i, cost in enumerate(costs[:top_k]):
+            if max_tokens and i and baseline_tokens + cost > max_tokens:
+                break
+            baseline_tokens += cost
+        selected_tokens = sum(costs[i] for i in picks)
+        
+        report = {
+            "candidates": len(candidates),
+            "selected": len(selected),
+            "baseline_tokens": baseline_tokens,
+            "context_tokens": selected_tokens,
+            "tokens_saved": max(0, baseline_tokens - selected_tokens)
+        }
+        with self._stats_lock:
+            self._diversity_stats["requests"] += 1
+            self._diversity_stats["candidates"] += report["candidates"]
+            self._diversity_stats["selected"] += report["selected"]
+            self._diversity_stats["tokens_saved"] += report["tokens_saved"]
+        
+        logger.info(
+            "MMR kept %d/%d candidates, %d context tokens saved",
+            len(selected), len(candidates), report["tokens_saved"]
+        )
+        return selected, report
+    
+    @staticmethod
+    def plan_llm_budget(deadline: Optional[Deadline], max_tokens: int) -> Dict[str, Any]:
+        """
+        Fit generation into what is left of the deadline.
+        
+        Returns:
+            Dict with max_tokens, timeout (seconds or None) and degraded
+            ("llm_skipped", "shortened" or None)
+        """
+        plan = {"max_tokens": max_tokens, "timeout": None, "degraded": None}
+        if deadline is None:
+            return plan
+        
+        remaining = deadline.remaining()
+        plan["timeout"] = max(0.0, remaining)
+        
+        # Not enough time for even a short answer: return sources only
+        if remaining * 1000 < config.DEADLINE_MIN_LLM_MS:
+            record_miss("llm")
+            plan["degraded"] = "llm_skipped"
+            return plan
+        
+        # Shorten the answer to what can be generated in the remaining time
+        generation_seconds = remaining - config.LLM_FIRST_TOKEN_MS / 1000
+        affordable = int(generation_seconds * config.LLM_TOKENS_PER_SECOND)
+        if affordable < max_tokens:
+            plan["max_tokens"] = max(config.DEADLINE_MIN_ANSWER_TOKENS, affordable)
+            plan["degraded"] = "shortened"
+        
+        return plan
+    
+    @staticmethod
+    def filter_by_score(
+        documents: List[Dict[str, Any]],
+        min_score: float = None
+    ) -> List[Dict[str, Any]]:
+        """Drop documents scoring below min_score."""
+        if not min_score:
+            return documents
+        
+        kept = [doc for doc in documents if doc["score"] >= min_score]
+        if len(kept) < len(documents):
+            logger.info("Dropped %d documents below score %s", len(documents) - len(kept), min_score)
+        return kept
+    
     def build_context(
         self,
         documents: List[Dict[str, Any]],
         include_scores: bool = False,
-        max_length: int = None
+        max_length: int = None,
+        max_tokens: int = None
     ) -> str:
         """
         Build context string from retrieved documents.
@@ -129,12 +525,26 @@ class RAGPipeline:
             documents: Retrieved documents
             include_scores: Whether to include similarity scores
             max_length: Maximum context length in characters
+            max_tokens: Maximum context length in (estimated) tokens
         
         Returns:
             Formatted context string
         """
+        with tracing.span("build_context", documents=len(documents), max_tokens=max_tokens) as span:
+            context = self._build_context(documents, include_scores, max_length, max_tokens)
+            span.set("chars", len(context))
+        return context
+    
+    @staticmethod
+    def _build_context(
+        documents: List[Dict[str, Any]],
+        include_scores: bool,
+        max_length: Optional[int],
+        max_tokens: Optional[int]
+    ) -> str:
         context_chunks = []
         current_length = 0
+        current_tokens = 0
         
         for doc in documents:
             text = doc["metadata"].get("text", "")
@@ -153,6 +563,13 @@ class RAGPipeline:
                     break
                 current_length += len(chunk)
             
+            # Check token budget (always keep at least the best chunk)
+            if max_tokens:
+                chunk_tokens = SchemaService.estimate_tokens(chunk)
+                if context_chunks and current_tokens + chunk_tokens > max_tokens:
+                    break
+                current_tokens += chunk_tokens
+            
             context_chunks.append(chunk)
         
         return "\n\n---\n\n".join(context_chunks)
@@ -164,7 +581,9 @@ class RAGPipeline:
         namespace: str = None,
         filter_metadata: Dict[str, Any] = None,
         include_context: bool = True,
-        include_scores: bool = False
+        include_scores: bool = False,
+        deadline: Deadline = None,
+        namespaces: List[str] = None
     ) -> Dict[str, Any]:
         """
         Execute full RAG pipeline.
@@ -176,17 +595,26 @@ class RAGPipeline:
             filter_metadata: Metadata filters
             include_context: Whether to build context string
             include_scores: Whether to include scores in context
+            deadline: Optional request deadline (raises DeadlineExceeded)
+            namespaces: Search these namespaces instead (fan-out, merged top-k)
         
         Returns:
             Complete RAG result with query, documents, and context
         """
         # Retrieve documents
-        documents = self.retrieve(
-            query=query,
-            top_k=top_k,
-            namespace=namespace,
-            filter_metadata=filter_metadata
-        )
+        timings = None
+        if namespaces:
+            documents, timings = self.retrieve_namespaces(
+                query, namespaces, top_k, filter_metadata, deadline
+            )
+        else:
+            documents = self.retrieve(
+                query=query,
+                top_k=top_k,
+                namespace=namespace,
+                filter_metadata=filter_metadata,
+                deadline=deadline
+            )
         
         # Build result
         result = {
@@ -196,6 +624,9 @@ class RAGPipeline:
             "model": self.embedding_service.model_name
         }
         
+        if timings is not None:
+            result["namespaces"] = timings
+        
         # Add context if requested
         if include_context:
             result["context"] = self.build_context(
@@ -207,10 +638,98 @@ class RAGPipeline:
     
     def get_stats(self) -> Dict[str, Any]:
         """Get pipeline statistics."""
-        return {
+        stats = {
             "embedding": self.embedding_service.get_cache_stats(),
             "index": self.retrieval_service.get_index_stats()
         }
+        
+        if self.lexical_index is not None:
+            stats["lexical_index"] = self.lexical_index.stats()
+        
+        if self.chunk_store is not None:
+            stats["chunk_store"] = self.chunk_store.stats()
+        
+        stats["llm"] = self.llm_service.stats()
+        
+        if self.answer_bank is not None:
+            stats["answer_bank"] = self.answer_bank.stats()
+        
+        with self._stats_lock:
+            diversity = dict(self._diversity_stats)
+        diversity["enabled"] = config.MMR_DIVERSITY
+        diversity["avg_tokens_saved"] = diversity["tokens_saved"] / diversity["requests"] if diversity["requests"] else 0.0
+        stats["diversity"] = diversity
+        
+        return stats
+    
+    @staticmethod
+    def answer_bank_eligible(schema: ResolvedSchema, **overrides: Any) -> bool:
+        """
+        Whether a generate request may be served from the answer bank.
+        
+        Banked answers were generated with the schema defaults, so any
+        retrieval or generation override (top_k, min_score, temperature,
+        custom prompt, namespaces, ...) that differs from them bypasses the
+        bank. Passing a default explicitly does not.
+        """
+        defaults = {
+            "top_k": schema.top_k,
+            "min_score": schema.min_score,
+            "temperature": schema.temperature,
+            "max_tokens": schema.max_tokens,
+            "context_tokens": schema.context_tokens,
+            "diversify": config.MMR_DIVERSITY
+        }
+        return all(
+            value is None or value in ("", {}, []) or (name in defaults and value == defaults[name])
+            for name, value in overrides.items()
+        )
+    
+    def lookup_answer(
+        self,
+        query: str,
+        marks: int,
+        namespace: str = None,
+        include_sources: bool = True
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Serve a precomputed answer from the answer bank, if there is one.
+        
+        Args:
+            query: User's question
+            marks: Validated marks
+            namespace: Pinecone namespace
+            include_sources: Whether to include source documents
+        
+        Returns:
+            A generate_answer-shaped result, or None on a miss
+        """
+        if self.answer_bank is None:
+            return None
+        
+        # The embedding (cached for retrieval on a miss) is only computed if the exact match misses
+        with tracing.span("answer_bank.lookup", marks=marks) as span:
+            hit = self.answer_bank.lookup(query, marks, namespace, embed=self.embedding_service.embed_single)
+            span.set("match", hit["match"] if hit is not None else None)
+        if hit is None:
+            return None
+        
+        entry = hit["entry"]
+        result = dict(entry["result"], query=query)
+        result["answer_bank"] = {
+            "match": hit["match"],
+            "similarity": hit["similarity"],
+            "banked_query": entry["query"],
+            "created_at": entry["created_at"]
+        }
+        if not include_sources:
+            result.pop("sources", None)
+        
+        # Usage was incurred when the answer was banked, not now
+        result.pop("usage", None)
+        
+        logger.info("Answer bank %s hit for %d-mark query: %.100s", hit["match"], marks, query)
+        return result
     
     def generate_answer(
         self,
@@ -222,7 +741,12 @@ class RAGPipeline:
         custom_system_prompt: str = None,
         temperature: float = None,
         max_tokens: int = None,
-        include_sources: bool = True
+        include_sources: bool = True,
+        min_score: float = None,
+        context_tokens: int = None,
+        deadline: Deadline = None,
+        namespaces: List[str] = None,
+        diversify: bool = None
     ) -> Dict[str, Any]:
         """
         Complete RAG pipeline with schema-based LLM generation for exams.
@@ -230,77 +754,143 @@ class RAGPipeline:
         Args:
             query: User's question
             marks: Mark allocation (1, 2, 3, 5, 7, 10, 15)
-            top_k: Number of documents to retrieve
+            top_k: Number of documents to retrieve (overrides schema default)
             namespace: Pinecone namespace
             filter_metadata: Metadata filters
             custom_system_prompt: Override default schema-based prompt
             temperature: LLM temperature (overrides schema default)
             max_tokens: Maximum tokens (overrides schema default)
             include_sources: Whether to include source documents
+            min_score: Minimum similarity score (overrides schema default)
+            context_tokens: Context token budget (overrides schema default)
+            deadline: Optional request deadline. Retrieval misses raise
+                DeadlineExceeded; generation degrades to a shorter answer
+                or to sources without an answer (see "degraded").
+            namespaces: Search these namespaces instead (fan-out, merged top-k)
+            diversify: Override MMR_DIVERSITY (diverse context chunks)
         
         Returns:
             Dict containing query, answer, context, schema info, and sources
         """
-        logger.info(f"Generating {marks}-mark answer for query: {query[:100]}...")
+        logger.info("Generating %s-mark answer for query: %.100s...", marks, query)
         
-        # Validate marks
+        # Validate marks and resolve the precompiled schema once
         marks = SchemaService.validate_marks(marks)
+        schema = SchemaService.resolve(marks)
         
-        # Get schema configuration
-        schema = SchemaService.get_schema(marks)
+        # Known questions are served from the answer bank (schema defaults only)
+        if self.answer_bank_eligible(
+            schema,
+            top_k=top_k,
+            filter_metadata=filter_metadata,
+            custom_system_prompt=custom_system_prompt,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            min_score=min_score,
+            context_tokens=context_tokens,
+            namespaces=namespaces,
+            diversify=diversify
+        ):
+            banked = self.lookup_answer(query, marks, namespace, include_sources)
+            if banked is not None:
+                return banked
         
         # Use schema defaults if not provided
         if temperature is None:
-            temperature = SchemaService.get_temperature(marks)
+            temperature = schema.temperature
         
         if max_tokens is None:
-            max_tokens = SchemaService.get_max_tokens(marks)
+            max_tokens = schema.max_tokens
         
-        # Retrieve relevant documents
-        documents = self.retrieve(
+        if context_tokens is None:
+            context_tokens = schema.context_tokens
+        
+        # Retrieve relevant documents (mark-aware top_k and score cutoff)
+        documents, diversity = self.retrieve_for_context(
             query=query,
+            schema=schema,
             top_k=top_k,
             namespace=namespace,
-            filter_metadata=filter_metadata
+            filter_metadata=filter_metadata,
+            min_score=min_score,
+            context_tokens=context_tokens,
+            deadline=deadline,
+            namespaces=namespaces,
+            diversify=diversify
         )
         
-        # Build context
-        context = self.build_context(documents=documents)
+        # Build context within the schema's token budget
+        context = self.build_context(documents=documents, max_tokens=context_tokens)
         
         # Build schema-based prompts
         if custom_system_prompt:
             system_prompt = custom_system_prompt
             user_prompt = f"Context: {context}\n\nQuestion: {query}"
         else:
-            system_prompt = SchemaService.build_system_prompt(marks)
-            user_prompt = SchemaService.build_user_prompt(query, context, marks)
-        
-        # Generate answer using LLM
-        answer = self.llm_service.generate(
-            prompt=user_prompt,
-            system_prompt=system_prompt,
-            temperature=temperature,
-            max_tokens=max_tokens
-        )
+            system_prompt = schema.system_prompt
+            user_prompt = SchemaService.render_user_prompt(query, context, schema, marks)
+        
+        # Generate answer using LLM, within whatever deadline budget is left
+        degraded = []
+        budget = self.plan_llm_budget(deadline, max_tokens)
+        max_tokens = budget["max_tokens"]
+        if budget["degraded"]:
+            degraded.append(budget["degraded"])
+        
+        # Route to the schema's model tier; custom prompts skip the structure check
+        answer = ""
+        route = {
+            "tier": schema.model_tier,
+            "model": self.llm_service.model_for(schema.model_tier),
+            "fallback": False
+        }
+        check = None if custom_system_prompt else (lambda text: SchemaService.check_structure(text, schema))
+        if budget["degraded"] != "llm_skipped":
+            try:
+                answer, route = run_stage(
+                    "llm", deadline, self.llm_service.generate_routed,
+                    prompt=user_prompt,
+                    tier=schema.model_tier,
+                    check=check,
+                    system_prompt=system_prompt,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    timeout=budget["timeout"]
+                )
+            except DeadlineExceeded:
+                degraded.append("llm_timeout")
         
         result = {
             "query": query,
             "answer": answer,
             "marks": marks,
             "schema": {
-                "name": schema['name'],
-                "structure": schema['structure'],
+                "name": schema.name,
+                "structure": schema.structure,
                 "max_tokens": max_tokens,
-                "temperature": temperature
+                "temperature": temperature,
+                "top_k": top_k if top_k is not None else schema.top_k,
+                "context_tokens": context_tokens
             },
             "context": context,
             "model": {
                 "embedding": self.embedding_service.model_name,
-                "llm": self.llm_service.model
+                "llm": route["model"],
+                "tier": route["tier"],
+                "fallback": route["fallback"]
             }
         }
         
-        if include_sources:
+        # Degraded answers always carry their sources
+        if include_sources or degraded:
             result["sources"] = documents
         
+        if deadline is not None:
+            result["degraded"] = degraded
+        
+        if diversity is not None:
+            result["diversity"] = diversity
+        
+        result["usage"] = route.get("usage")
+        
         return result
\ No newline at end of file
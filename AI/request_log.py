@@ -0,0 +1,111 @@
+"""
+Recording of incoming API requests for replay and capacity planning.
+
+When REQUEST_LOG_PATH is set, RequestLogMiddleware appends one JSON line per
+sampled request to the log:
+
+    {"ts": 1718000000.123, "method": "POST", "path": "/generate",
+     "query": "", "body": {...}}
+
+`python main.py load --replay <log>` replays the file with its original
+inter-arrival times.
+"""
+
+import json
+import logging
+import random
+import threading
+import time
+from typing import Any, Dict, Iterator, List
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+RECORDED_PATHS = ("/query", "/query/batch", "/generate", "/generate/stream", "/embed")
+
+
+class RequestLogWriter:
+    """Append-only JSONL writer shared by all requests in a process."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8", buffering=1)
+        self._lock = threading.Lock()
+
+    def write(self, record: Dict[str, Any]):
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class RequestLogMiddleware:
+    """
+    ASGI middleware that records sampled requests to the request log.
+    The request body is captured as the app reads it, so nothing is buffered
+    twice and unrecorded requests pass through untouched.
+    """
+
+    def __init__(self, app, path: str = None, sample_rate: float = None):
+        self.app = app
+        self.writer = RequestLogWriter(path or config.REQUEST_LOG_PATH)
+        self.sample_rate = config.REQUEST_LOG_SAMPLE_RATE if sample_rate is None else sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["path"] not in RECORDED_PATHS
+            or random.random() >= self.sample_rate
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        record = {
+            "ts": time.time(),
+            "method": scope["method"],
+            "path": scope["path"],
+            "query": scope.get("query_string", b"").decode("latin-1")
+        }
+        chunks: List[bytes] = []
+
+        async def recording_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    self._write(record, b"".join(chunks))
+            return message
+
+        if scope["method"] == "GET":
+            self._write(record, b"")
+        await self.app(scope, recording_receive, send)
+
+    def _write(self, record: Dict[str, Any], body: bytes):
+        if body:
+            try:
+                record["body"] = json.loads(body)
+            except ValueError:
+                return
+        try:
+            self.writer.write(record)
+        except OSError as e:
+            logger.warning(f"Could not write request log: {str(e)}")
+
+
+def read_request_log(path: str) -> Iterator[Dict[str, Any]]:
+    """Yield recorded requests in file order, skipping malformed lines."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if "ts" in record and "path" in record:
+                yield record
@@ -1,21 +1,94 @@
+import hashlib
+import heapq
 import logging
-from typing import List, Dict, Any, Optional
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Dict, Any, Iterator, Optional, Tuple, Union
 import os
+import numpy as np
 from pinecone import Pinecone
 
 from config import config
+from hedging import Hedger
+from index_catalog import IndexCatalog
+from invalidation import on_invalidate, resolve_namespace
+import tracing
 
 logger = logging.getLogger(__name__)
 
+# Shared pool for concurrent per-namespace queries
+_fanout_executor = ThreadPoolExecutor(
+    max_workers=config.FANOUT_WORKERS,
+    thread_name_prefix="namespace-fanout"
+)
+
+
+def as_list(vector) -> List[float]:
+    """Convert an embedding to the plain list the Pinecone client expects."""
+    return vector.tolist() if isinstance(vector, np.ndarray) else vector
+
+
+def _score(doc: Dict[str, Any]) -> float:
+    score = doc.get("score")
+    return score if score is not None else float("-inf")
+
+
+def merge_top_k(result_lists: List[List[Dict[str, Any]]], top_k: int) -> List[Dict[str, Any]]:
+    """
+    Merge per-namespace results into a global top-k by score.
+    
+    Each list is sorted once, then a k-way heap merge stops after top_k
+    unique documents. Duplicates (same id, or same chunk text indexed in
+    several namespaces) keep their highest-scoring copy.
+    """
+    ordered = [sorted(documents, key=_score, reverse=True) for documents in result_lists]
+    
+    merged = []
+    seen_ids = set()
+    seen_texts = set()
+    for doc in heapq.merge(*ordered, key=_score, reverse=True):
+        text = (doc.get("metadata") or {}).get("text")
+        text_hash = hashlib.sha1(text.encode("utf-8")).digest() if text else None
+        if doc["id"] in seen_ids or (text_hash is not None and text_hash in seen_texts):
+            continue
+        
+        seen_ids.add(doc["id"])
+        if text_hash is not None:
+            seen_texts.add(text_hash)
+        merged.append(doc)
+        if len(merged) >= top_k:
+            break
+    
+    return merged
+
 
 class RetrievalService:
     """
     Service for retrieving similar documents from Pinecone.
     """
 
-    def __init__(self, index_name: str = None):
+    def __init__(self, index_name: str = None, index=None, hedged: bool = None):
+        """
+        Args:
+            index_name: Pinecone index name
+            index: Pre-built index object (e.g. hedging.FakeIndex); skips Pinecone setup
+            hedged: Hedge slow queries (defaults to config.HEDGED_QUERIES)
+        """
         self.index_name = index_name or config.PINECONE_INDEX_NAME
-        self._initialize_pinecone()
+        if index is not None:
+            self.index = index
+        else:
+            self._initialize_pinecone()
+        
+        hedged = config.HEDGED_QUERIES if hedged is None else hedged
+        self.hedger = Hedger("pinecone-query") if hedged else None
+        
+        self._namespace_latency: Dict[str, Dict[str, float]] = {}
+        self._latency_lock = threading.Lock()
+        
+        self.catalog = IndexCatalog(self.index)
+        on_invalidate(self.catalog.mark_stale)
 
     def _initialize_pinecone(self):
         """Initialize Pinecone client and index."""
@@ -34,35 +107,47 @@ class RetrievalService:
 
     def query(
         self,
-        query_vector: List[float],
+        query_vector: Union[np.ndarray, List[float]],
         top_k: int = None,
         namespace: Optional[str] = None,
-        filter_metadata: Optional[Dict[str, Any]] = None
+        filter_metadata: Optional[Dict[str, Any]] = None,
+        include_metadata: bool = True,
+        include_values: bool = False
     ) -> List[Dict[str, Any]]:
 
         top_k = top_k or config.DEFAULT_TOP_K
 
         if top_k > config.MAX_TOP_K:
-            logger.warning(
-                f"top_k={top_k} exceeds MAX_TOP_K={config.MAX_TOP_K}, capping"
-            )
+            logger.warning("top_k=%d exceeds MAX_TOP_K=%d, capping", top_k, config.MAX_TOP_K)
             top_k = config.MAX_TOP_K
 
         query_params = {
-            "vector": query_vector,
+            "vector": as_list(query_vector),
             "top_k": top_k,
-            "include_metadata": True
+            "include_metadata": include_metadata
         }
 
+        if include_values:
+            query_params["include_values"] = True
+
+        namespace = resolve_namespace(namespace)
         if namespace:
             query_params["namespace"] = namespace
 
         if filter_metadata:
             query_params["filter"] = filter_metadata
 
-        logger.info(f"Querying Pinecone: top_k={top_k}, namespace={namespace}")
+        logger.info("Querying Pinecone: top_k=%d, namespace=%s", top_k, namespace)
 
-        response = self.index.query(**query_params)
+        with tracing.span(
+            "pinecone.query", top_k=top_k, namespace=namespace,
+            filtered=bool(filter_metadata), hedged=self.hedger is not None
+        ) as span:
+            if self.hedger is not None:
+                response = self.hedger.call(self.index.query, **query_params)
+            else:
+                response = self.index.query(**query_params)
+            span.set("matches", len(response.get("matches", [])))
 
         matches = [
             {
@@ -73,14 +158,237 @@ class RetrievalService:
             for match in response.get("matches", [])
         ]
 
-        logger.info(f"Retrieved {len(matches)} documents")
+        if include_values:
+            for doc, match in zip(matches, response.get("matches", [])):
+                doc["values"] = match["values"]
+
+        logger.info("Retrieved %d documents", len(matches))
         return matches
 
-    def get_index_stats(self) -> dict:
-        """Get Pinecone index statistics."""
-        stats = self.index.describe_index_stats()
-        return {
-            "dimension": stats.get("dimension"),
-            "total_vector_count": stats.get("total_vector_count"),
-            "namespaces": stats.get("namespaces", {})
+    def resolve_namespaces(
+        self,
+        namespaces: Optional[List[str]] = None,
+        group: Optional[str] = None
+    ) -> List[str]:
+        """
+        Expand a namespace list and/or a NAMESPACE_GROUPS group into a
+        de-duplicated namespace list. The group "all" means every namespace
+        in the index.
+        """
+        resolved = list(namespaces or [])
+        if group == "all":
+            resolved += self.catalog.namespaces()
+        elif group:
+            if group not in config.NAMESPACE_GROUPS:
+                raise ValueError(f"Unknown namespace group '{group}'")
+            resolved += config.NAMESPACE_GROUPS[group]
+        
+        return list(dict.fromkeys(resolved))
+    
+    def fan_out(
+        self,
+        fn: Callable[[str], List[Dict[str, Any]]],
+        namespaces: List[str]
+    ) -> Tuple[List[List[Dict[str, Any]]], Dict[str, Dict[str, Any]]]:
+        """
+        Run fn(namespace) for every namespace concurrently.
+        
+        Results are tagged with their namespace. A failing namespace is
+        logged and reported in the timings; the call only raises if every
+        namespace fails.
+        
+        Returns:
+            (result lists, per-namespace {"latency_ms", "results" | "error"})
+        """
+        def timed(namespace: str):
+            start = time.perf_counter()
+            with tracing.span("fanout.namespace", namespace=namespace) as span:
+                try:
+                    result = fn(namespace)
+                    span.set("results", len(result))
+                    return result, None, time.perf_counter() - start
+                except Exception as e:
+                    span.set("error", type(e).__name__)
+                    return None, e, time.perf_counter() - start
+        
+        with tracing.span("fanout", namespaces=len(namespaces)):
+            futures = {
+                namespace: _fanout_executor.submit(tracing.propagate(timed), namespace)
+                for namespace in namespaces
+            }
+            outcomes = {namespace: future.result() for namespace, future in futures.items()}
+        
+        result_lists = []
+        timings = {}
+        errors = []
+        for namespace, (documents, error, seconds) in outcomes.items():
+            self._record_namespace_latency(namespace, seconds)
+            if error is not None:
+                logger.error("Query failed for namespace=%s: %s", namespace, error)
+                timings[namespace] = {"latency_ms": seconds * 1000, "error": str(error)}
+                errors.append(error)
+                continue
+            
+            for doc in documents:
+                doc["namespace"] = namespace
+            result_lists.append(documents)
+            timings[namespace] = {"latency_ms": seconds * 1000, "results": len(documents)}
+        
+        if errors and not result_lists:
+            raise errors[0]
+        
+        return result_lists, timings
+    
+    def query_namespaces(
+        self,
+        query_vector: Union[np.ndarray, List[float]],
+        namespaces: List[str],
+        top_k: int = None,
+        filter_metadata: Optional[Dict[str, Any]] = None,
+        include_metadata: bool = True
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+        """
+        Query several namespaces concurrently and merge into a global top-k.
+        
+        Returns:
+            (merged matches, per-namespace timings)
+        """
+        top_k = min(top_k or config.DEFAULT_TOP_K, config.MAX_TOP_K)
+        result_lists, timings = self.fan_out(
+            lambda namespace: self.query(
+                query_vector,
+                top_k=top_k,
+                namespace=namespace,
+                filter_metadata=filter_metadata,
+                include_metadata=include_metadata
+            ),
+            namespaces
+        )
+        return merge_top_k(result_lists, top_k), timings
+    
+    def _record_namespace_latency(self, namespace: str, seconds: float):
+        with self._latency_lock:
+            stats = self._namespace_latency.setdefault(namespace, {"queries": 0, "total_ms": 0.0, "max_ms": 0.0})
+            stats["queries"] += 1
+            stats["total_ms"] += seconds * 1000
+            stats["max_ms"] = max(stats["max_ms"], seconds * 1000)
+    
+    def upsert(
+        self,
+        vectors: List[Dict[str, Any]],
+        namespace: Optional[str] = None
+    ):
+        """
+        Upsert vectors ({"id", "values", "metadata"} dicts) in one request.
+        Callers are responsible for keeping batches under Pinecone's limits.
+        """
+        upsert_params = {
+            "vectors": [{**vector, "values": as_list(vector["values"])} for vector in vectors]
         }
+        namespace = resolve_namespace(namespace)
+        if namespace:
+            upsert_params["namespace"] = namespace
+        
+        self.index.upsert(**upsert_params)
+        logger.debug("Upserted %d vectors to namespace=%s", len(vectors), namespace)
+    
+    def delete(
+        self,
+        ids: List[str],
+        namespace: Optional[str] = None,
+        batch_size: int = 1000
+    ):
+        """Delete vectors by id (batched to Pinecone's per-request limit)."""
+        namespace = resolve_namespace(namespace)
+        for i in range(0, len(ids), batch_size):
+            delete_params = {"ids": ids[i:i + batch_size]}
+            if namespace:
+                delete_params["namespace"] = namespace
+            self.index.delete(**delete_params)
+        
+        logger.info("Deleted %d vectors from namespace=%s", len(ids), namespace)
+    
+    def fetch(
+        self,
+        ids: List[str],
+        namespace: Optional[str] = None,
+        include_values: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        Fetch documents by id.
+        
+        Returns:
+            Documents in the same shape as query() matches (score is None)
+        """
+        if not ids:
+            return []
+        
+        fetch_params = {"ids": list(ids)}
+        namespace = resolve_namespace(namespace)
+        if namespace:
+            fetch_params["namespace"] = namespace
+        
+        response = self.index.fetch(**fetch_params)
+        vectors = response.vectors
+        
+        documents = []
+        for doc_id in ids:
+            vector = vectors.get(doc_id)
+            if vector is None:
+                continue
+            doc = {
+                "id": doc_id,
+                "score": None,
+                "metadata": vector.metadata or {}
+            }
+            if include_values:
+                doc["values"] = vector.values
+            documents.append(doc)
+        
+        return documents
+    
+    def iter_documents(
+        self,
+        namespace: Optional[str] = None,
+        batch_size: int = 100
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Iterate over every document (id + metadata) in a namespace.
+        Used to build local indexes from the chunk texts in Pinecone.
+        """
+        list_params = {"limit": batch_size}
+        if namespace:
+            list_params["namespace"] = namespace
+        
+        for id_batch in self.index.list(**list_params):
+            yield from self.fetch(list(id_batch), namespace=namespace)
+
+    def check_namespaces(self, namespaces: List[str]):
+        """
+        Reject unknown or empty namespaces from the cached catalog.
+        
+        Raises:
+            index_catalog.NamespaceNotFound: For the first bad namespace
+        """
+        if not config.NAMESPACE_VALIDATION:
+            return
+        for namespace in namespaces:
+            self.catalog.check_namespace(namespace)
+
+    def get_index_stats(self) -> dict:
+        """Get Pinecone index statistics (cached, see IndexCatalog)."""
+        result = dict(self.catalog.snapshot())
+        result["catalog"] = self.catalog.stats()
+        if self.hedger is not None:
+            result["hedging"] = self.hedger.stats()
+        with self._latency_lock:
+            if self._namespace_latency:
+                result["fanout_latency"] = {
+                    namespace: {
+                        "queries": stats["queries"],
+                        "avg_ms": stats["total_ms"] / stats["queries"],
+                        "max_ms": stats["max_ms"]
+                    }
+                    for namespace, stats in self._namespace_latency.items()
+                }
+        return result
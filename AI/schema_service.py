@@ -1,8 +1,46 @@
 import logging
-from typing import Dict
+import math
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Dict, Mapping, Tuple
 
 logger = logging.getLogger(__name__)
 
+# Shared instructions placed first in every system prompt so the prefix is
+# byte-identical across mark levels (enables provider-side prefix caching).
+STATIC_SYSTEM_PREFIX = """You are an expert academic tutor helping college students prepare for exams.
+You provide answers following strict academic marking schemes.
+
+IMPORTANT RULES:
+- Answer ONLY based on the provided context
+- If context lacks information, state it clearly
+- Use academic language appropriate for college level
+- Structure your answer according to the mark allocation
+- Be precise and exam-focused
+- Do not add information not present in the context
+"""
+
+
+@dataclass(frozen=True)
+class ResolvedSchema:
+    """
+    Immutable, precompiled view of a mark schema.
+    Resolved once per request instead of repeated dict lookups.
+    """
+    marks: int
+    name: str
+    structure: str
+    max_tokens: int
+    temperature: float
+    guidelines: Tuple[str, ...]
+    top_k: int
+    context_tokens: int
+    min_score: float
+    system_prompt: str
+    system_prompt_tokens: int
+    model_tier: str
+    required_sections: Tuple[str, ...]
+
 
 class SchemaService:
     """
@@ -10,13 +48,20 @@ class SchemaService:
     Provides structured prompts for different mark schemes.
     """
     
-    # Mark-based answer schemas
+    # Mark-based answer schemas.
+    # top_k / context_tokens / min_score are the retrieval defaults for the
+    # mark level: short answers fetch less context, essays fetch more.
+    # model is the LLM tier ("fast" or "large", see LLMService.model_for).
     SCHEMAS = {
         1: {
             "name": "1 Mark Answer",
             "structure": "Definition only",
             "max_tokens": 100,
             "temperature": 0.2,
+            "top_k": 2,
+            "context_tokens": 400,
+            "min_score": 0.35,
+            "model": "fast",
             "guidelines": [
                 "Provide only a concise definition",
                 "1-2 sentences maximum",
@@ -29,6 +74,10 @@ class SchemaService:
             "structure": "Definition + Example",
             "max_tokens": 200,
             "temperature": 0.3,
+            "top_k": 3,
+            "context_tokens": 600,
+            "min_score": 0.35,
+            "model": "fast",
             "guidelines": [
                 "Start with a clear definition (1-2 sentences)",
                 "Provide one relevant example",
@@ -41,6 +90,10 @@ class SchemaService:
             "structure": "Definition + Explanation + Example",
             "max_tokens": 300,
             "temperature": 0.3,
+            "top_k": 3,
+            "context_tokens": 900,
+            "min_score": 0.3,
+            "model": "large",
             "guidelines": [
                 "Begin with a clear definition",
                 "Explain the concept in 2-3 sentences",
@@ -53,6 +106,10 @@ class SchemaService:
             "structure": "Definition + Detailed Explanation + Examples",
             "max_tokens": 400,
             "temperature": 0.3,
+            "top_k": 4,
+            "context_tokens": 1200,
+            "min_score": 0.3,
+            "model": "large",
             "guidelines": [
                 "Start with a comprehensive definition",
                 "Provide detailed explanation with key points",
@@ -65,6 +122,10 @@ class SchemaService:
             "structure": "Definition + Explanation + Multiple Examples + Key Points",
             "max_tokens": 500,
             "temperature": 0.3,
+            "top_k": 5,
+            "context_tokens": 1500,
+            "min_score": 0.3,
+            "model": "large",
             "guidelines": [
                 "Begin with a complete definition",
                 "Explain the concept thoroughly",
@@ -78,6 +139,10 @@ class SchemaService:
             "structure": "Comprehensive Coverage",
             "max_tokens": 700,
             "temperature": 0.3,
+            "top_k": 6,
+            "context_tokens": 2000,
+            "min_score": 0.25,
+            "model": "large",
             "guidelines": [
                 "Detailed definition and context",
                 "Thorough explanation with multiple aspects",
@@ -91,6 +156,10 @@ class SchemaService:
             "structure": "Complete Analysis",
             "max_tokens": 1000,
             "temperature": 0.3,
+            "top_k": 8,
+            "context_tokens": 3000,
+            "min_score": 0.25,
+            "model": "large",
             "guidelines": [
                 "Comprehensive definition with context",
                 "Detailed explanation covering all aspects",
@@ -105,6 +174,10 @@ class SchemaService:
             "structure": "In-Depth Essay Style",
             "max_tokens": 1500,
             "temperature": 0.3,
+            "top_k": 10,
+            "context_tokens": 4000,
+            "min_score": 0.2,
+            "model": "large",
             "guidelines": [
                 "Structured with introduction, body, conclusion",
                 "Comprehensive coverage of all aspects",
@@ -117,105 +190,191 @@ class SchemaService:
         }
     }
     
+    # Precompiled schemas keyed by requested marks (filled by compile())
+    _REGISTRY: Mapping[int, ResolvedSchema] = MappingProxyType({})
+    
     @staticmethod
-    def get_schema(marks: int) -> Dict:
+    def estimate_tokens(text: str) -> int:
         """
-        Get the answer schema for given marks.
-        Returns closest available schema if exact match not found.
+        Cheap token estimate (~4 characters per token).
+        Good enough for budgeting without loading a tokenizer.
         """
-        # If exact match exists
+        return math.ceil(len(text) / 4)
+    
+    @staticmethod
+    def _closest_schema_marks(marks: int) -> int:
+        """Return the SCHEMAS key closest to the given marks."""
         if marks in SchemaService.SCHEMAS:
-            return SchemaService.SCHEMAS[marks]
-        
-        # Find closest schema
+            return marks
         available_marks = sorted(SchemaService.SCHEMAS.keys())
-        closest = min(available_marks, key=lambda x: abs(x - marks))
-        
-        logger.info(f"No exact schema for {marks} marks, using {closest} mark schema")
-        return SchemaService.SCHEMAS[closest]
+        return min(available_marks, key=lambda x: abs(x - marks))
     
     @staticmethod
-    def build_system_prompt(marks: int) -> str:
-        """
-        Build system prompt based on mark allocation.
-        """
-        schema = SchemaService.get_schema(marks)
-        
-        system_prompt = f"""You are an expert academic tutor helping college students prepare for exams. 
-You provide answers following strict academic marking schemes.
-
-MARKING SCHEME: {schema['name']}
-STRUCTURE: {schema['structure']}
-
-GUIDELINES:
-{chr(10).join(f"- {guideline}" for guideline in schema['guidelines'])}
-
-IMPORTANT RULES:
-- Answer ONLY based on the provided context
-- If context lacks information, state it clearly
-- Use academic language appropriate for college level
-- Structure your answer according to the mark allocation
-- Be precise and exam-focused
-- Do not add information not present in the context
-
-FORMAT YOUR ANSWER AS:
-"""
-        
-        # Add format based on marks
+    def _answer_format(marks: int) -> str:
+        """Answer layout for the requested marks (not the closest schema's)."""
         if marks == 1:
-            system_prompt += "\nDefinition: [Your concise definition here]"
+            return "Definition: [Your concise definition here]"
         
-        elif marks == 2:
-            system_prompt += """
-Definition: [Clear definition]
+        if marks == 2:
+            return """Definition: [Clear definition]
 Example: [One relevant example]"""
         
-        elif marks == 3:
-            system_prompt += """
-Definition: [Clear definition]
+        if marks == 3:
+            return """Definition: [Clear definition]
 Explanation: [Brief explanation]
 Example: [Relevant example]"""
         
-        elif marks >= 4 and marks <= 5:
-            system_prompt += """
-Definition: [Comprehensive definition]
+        if 4 <= marks <= 5:
+            return """Definition: [Comprehensive definition]
 Explanation: [Detailed explanation with key points]
 Examples: [1-2 relevant examples]"""
         
-        elif marks >= 7 and marks <= 10:
-            system_prompt += """
-Definition: [Complete definition with context]
+        if 7 <= marks <= 10:
+            return """Definition: [Complete definition with context]
 Explanation: [Thorough explanation covering multiple aspects]
 Examples: [Multiple diverse examples]
 Key Points/Applications: [Important aspects or real-world applications]"""
         
-        else:  # 15 marks or more
-            system_prompt += """
-Introduction: [Brief overview]
+        # 15 marks or more
+        return """Introduction: [Brief overview]
 Definition: [Comprehensive definition]
 Detailed Explanation: [Cover all major aspects]
 Examples: [Multiple detailed examples]
 Applications/Types: [Practical applications or classifications]
 Analysis: [Critical evaluation]
 Conclusion: [Summary of key points]"""
+    
+    @staticmethod
+    def _required_sections(marks: int) -> Tuple[str, ...]:
+        """Section labels ("Definition:", ...) the answer format asks for."""
+        return tuple(
+            line.split(":", 1)[0].strip() + ":"
+            for line in SchemaService._answer_format(marks).splitlines()
+            if ":" in line
+        )
+    
+    @staticmethod
+    def check_structure(answer: str, schema: ResolvedSchema) -> bool:
+        """
+        Cheap structural check: every required section label is present.
+        Case-insensitive, so markdown variants like **Definition:** pass.
+        """
+        lowered = answer.lower()
+        return bool(answer.strip()) and all(
+            section.lower() in lowered for section in schema.required_sections
+        )
+    
+    @staticmethod
+    def _render_system_prompt(schema_marks: int, marks: int = None) -> str:
+        """
+        Render the system prompt for a schema and the requested marks.
+        Static instructions first, mark-specific parts last.
+        """
+        marks = marks if marks is not None else schema_marks
+        schema = SchemaService.SCHEMAS[schema_marks]
+        guidelines = "\n".join(f"- {guideline}" for guideline in schema['guidelines'])
+        
+        return f"""{STATIC_SYSTEM_PREFIX}
+MARKING SCHEME: {schema['name']}
+STRUCTURE: {schema['structure']}
+
+GUIDELINES:
+{guidelines}
+
+FORMAT YOUR ANSWER AS:
+{SchemaService._answer_format(marks)}"""
+    
+    @staticmethod
+    def compile() -> None:
+        """
+        Precompile the schema and system prompt for every valid marks value.
+        Called once at import; call again after editing SCHEMAS.
+        
+        Settings come from the closest schema, but the answer format follows
+        the requested marks (6 marks uses the essay format, like 11-14).
+        Marks sharing both resolve to the same object.
+        """
+        compiled: Dict[Tuple[int, str], ResolvedSchema] = {}
+        registry: Dict[int, ResolvedSchema] = {}
+        for marks in range(1, 21):
+            schema_marks = SchemaService._closest_schema_marks(marks)
+            key = (schema_marks, SchemaService._answer_format(marks))
+            if key in compiled:
+                registry[marks] = compiled[key]
+                continue
+            
+            schema = SchemaService.SCHEMAS[schema_marks]
+            system_prompt = SchemaService._render_system_prompt(schema_marks, marks)
+            compiled[key] = registry[marks] = ResolvedSchema(
+                marks=schema_marks,
+                name=schema['name'],
+                structure=schema['structure'],
+                max_tokens=schema['max_tokens'],
+                temperature=schema['temperature'],
+                guidelines=tuple(schema['guidelines']),
+                top_k=schema['top_k'],
+                context_tokens=schema['context_tokens'],
+                min_score=schema['min_score'],
+                system_prompt=system_prompt,
+                system_prompt_tokens=SchemaService.estimate_tokens(system_prompt),
+                model_tier=schema.get('model', 'large'),
+                required_sections=SchemaService._required_sections(marks)
+            )
         
-        return system_prompt
+        SchemaService._REGISTRY = MappingProxyType(registry)
+        logger.info("Compiled %d answer schemas", len(compiled))
+    
+    @staticmethod
+    def resolve(marks: int) -> ResolvedSchema:
+        """
+        Validate marks and return the precompiled schema.
+        Single lookup per request.
+        """
+        return SchemaService._REGISTRY[SchemaService.validate_marks(marks)]
+    
+    @staticmethod
+    def get_schema(marks: int) -> Dict:
+        """
+        Get the answer schema for given marks.
+        Returns closest available schema if exact match not found.
+        """
+        closest = SchemaService._closest_schema_marks(marks)
+        if closest != marks:
+            logger.info("No exact schema for %d marks, using %d mark schema", marks, closest)
+        return SchemaService.SCHEMAS[closest]
+    
+    @staticmethod
+    def build_system_prompt(marks: int) -> str:
+        """
+        Build system prompt based on mark allocation.
+        """
+        return SchemaService.resolve(marks).system_prompt
     
     @staticmethod
     def build_user_prompt(query: str, context: str, marks: int) -> str:
         """
         Build user prompt with context and query.
         """
-        schema = SchemaService.get_schema(marks)
-        
-        prompt = f"""Context Information:
+        schema = SchemaService.resolve(marks)
+        return SchemaService.render_user_prompt(query, context, schema, marks)
+    
+    @staticmethod
+    def render_user_prompt(
+        query: str,
+        context: str,
+        schema: ResolvedSchema,
+        marks: int = None
+    ) -> str:
+        """
+        Build user prompt from an already resolved schema.
+        """
+        marks = marks if marks is not None else schema.marks
+        return f"""Context Information:
 {context}
 
 Question ({marks} marks): {query}
 
-Provide a {schema['name']} following the structure: {schema['structure']}"""
-        
-        return prompt
+Provide a {schema.name} following the structure: {schema.structure}"""
     
     @staticmethod
     def get_temperature(marks: int) -> float:
@@ -223,16 +382,14 @@ Provide a {schema['name']} following the structure: {schema['structure']}"""
         Get appropriate temperature based on marks.
         Lower marks need more precision, higher marks allow more creativity.
         """
-        schema = SchemaService.get_schema(marks)
-        return schema['temperature']
+        return SchemaService.resolve(marks).temperature
     
     @staticmethod
     def get_max_tokens(marks: int) -> int:
         """
         Get appropriate max tokens based on marks.
         """
-        schema = SchemaService.get_schema(marks)
-        return schema['max_tokens']
+        return SchemaService.resolve(marks).max_tokens
     
     @staticmethod
     def validate_marks(marks: int) -> int:
@@ -240,11 +397,14 @@ Provide a {schema['name']} following the structure: {schema['structure']}"""
         Validate and normalize marks value.
         """
         if marks < 1:
-            logger.warning(f"Invalid marks {marks}, setting to 1")
+            logger.warning("Invalid marks %s, setting to 1", marks)
             return 1
         
         if marks > 20:
-            logger.warning(f"Marks {marks} too high, capping at 15")
+            logger.warning("Marks %s too high, capping at 15", marks)
             return 15
         
-        return marks
\ No newline at end of file
+        return marks
+
+
+SchemaService.compile()
\ No newline at end of file
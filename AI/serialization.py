@@ -0,0 +1,131 @@
+import base64
+import logging
+from typing import Any, Optional, Sequence
+
+import numpy as np
+import orjson
+from fastapi.responses import ORJSONResponse, Response
+
+logger = logging.getLogger(__name__)
+
+# Supported vector encodings for /embed
+ENCODING_JSON = "json"
+ENCODING_BASE64 = "base64"
+ENCODING_BINARY = "binary"
+
+VECTOR_ENCODINGS = (ENCODING_JSON, ENCODING_BASE64, ENCODING_BINARY)
+
+# Media types clients can put in the Accept header
+BINARY_MEDIA_TYPE = "application/octet-stream"
+BASE64_MEDIA_TYPE = "application/vnd.rag.embedding+base64"
+
+# Little-endian float32, the wire format for binary/base64 vectors
+VECTOR_DTYPE = "<f4"
+
+
+class FastJSONResponse(ORJSONResponse):
+    """
+    orjson-backed JSON response.
+    Serializes numpy arrays natively and skips Pydantic re-validation.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(
+            content,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        )
+
+
+def negotiate_vector_encoding(
+    accept: Optional[str] = None,
+    encoding: Optional[str] = None
+) -> str:
+    """
+    Pick the vector encoding for a response.
+
+    An explicit `encoding` flag wins over the Accept header.
+    JSON is the default when neither asks for anything else.
+
+    Args:
+        accept: Raw Accept header value
+        encoding: Explicit encoding query flag
+
+    Returns:
+        One of VECTOR_ENCODINGS
+    """
+    if encoding:
+        encoding = encoding.lower()
+        if encoding not in VECTOR_ENCODINGS:
+            raise ValueError(
+                f"Unsupported encoding '{encoding}', expected one of {VECTOR_ENCODINGS}"
+            )
+        return encoding
+
+    if accept:
+        media_types = [part.split(";")[0].strip().lower() for part in accept.split(",")]
+        if BINARY_MEDIA_TYPE in media_types:
+            return ENCODING_BINARY
+        if BASE64_MEDIA_TYPE in media_types:
+            return ENCODING_BASE64
+
+    return ENCODING_JSON
+
+
+def vector_to_bytes(vector: Sequence[float]) -> bytes:
+    """Pack a vector as contiguous little-endian float32 bytes."""
+    return np.asarray(vector, dtype=VECTOR_DTYPE).tobytes()
+
+
+def vector_from_bytes(data: bytes) -> np.ndarray:
+    """Unpack little-endian float32 bytes into a numpy vector."""
+    return np.frombuffer(data, dtype=VECTOR_DTYPE)
+
+
+def vector_to_base64(vector: Sequence[float]) -> str:
+    """Encode a vector as base64 of its float32 bytes."""
+    return base64.b64encode(vector_to_bytes(vector)).decode("ascii")
+
+
+def embedding_response(
+    text: str,
+    embedding: Sequence[float],
+    model_name: str,
+    encoding: str = ENCODING_JSON
+) -> Response:
+    """
+    Build the /embed response in the negotiated encoding.
+
+    Args:
+        text: Input text
+        embedding: Embedding vector
+        model_name: Name of the embedding model
+        encoding: One of VECTOR_ENCODINGS
+
+    Returns:
+        Binary or JSON response
+    """
+    dimension = len(embedding)
+
+    if encoding == ENCODING_BINARY:
+        return Response(
+            content=vector_to_bytes(embedding),
+            media_type=BINARY_MEDIA_TYPE,
+            headers={
+                "X-Embedding-Dimension": str(dimension),
+                "X-Embedding-Dtype": "float32-le",
+                "X-Embedding-Model": model_name
+            }
+        )
+
+    if encoding == ENCODING_BASE64:
+        payload_embedding: Any = vector_to_base64(embedding)
+    else:
+        payload_embedding = embedding
+
+    return FastJSONResponse({
+        "text": text,
+        "embedding": payload_embedding,
+        "encoding": encoding,
+        "dimension": dimension,
+        "model": model_name
+    })
\ No newline at end of file
@@ -0,0 +1,59 @@
+"""
+Shared pytest setup.
+
+Modules live flat in AI/, so the tests import them the way the service
+does. Every local store (BM25 index, chunk store, manifests, checkpoints,
+generation files) is redirected to a per-test temporary directory.
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import config  # noqa: E402
+
+DATA_DIRS = (
+    "LEXICAL_INDEX_DIR",
+    "CHUNK_STORE_DIR",
+    "INGEST_CHECKPOINT_DIR",
+    "INDEX_MANIFEST_DIR",
+    "GENERATIONS_DIR",
+    "ANSWER_BANK_DIR",
+)
+
+
+@pytest.fixture(autouse=True)
+def data_dirs(tmp_path, monkeypatch):
+    """Point every on-disk store at tmp_path/<name>."""
+    for name in DATA_DIRS:
+        monkeypatch.setattr(config, name, str(tmp_path / name.lower()))
+    monkeypatch.setattr(config, "PINECONE_NAMESPACE", None)
+    return tmp_path
+
+
+class FakeRetrievalService:
+    """In-memory stand-in for RetrievalService's write path."""
+
+    def __init__(self):
+        self.vectors = {}
+        self.deleted = []
+
+    def upsert(self, vectors, namespace=None):
+        for vector in vectors:
+            self.vectors[(namespace, vector["id"])] = vector
+
+    def delete(self, ids, namespace=None):
+        self.deleted.extend(ids)
+        for doc_id in ids:
+            self.vectors.pop((namespace, doc_id), None)
+
+    def ids(self, namespace=None):
+        return {doc_id for ns, doc_id in self.vectors if ns == namespace}
+
+
+@pytest.fixture
+def retrieval_service():
+    return FakeRetrievalService()
@@ -0,0 +1,82 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from answer_bank import AnswerBank, iter_answer_chunks, normalize_query
+from config import config
+
+
+@pytest.mark.parametrize("query,normalized", [
+    ("What is Paging?", "what is paging"),
+    ("  what   is\tpaging ", "what is paging"),
+    ("Explain C++'s RAII.", "explain c s raii"),
+    ("", ""),
+])
+def test_normalize_query(query, normalized):
+    assert normalize_query(query) == normalized
+
+
+def test_answer_chunks_reassemble_on_word_boundaries():
+    answer = " ".join(f"word{i}" for i in range(100))
+    chunks = list(iter_answer_chunks(answer, chunk_chars=32))
+    assert "".join(chunks) == answer
+    assert all(len(chunk) <= 32 for chunk in chunks)
+    assert all(chunk.endswith(" ") for chunk in chunks[:-1])
+
+
+def write_bank(path, entries, embeddings):
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, "entries.json"), "w") as f:
+        json.dump(entries, f)
+    np.save(os.path.join(path, "embeddings.npy"), np.asarray(embeddings, dtype=np.float32))
+
+
+def entry(query, marks=5, namespace=None):
+    return {
+        "query": query, "normalized": normalize_query(query), "marks": marks, "namespace": namespace,
+        "generation": 0, "source_ids": [], "result": {"answer": f"answer to {query}"}
+    }
+
+
+def test_exact_and_embedding_lookup(monkeypatch):
+    monkeypatch.setattr(config, "ANSWER_BANK_SIMILARITY", 0.9)
+    write_bank(config.ANSWER_BANK_DIR, [entry("What is paging?"), entry("What is a mutex?")], [[1, 0], [0, 1]])
+    bank = AnswerBank()
+
+    exact = bank.lookup("what is PAGING", 5)
+    assert exact["match"] == "exact" and exact["entry"]["query"] == "What is paging?"
+    assert bank.lookup("What is paging?", 10) is None
+
+    similar = bank.lookup("Define a mutex", 5, embed=lambda query: [0.1, 0.99])
+    assert similar["match"] == "embedding" and similar["entry"]["query"] == "What is a mutex?"
+    assert bank.lookup("Unrelated", 5, embed=lambda query: [0.7, 0.7]) is None
+    assert bank.stats()["hits"] == {"exact": 1, "embedding": 1}
+
+
+def test_requests_without_namespace_find_default_namespace_entries(monkeypatch):
+    monkeypatch.setattr(config, "PINECONE_NAMESPACE", "cs101")
+    # Built by the CLI, whose --namespace defaults to PINECONE_NAMESPACE
+    write_bank(config.ANSWER_BANK_DIR, [entry("What is paging?", namespace="cs101")], [[1, 0]])
+    bank = AnswerBank()
+
+    assert bank.lookup("What is paging?", 5) is not None
+    assert bank.lookup("What is paging?", 5, namespace="cs101") is not None
+    assert bank.lookup("What is paging?", 5, namespace="other") is None
+
+
+def test_answer_bank_eligible_compares_with_schema_defaults():
+    for module in ("pinecone", "groq", "sentence_transformers"):
+        pytest.importorskip(module)
+    from rag_pipeline import RAGPipeline
+    from schema_service import SchemaService
+
+    schema = SchemaService.resolve(5)
+    assert RAGPipeline.answer_bank_eligible(schema, top_k=None, namespaces=[], filter_metadata={})
+    assert RAGPipeline.answer_bank_eligible(schema, top_k=schema.top_k, temperature=schema.temperature)
+    assert RAGPipeline.answer_bank_eligible(schema, diversify=config.MMR_DIVERSITY)
+    assert not RAGPipeline.answer_bank_eligible(schema, top_k=schema.top_k + 1)
+    assert not RAGPipeline.answer_bank_eligible(schema, diversify=not config.MMR_DIVERSITY)
+    assert not RAGPipeline.answer_bank_eligible(schema, custom_system_prompt="Be brief")
+    assert not RAGPipeline.answer_bank_eligible(schema, namespaces=["a", "b"])
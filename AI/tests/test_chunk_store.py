@@ -0,0 +1,75 @@
+import os
+
+from config import config
+from chunk_store import ChunkStore, ChunkStoreManager
+
+
+def build_store(path, count=10):
+    store = ChunkStore(path)
+    store.build((f"id{i}", {"text": f"text {i}"}) for i in range(count))
+    return store
+
+
+def test_build_and_get(tmp_path):
+    store = build_store(str(tmp_path / "store"))
+    assert len(store) == 10
+    assert store.get("id3") == {"text": "text 3"}
+    assert store.get("missing") is None
+    assert dict(store.items())["id9"] == {"text": "text 9"}
+
+
+def test_update_appends_without_rewriting(tmp_path):
+    path = str(tmp_path / "store")
+    store = build_store(path)
+    data_path = os.path.join(path, "chunks.bin")
+    inode, size = os.stat(data_path).st_ino, os.path.getsize(data_path)
+
+    store.update(upserts={"id1": {"text": "new 1"}, "idx": {"text": "x"}}, deletes=["id2"])
+
+    assert os.stat(data_path).st_ino == inode
+    assert os.path.getsize(data_path) > size
+    assert store.get("id1") == {"text": "new 1"}
+    assert store.get("id2") is None
+    assert store.get("idx") == {"text": "x"}
+    assert store.stats()["dead_records"] == 2
+
+    reopened = ChunkStore(path)
+    assert len(reopened) == 10
+    assert reopened.get("id1") == {"text": "new 1"}
+
+
+def test_update_compacts_past_ratio(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "CHUNK_STORE_COMPACT_RATIO", 0.3)
+    path = str(tmp_path / "store")
+    store = build_store(path)
+
+    store.update(upserts={f"id{i}": {"text": "v2"} for i in range(5)})
+
+    assert store.stats()["dead_records"] == 0
+    assert len(store) == 10
+    assert store.get("id4") == {"text": "v2"}
+    assert store.get("id7") == {"text": "text 7"}
+
+
+def test_update_creates_missing_store(tmp_path):
+    store = ChunkStore(str(tmp_path / "store"))
+    store.update(upserts={"a": {"text": "a"}})
+    assert store.get("a") == {"text": "a"}
+
+
+def test_manager_closes_evicted_stores(monkeypatch):
+    monkeypatch.setattr(config, "LOCAL_INDEX_MAX_NAMESPACES", 1)
+    manager = ChunkStoreManager()
+    first = manager.get("a")
+    first.update(upserts={"x": {"text": "x"}})
+    manager.get("b")
+    assert first.get("x") is None
+    assert list(manager.stats()) == ["b"]
+
+
+def test_resolve_reports_missing_ids():
+    manager = ChunkStoreManager()
+    manager.get("ns").update(upserts={"x": {"text": "x"}})
+    documents, missing = manager.resolve([{"id": "x", "score": 0.9}, {"id": "y", "score": 0.5}], namespace="ns")
+    assert documents[0]["metadata"] == {"text": "x"}
+    assert missing == ["y"]
@@ -0,0 +1,85 @@
+import threading
+import time
+
+import pytest
+
+import deadline as deadline_module
+from config import config
+from deadline import Deadline, DeadlineExceeded, run_stage
+
+
+@pytest.fixture
+def release():
+    """Event that unblocks stalled stage calls at the end of a test."""
+    event = threading.Event()
+    yield event
+    event.set()
+    # Let abandoned calls return so the counters settle for the next test
+    for _ in range(200):
+        if deadline_module.stats()["abandoned"]["running"] == 0:
+            break
+        time.sleep(0.01)
+
+
+def test_from_request_precedence():
+    assert Deadline.from_request("500", 200).budget == pytest.approx(0.2)
+    assert Deadline.from_request("500").budget == pytest.approx(0.5)
+    assert Deadline.from_request("bogus").budget == pytest.approx(config.REQUEST_DEADLINE_MS / 1000)
+    assert not Deadline.from_request().enforced
+    assert Deadline.from_request("500").enforced
+
+
+def test_stage_timeout_is_share_of_remaining(monkeypatch):
+    monkeypatch.setitem(config.DEADLINE_STAGE_SHARES, "embed", 0.25)
+    deadline = Deadline(1000)
+    assert 0.2 < deadline.stage_timeout("embed") <= 0.25
+    assert deadline.stage_timeout("unknown") <= 1.0
+
+
+def test_no_deadline_runs_inline():
+    assert run_stage("embed", None, threading.current_thread) is threading.current_thread()
+
+
+def test_default_deadline_runs_inline():
+    assert run_stage("embed", Deadline(), threading.current_thread) is threading.current_thread()
+
+
+def test_enforced_deadline_abandons_stalled_call(release):
+    deadline = Deadline(100)
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded) as raised:
+        run_stage("retrieve", deadline, release.wait)
+    assert raised.value.stage == "retrieve"
+    assert time.monotonic() - start < 1.0
+    assert deadline_module.stats()["abandoned"]["running"] >= 1
+
+
+def test_expired_deadline_skips_stage():
+    calls = []
+    deadline = Deadline(1)
+    time.sleep(0.01)
+    with pytest.raises(DeadlineExceeded):
+        run_stage("llm", deadline, calls.append, "ran")
+    assert calls == []
+
+
+def test_fails_fast_once_abandoned_calls_pile_up(monkeypatch, release):
+    monkeypatch.setattr(config, "DEADLINE_MAX_ABANDONED", 2)
+    for _ in range(2):
+        with pytest.raises(DeadlineExceeded):
+            run_stage("retrieve", Deadline(50), release.wait)
+
+    rejected = deadline_module.stats()["abandoned"]["rejected"]
+    calls = []
+    with pytest.raises(DeadlineExceeded):
+        run_stage("retrieve", Deadline(5000), calls.append, "ran")
+    assert calls == []
+    assert deadline_module.stats()["abandoned"]["rejected"] == rejected + 1
+
+    # Capacity comes back once the stalled calls return
+    release.set()
+    for _ in range(200):
+        if deadline_module.stats()["abandoned"]["running"] == 0:
+            break
+        time.sleep(0.01)
+    assert run_stage("retrieve", Deadline(5000), lambda: "ok") == "ok"
@@ -0,0 +1,34 @@
+import numpy as np
+
+from diversity import mmr_select
+
+QUERY = [1.0, 0.0, 0.0]
+# Two near-duplicates of the best match, then a less relevant but distinct chunk
+CANDIDATES = [[0.9, 0.1, 0.0], [0.9, 0.11, 0.0], [0.6, 0.0, 0.8]]
+
+
+def test_relevance_only_ranks_by_similarity():
+    assert mmr_select(QUERY, CANDIDATES, k=3, lambda_mult=1.0) == [0, 1, 2]
+
+
+def test_diversity_skips_near_duplicate():
+    assert mmr_select(QUERY, CANDIDATES, k=2, lambda_mult=0.5) == [0, 2]
+
+
+def test_redundancy_threshold_drops_duplicates():
+    assert mmr_select(QUERY, CANDIDATES, k=3, lambda_mult=1.0, redundancy_threshold=0.99) == [0, 2]
+
+
+def test_token_budget_skips_candidates_that_do_not_fit():
+    picked = mmr_select(QUERY, CANDIDATES, k=3, lambda_mult=1.0, token_costs=[300, 300, 100], token_budget=400)
+    assert picked == [0, 2]
+
+
+def test_first_pick_always_fits_budget():
+    assert mmr_select(QUERY, CANDIDATES, k=3, token_costs=[900, 900, 900], token_budget=100) == [0]
+
+
+def test_unnormalized_vectors_and_edge_cases():
+    assert mmr_select(QUERY, np.asarray(CANDIDATES) * 10, k=1) == [0]
+    assert mmr_select(QUERY, [], k=3) == []
+    assert mmr_select(QUERY, CANDIDATES, k=0) == []
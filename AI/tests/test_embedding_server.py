@@ -0,0 +1,87 @@
+import json
+import socket
+import struct
+import threading
+
+import numpy as np
+import pytest
+
+from embedding_server import (
+    OP_EMBED,
+    OP_EMBED_NOCACHE,
+    OP_INFO,
+    STATUS_ERROR,
+    STATUS_OK,
+    EmbeddingClient,
+    decode_request,
+    encode_request,
+    encode_response,
+)
+
+FRAME = struct.Struct("<I")
+
+
+def unframe(data):
+    (length,) = FRAME.unpack_from(data)
+    assert len(data) == FRAME.size + length
+    return data[FRAME.size:]
+
+
+@pytest.mark.parametrize("texts", [[], ["a"], ["paging", "", "ünïcode ✓", "x" * 10000]])
+def test_request_round_trip(texts):
+    assert decode_request(unframe(encode_request(OP_EMBED, texts))) == (OP_EMBED, texts)
+
+
+def test_response_header_and_little_endian_payload():
+    vectors = np.arange(6, dtype=np.float32).reshape(2, 3)
+    body = unframe(encode_response(STATUS_OK, vectors))
+    status, count, dim = struct.unpack_from("<BII", body)
+    assert (status, count, dim) == (STATUS_OK, 2, 3)
+    assert np.array_equal(np.frombuffer(body[9:], dtype="<f4").reshape(2, 3), vectors)
+
+
+def serve_one_client(listener, handle):
+    conn, _ = listener.accept()
+    with conn:
+        while True:
+            header = conn.recv(FRAME.size, socket.MSG_WAITALL)
+            if not header:
+                return
+            body = conn.recv(FRAME.unpack(header)[0], socket.MSG_WAITALL)
+            conn.sendall(handle(*decode_request(body)))
+
+
+@pytest.fixture
+def server(tmp_path):
+    """Minimal server speaking the wire protocol, without a model."""
+    path = str(tmp_path / "embed.sock")
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.listen(1)
+    calls = []
+
+    def handle(op, texts):
+        calls.append((op, texts))
+        if op == OP_INFO:
+            return encode_response(STATUS_OK, payload=json.dumps({"model": "fake", "dimension": 2}).encode())
+        if texts == ["fail"]:
+            return encode_response(STATUS_ERROR, payload=b"boom")
+        return encode_response(STATUS_OK, np.array([[len(text), 1.0] for text in texts], dtype=np.float32))
+
+    thread = threading.Thread(target=serve_one_client, args=(listener, handle), daemon=True)
+    thread.start()
+    yield path, calls
+    listener.close()
+
+
+def test_client_against_protocol_server(server):
+    path, calls = server
+    client = EmbeddingClient(path, timeout=5)
+
+    assert client.info() == {"model": "fake", "dimension": 2}
+    vectors = client.embed(["ab", "abcd"], use_cache=False)
+    assert vectors.dtype == np.float32 and vectors.tolist() == [[2.0, 1.0], [4.0, 1.0]]
+    assert calls[-1] == (OP_EMBED_NOCACHE, ["ab", "abcd"])
+
+    with pytest.raises(RuntimeError, match="boom"):
+        client.embed(["fail"])
@@ -0,0 +1,84 @@
+import threading
+import time
+
+import pytest
+
+from config import config
+from hedging import HedgeBudget, Hedger, LatencyTracker
+
+
+def test_budget_allows_burst_then_ratio():
+    budget = HedgeBudget(ratio=0.25, burst=2.0)
+    assert budget.try_spend() and budget.try_spend()
+    assert not budget.try_spend()
+
+    for _ in range(3):
+        budget.on_call()
+    assert not budget.try_spend()
+    budget.on_call()
+    assert budget.try_spend()
+
+
+def test_budget_refill_is_capped_at_burst():
+    budget = HedgeBudget(ratio=1.0, burst=3.0)
+    for _ in range(100):
+        budget.on_call()
+    assert sum(budget.try_spend() for _ in range(10)) == 3
+
+
+def test_tracker_needs_min_samples():
+    tracker = LatencyTracker(window=100, percentile=90, min_samples=10)
+    for i in range(9):
+        tracker.record(i / 1000)
+    assert tracker.threshold() is None
+    tracker.record(0.009)
+    assert tracker.threshold() == pytest.approx(0.0081)
+
+
+def test_slow_primary_is_hedged(monkeypatch):
+    monkeypatch.setattr(config, "HEDGE_INITIAL_DELAY_MS", 20)
+    monkeypatch.setattr(config, "HEDGE_MIN_DELAY_MS", 0)
+    hedger = Hedger("test", budget_ratio=1.0, max_workers=4)
+    release = threading.Event()
+    calls = []
+
+    def query():
+        calls.append(None)
+        if len(calls) == 1:
+            release.wait(5)  # the primary stalls
+            return "primary"
+        return "hedge"
+
+    try:
+        assert hedger.call(query) == "hedge"
+    finally:
+        release.set()
+    stats = hedger.stats()
+    assert stats["hedged"] == 1 and stats["hedge_wins"] == 1
+
+
+def test_denied_hedge_waits_for_primary(monkeypatch):
+    monkeypatch.setattr(config, "HEDGE_INITIAL_DELAY_MS", 5)
+    monkeypatch.setattr(config, "HEDGE_MIN_DELAY_MS", 0)
+    hedger = Hedger("test", budget_ratio=0.0, max_workers=4)
+    hedger.budget._tokens = 0.0
+
+    def query():
+        time.sleep(0.05)
+        return "primary"
+
+    assert hedger.call(query) == "primary"
+    assert hedger.stats()["budget_denied"] == 1
+
+
+def test_error_raised_only_when_every_attempt_fails(monkeypatch):
+    monkeypatch.setattr(config, "HEDGE_INITIAL_DELAY_MS", 5)
+    monkeypatch.setattr(config, "HEDGE_MIN_DELAY_MS", 0)
+    hedger = Hedger("test", budget_ratio=1.0, max_workers=4)
+
+    def query():
+        time.sleep(0.05)
+        raise TimeoutError("pinecone")
+
+    with pytest.raises(TimeoutError):
+        hedger.call(query)
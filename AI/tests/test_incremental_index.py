@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+from chunk_store import ChunkStoreManager
+from incremental_index import IncrementalIndexer, IndexManifest
+from invalidation import get_generation
+from lexical_index import LexicalIndexManager
+
+NAMESPACE = "notes"
+
+
+class FakeEmbeddingService:
+    def __init__(self):
+        self.embedded = 0
+
+    def embed_batch(self, texts):
+        self.embedded += len(texts)
+        return np.ones((len(texts), 4), dtype=np.float32)
+
+
+@pytest.fixture
+def source(tmp_path):
+    directory = tmp_path / "source"
+    directory.mkdir()
+    paragraphs = [f"Paragraph {i} about topic{i} with enough words to fill a chunk." for i in range(30)]
+    (directory / "a.txt").write_text("\n\n".join(paragraphs))
+    (directory / "b.txt").write_text("Short note on paging.")
+    return directory
+
+
+def indexer(retrieval_service, embedding_service=None):
+    return IncrementalIndexer(
+        retrieval_service=retrieval_service,
+        embedding_service=embedding_service or FakeEmbeddingService(),
+        namespace=NAMESPACE,
+        chunk_size=200,
+        chunk_overlap=20
+    )
+
+
+def test_first_run_indexes_everything(retrieval_service, source):
+    summary = indexer(retrieval_service).run(str(source))
+
+    manifest = IndexManifest.load(NAMESPACE)
+    chunk_ids = {chunk_id for entry in manifest.documents.values() for chunk_id in entry["chunks"]}
+    assert summary["upserts"] == len(chunk_ids) and summary["deletes"] == 0
+    assert retrieval_service.ids(NAMESPACE) == chunk_ids
+    assert len(ChunkStoreManager().get(NAMESPACE)) == len(chunk_ids)
+    assert get_generation(NAMESPACE) != 0
+
+
+def test_unchanged_directory_plans_nothing(retrieval_service, source):
+    indexer(retrieval_service).run(str(source))
+    embedding_service = FakeEmbeddingService()
+
+    plan = indexer(retrieval_service, embedding_service).plan(str(source))
+
+    assert plan.is_empty and plan.unchanged_documents == 2
+    assert embedding_service.embedded == 0
+
+
+def test_edit_reembeds_only_changed_chunks(retrieval_service, source):
+    indexer(retrieval_service).run(str(source))
+    before = IndexManifest.load(NAMESPACE).documents["a.txt"]["chunks"]
+
+    text = (source / "a.txt").read_text().replace("topic15", "topic15 revised")
+    (source / "a.txt").write_text(text)
+    embedding_service = FakeEmbeddingService()
+    summary = indexer(retrieval_service, embedding_service).run(str(source))
+
+    after = IndexManifest.load(NAMESPACE).documents["a.txt"]["chunks"]
+    assert summary["changed_documents"] == 1 and summary["unchanged_documents"] == 1
+    assert 0 < summary["upserts"] < len(after)
+    assert embedding_service.embedded == summary["upserts"]
+    assert set(retrieval_service.deleted) == set(before) - set(after)
+    assert retrieval_service.ids(NAMESPACE) == {
+        chunk_id for entry in IndexManifest.load(NAMESPACE).documents.values() for chunk_id in entry["chunks"]
+    }
+
+
+def test_removed_document_is_deleted_everywhere(retrieval_service, source):
+    indexer(retrieval_service).run(str(source))
+    removed = set(IndexManifest.load(NAMESPACE).documents["b.txt"]["chunks"])
+
+    (source / "b.txt").unlink()
+    summary = indexer(retrieval_service).run(str(source))
+
+    assert summary["removed_documents"] == 1
+    assert "b.txt" not in IndexManifest.load(NAMESPACE).documents
+    assert removed <= set(retrieval_service.deleted)
+    assert not {hit["id"] for hit in LexicalIndexManager().get(NAMESPACE).search("paging", top_k=10)} & removed
+    assert all(ChunkStoreManager().get(NAMESPACE).get(chunk_id) is None for chunk_id in removed)
+
+
+def test_dry_run_changes_nothing(retrieval_service, source):
+    summary = indexer(retrieval_service).run(str(source), dry_run=True)
+    assert summary["upserts"] > 0
+    assert not retrieval_service.vectors
+    assert IndexManifest.load(NAMESPACE).documents == {}
@@ -0,0 +1,146 @@
+import threading
+import time
+
+import pytest
+
+from index_catalog import IndexCatalog, NamespaceNotFound
+
+
+class StatsIndex:
+    """describe_index_stats stand-in with editable namespaces."""
+
+    def __init__(self, namespaces=None, delay=0.0):
+        self.namespaces = dict(namespaces or {})
+        self.delay = delay
+        self.fail = False
+        self.calls = 0
+
+    def describe_index_stats(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.fail:
+            raise ConnectionError("pinecone unreachable")
+        return {
+            "dimension": 3,
+            "total_vector_count": sum(self.namespaces.values()),
+            "namespaces": {name: {"vector_count": n} for name, n in self.namespaces.items()}
+        }
+
+
+def test_unknown_and_empty_namespaces_are_rejected():
+    catalog = IndexCatalog(StatsIndex({"cs101": 10, "empty": 0}), recheck_seconds=60)
+    catalog.check_namespace("cs101")
+    with pytest.raises(NamespaceNotFound, match="Unknown"):
+        catalog.check_namespace("missing")
+    with pytest.raises(NamespaceNotFound, match="empty"):
+        catalog.check_namespace("empty")
+    assert catalog.stats()["rejected"] == 2
+    assert catalog.namespaces() == ["cs101"]
+    assert catalog.namespaces(non_empty=False) == ["cs101", "empty"]
+
+
+def test_unknown_namespace_rechecks_at_most_once_per_interval():
+    index = StatsIndex({"cs101": 10})
+    catalog = IndexCatalog(index, recheck_seconds=60)
+    catalog.check_namespace("cs101")
+    index.namespaces["new"] = 5
+
+    # Within the recheck interval the catalog is not refreshed again
+    with pytest.raises(NamespaceNotFound):
+        catalog.check_namespace("new")
+    assert index.calls == 1
+
+    catalog.recheck_seconds = 0
+    catalog.check_namespace("new")
+    assert index.calls == 2
+
+
+def test_known_namespace_skips_refresh():
+    index = StatsIndex({"cs101": 10})
+    catalog = IndexCatalog(index, recheck_seconds=0)
+    catalog.refresh()
+    for _ in range(5):
+        catalog.check_namespace("cs101")
+    assert index.calls == 1
+
+
+def test_mark_stale_forces_refresh():
+    index = StatsIndex({"cs101": 10})
+    catalog = IndexCatalog(index, recheck_seconds=60)
+    catalog.check_namespace("cs101")
+    index.namespaces["cs101"] = 0
+
+    catalog.mark_stale("cs101")
+    with pytest.raises(NamespaceNotFound, match="empty"):
+        catalog.check_namespace("cs101")
+    assert index.calls == 2
+
+
+def test_unreachable_index_fails_open():
+    index = StatsIndex()
+    index.fail = True
+    catalog = IndexCatalog(index, recheck_seconds=0)
+    catalog.check_namespace("anything")
+    stats = catalog.stats()
+    assert stats["unchecked"] == 1 and stats["refresh_errors"] == 1
+    assert "unreachable" in stats["last_error"]
+
+
+def test_failed_refresh_keeps_last_snapshot():
+    index = StatsIndex({"cs101": 10})
+    catalog = IndexCatalog(index, recheck_seconds=0)
+    catalog.refresh()
+    index.fail = True
+
+    catalog.mark_stale()
+    assert catalog.snapshot()["namespaces"] == {"cs101": {"vector_count": 10}}
+    with pytest.raises(NamespaceNotFound):
+        catalog.check_namespace("missing")
+    catalog.check_namespace("cs101")
+
+
+def test_concurrent_unknown_lookups_share_one_refresh():
+    index = StatsIndex({"cs101": 10}, delay=0.05)
+    catalog = IndexCatalog(index, recheck_seconds=1)
+    catalog.refresh()
+    catalog._refreshed_at -= 10  # due for a recheck
+    index.calls = 0
+    index.namespaces["new"] = 5
+
+    errors = []
+
+    def check():
+        try:
+            catalog.check_namespace("new")
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=check) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert index.calls == 1
+
+
+def test_retrieval_service_validation(monkeypatch):
+    pytest.importorskip("pinecone")
+    from config import config
+    from retrieval_service import RetrievalService
+
+    service = RetrievalService(index=StatsIndex({"cs101": 10, "os": 4, "empty": 0}), hedged=False)
+    monkeypatch.setattr(config, "NAMESPACE_GROUPS", {"core": ["cs101", "os"]})
+
+    assert service.resolve_namespaces(["os"], group="all") == ["os", "cs101"]
+    assert service.resolve_namespaces(group="core") == ["cs101", "os"]
+    with pytest.raises(ValueError, match="Unknown namespace group"):
+        service.resolve_namespaces(group="nope")
+
+    service.check_namespaces(["cs101", "os"])
+    with pytest.raises(NamespaceNotFound):
+        service.check_namespaces(["cs101", "missing"])
+
+    monkeypatch.setattr(config, "NAMESPACE_VALIDATION", False)
+    service.check_namespaces(["missing"])
@@ -0,0 +1,166 @@
+import json
+import random
+
+import numpy as np
+import pytest
+
+import ingestion
+from chunk_store import ChunkStoreManager
+from incremental_index import IndexManifest
+from ingestion import Checkpoint, IngestionPipeline, chunk_text
+from lexical_index import LexicalIndexManager
+
+NAMESPACE = "notes"
+
+
+def fake_init_worker(model_name, device, threads):
+    pass
+
+
+def fake_embed(texts):
+    if any("EXPLODE" in text for text in texts):
+        raise RuntimeError("embedding worker died")
+    return np.ones((len(texts), 4), dtype=np.float32)
+
+
+@pytest.fixture(autouse=True)
+def fake_embedding_workers(monkeypatch):
+    """Skip loading the model in the worker processes."""
+    monkeypatch.setattr(ingestion, "_init_embed_worker", fake_init_worker)
+    monkeypatch.setattr(ingestion, "_embed_texts", fake_embed)
+
+
+@pytest.fixture
+def source(tmp_path):
+    directory = tmp_path / "source"
+    directory.mkdir()
+    for i in range(3):
+        (directory / f"doc{i}.txt").write_text(f"Document {i} covers paging topic{i}.\n\nSecond paragraph of {i}.")
+    return directory
+
+
+def pipeline(retrieval_service, **kwargs):
+    kwargs.setdefault("embed_batch_size", 1)
+    return IngestionPipeline(
+        retrieval_service=retrieval_service,
+        namespace=NAMESPACE,
+        chunk_size=200,
+        chunk_overlap=20,
+        embed_workers=1,
+        upsert_workers=1,
+        **kwargs
+    )
+
+
+def local_ids():
+    lexical = LexicalIndexManager().get(NAMESPACE)
+    store = ChunkStoreManager().get(NAMESPACE)
+    return {hit["id"] for hit in lexical.search("paragraph", top_k=100)}, store
+
+
+def test_ingest_updates_local_indexes(retrieval_service, source):
+    run = pipeline(retrieval_service)
+    stats = run.run(str(source))
+    run.update_local_indexes()
+
+    assert stats.documents == 3 and not stats.failed_documents
+    lexical_ids, store = local_ids()
+    assert lexical_ids == retrieval_service.ids(NAMESPACE)
+    assert all(store.get(doc_id) is not None for doc_id in lexical_ids)
+    assert sorted(IndexManifest.load(NAMESPACE).documents) == ["doc0.txt", "doc1.txt", "doc2.txt"]
+
+
+def test_resume_adds_checkpointed_documents_to_local_indexes(retrieval_service, source):
+    # First run upserts everything, then stops before the local indexes are updated
+    pipeline(retrieval_service).run(str(source))
+    upserted = retrieval_service.ids(NAMESPACE)
+
+    resumed = pipeline(retrieval_service)
+    stats = resumed.run(str(source))
+    resumed.update_local_indexes()
+
+    assert stats.skipped_documents == 3 and stats.upserted == 0
+    lexical_ids, store = local_ids()
+    assert lexical_ids == upserted
+    assert all(store.get(doc_id) is not None for doc_id in upserted)
+    assert len(IndexManifest.load(NAMESPACE).documents) == 3
+
+
+def test_resume_deletes_stale_chunks_of_edited_document(retrieval_service, source):
+    first = pipeline(retrieval_service)
+    first.run(str(source))
+    first.update_local_indexes()
+    old_ids = set(IndexManifest.load(NAMESPACE).documents["doc1.txt"]["chunks"])
+
+    (source / "doc1.txt").write_text("Rewritten document about segmentation.\n\nA new second paragraph.")
+    pipeline(retrieval_service).run(str(source))  # interrupted before local indexes
+
+    resumed = pipeline(retrieval_service)
+    resumed.run(str(source))
+    resumed.update_local_indexes()
+
+    new_ids = set(IndexManifest.load(NAMESPACE).documents["doc1.txt"]["chunks"])
+    assert old_ids and new_ids and not old_ids & new_ids
+    assert old_ids <= set(retrieval_service.deleted)
+    lexical_ids, store = local_ids()
+    assert not old_ids & lexical_ids
+    assert all(store.get(doc_id) is None for doc_id in old_ids)
+
+
+def test_checkpoint_without_chunk_ids_reingests(retrieval_service, source):
+    pipeline(retrieval_service).run(str(source))
+    checkpoint_path = pipeline(retrieval_service).checkpoint.path
+    with open(checkpoint_path) as f:
+        data = json.load(f)
+    del data["chunks"]  # written before chunk ids were recorded
+    with open(checkpoint_path, "w") as f:
+        json.dump(data, f)
+
+    resumed = pipeline(retrieval_service)
+    stats = resumed.run(str(source))
+    resumed.update_local_indexes()
+
+    assert stats.skipped_documents == 0 and stats.documents == 3
+    assert len(IndexManifest.load(NAMESPACE).documents) == 3
+
+
+def test_embedding_failure_fails_only_its_documents(retrieval_service, source):
+    (source / "doc1.txt").write_text("EXPLODE on this document.")
+
+    run = pipeline(retrieval_service)
+    stats = run.run(str(source))
+    run.update_local_indexes()
+
+    assert stats.failed_documents == ["doc1.txt"]
+    assert set(run.checkpoint.documents) == {"doc0.txt", "doc2.txt"}
+    assert sorted(IndexManifest.load(NAMESPACE).documents) == ["doc0.txt", "doc2.txt"]
+
+
+def test_checkpoint_for_other_namespace_is_ignored(tmp_path):
+    path = str(tmp_path / "checkpoint.json")
+    with open(path, "w") as f:
+        json.dump({"namespace": "other", "documents": {"a.txt": "1:1"}, "chunks": {"a.txt": ["x"]}}, f)
+    checkpoint = Checkpoint(path, NAMESPACE)
+    assert checkpoint.documents == {} and checkpoint.chunks == {}
+
+
+def test_chunk_text_edit_only_changes_nearby_chunks():
+    rng = random.Random(1)
+    words = "alpha beta gamma delta kernel paging memory process thread cache disk block inode".split()
+    paragraphs = [" ".join(rng.choice(words) + str(i) for _ in range(rng.randint(8, 30))) for i in range(80)]
+    before = chunk_text("\n\n".join(paragraphs), 400, 50)
+
+    paragraphs[40] += " edited words here"
+    after = chunk_text("\n\n".join(paragraphs), 400, 50)
+
+    assert len(before) > 20
+    assert len(set(before) - set(after)) <= 3
+
+
+def test_chunk_text_respects_size_and_overlap():
+    text = " ".join(f"word{i}" for i in range(500))
+    chunks = chunk_text(text, 200, 40)
+    assert all(len(chunk) <= 200 for chunk in chunks)
+    assert chunk_text(text, 200, 40) == chunks
+    with pytest.raises(ValueError):
+        chunk_text(text, 100, 100)
@@ -0,0 +1,111 @@
+import os
+
+import pytest
+
+from config import config
+from invalidation import DEFAULT_NAMESPACE_KEY, namespace_key
+from lexical_index import BM25Index, LexicalIndexManager, reciprocal_rank_fusion, tokenize
+
+DOCS = {f"d{i}": (f"common word{i} paging" if i < 5 else f"common other{i}") for i in range(20)}
+
+
+def ids(results):
+    return [result["id"] for result in results]
+
+
+def test_tokenize_keeps_symbols_and_drops_stopwords():
+    assert tokenize("What is C++ and the O_n bound?") == ["c++", "o_n", "bound"]
+
+
+def test_search_ranks_matching_documents(tmp_path):
+    index = BM25Index(str(tmp_path / "bm25"))
+    index.add_documents(DOCS.items())
+    assert set(ids(index.search("paging", top_k=10))) == {f"d{i}" for i in range(5)}
+    assert ids(index.search("word3 paging", top_k=1)) == ["d3"]
+    assert index.search("absent", top_k=5) == []
+
+
+def test_scores_match_fresh_index_after_deletes(tmp_path):
+    index = BM25Index(str(tmp_path / "bm25"))
+    index.add_documents(DOCS.items())
+    index.save()
+    index.delete_documents(["d0", "d1"])
+    index.add_documents([("d2", "replaced text")])
+
+    live = dict(DOCS, d2="replaced text")
+    del live["d0"], live["d1"]
+    fresh = BM25Index(str(tmp_path / "fresh"))
+    fresh.add_documents(live.items())
+
+    # Deleted documents still in the segment's postings must not count towards df
+    assert index.search("paging common", top_k=20) == fresh.search("paging common", top_k=20)
+
+
+def test_small_saves_append_to_delta_log(tmp_path):
+    path = str(tmp_path / "bm25")
+    index = BM25Index(path)
+    index.add_documents(DOCS.items())
+    index.save()
+    segment_mtime = os.stat(os.path.join(path, "postings_docs.npy")).st_mtime_ns
+
+    index.add_documents([("d99", "paging tables")])
+    index.delete_documents(["d0"])
+    index.save()
+
+    assert os.path.exists(os.path.join(path, "delta.jsonl"))
+    assert os.stat(os.path.join(path, "postings_docs.npy")).st_mtime_ns == segment_mtime
+
+    reloaded = BM25Index(path)
+    assert reloaded.doc_count == 20
+    assert "d99" in ids(reloaded.search("paging", top_k=10))
+    assert "d0" not in ids(reloaded.search("paging", top_k=10))
+
+
+def test_large_delta_compacts(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "LEXICAL_COMPACT_RATIO", 0.2)
+    path = str(tmp_path / "bm25")
+    index = BM25Index(path)
+    index.add_documents(DOCS.items())
+    index.save()
+
+    index.delete_documents([f"d{i}" for i in range(5, 15)])
+    index.save()
+
+    assert not os.path.exists(os.path.join(path, "delta.jsonl"))
+    assert index.stats()["pending_updates"] == 0
+    assert BM25Index(path).doc_count == 10
+
+
+def test_manager_closes_evicted_indexes(monkeypatch):
+    monkeypatch.setattr(config, "LOCAL_INDEX_MAX_NAMESPACES", 1)
+    manager = LexicalIndexManager()
+    first = manager.get("a")
+    first.add_documents([("x", "paging")])
+    manager.get("b")
+    assert first.doc_count == 0
+    assert list(manager.stats()) == ["b"]
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([[{"id": "a"}, {"id": "b"}], [{"id": "b"}, {"id": "c"}]], k=60)
+    assert [doc_id for doc_id, _ in fused] == ["b", "a", "c"]
+    assert fused[0][1] == pytest.approx(1 / 62 + 1 / 61)
+    assert len(reciprocal_rank_fusion([[{"id": "a"}, {"id": "b"}]], top_k=1)) == 1
+
+
+@pytest.mark.parametrize("namespace", ["os", "dbms-2024", "a.b_c"])
+def test_plain_namespaces_used_as_is(namespace):
+    assert namespace_key(namespace) == namespace
+
+
+@pytest.mark.parametrize("namespace", ["../etc", "a/b", "with space", "ünï", ".hidden", "x" * 200])
+def test_other_namespaces_are_hashed_to_one_path_component(namespace):
+    key = namespace_key(namespace)
+    assert key.startswith("~") and len(key) == 41
+    assert os.sep not in key and key != namespace
+
+
+def test_default_namespace_key(monkeypatch):
+    assert namespace_key(None) == namespace_key("") == DEFAULT_NAMESPACE_KEY
+    monkeypatch.setattr(config, "PINECONE_NAMESPACE", "cs101")
+    assert namespace_key(None) == "cs101"
@@ -0,0 +1,32 @@
+import pytest
+
+pytest.importorskip("pinecone")
+
+from retrieval_service import merge_top_k  # noqa: E402
+
+
+def doc(doc_id, score, text=None):
+    return {"id": doc_id, "score": score, "metadata": {"text": text or doc_id}}
+
+
+def test_merges_by_score_across_namespaces():
+    merged = merge_top_k([[doc("a", 0.5), doc("b", 0.9)], [doc("c", 0.7)]], top_k=3)
+    assert [d["id"] for d in merged] == ["b", "c", "a"]
+
+
+def test_duplicates_keep_highest_scoring_copy():
+    merged = merge_top_k(
+        [[doc("a", 0.6), doc("x", 0.4, text="shared")], [doc("a", 0.8), doc("y", 0.5, text="shared")]],
+        top_k=5
+    )
+    assert [(d["id"], d["score"]) for d in merged] == [("a", 0.8), ("y", 0.5)]
+
+
+def test_stops_at_top_k_unique_documents():
+    merged = merge_top_k([[doc("a", 0.9), doc("a", 0.8), doc("b", 0.7), doc("c", 0.6)]], top_k=2)
+    assert [d["id"] for d in merged] == ["a", "b"]
+
+
+def test_missing_scores_and_metadata_sort_last():
+    merged = merge_top_k([[{"id": "n", "score": None}, {"id": "m", "score": 0.1}]], top_k=2)
+    assert [d["id"] for d in merged] == ["m", "n"]
@@ -0,0 +1,49 @@
+import pytest
+
+from schema_service import STATIC_SYSTEM_PREFIX, SchemaService
+
+
+def answer_format(prompt):
+    return prompt.split("FORMAT YOUR ANSWER AS:\n", 1)[1]
+
+
+@pytest.mark.parametrize("marks", [6, 11, 12, 13, 14, 15, 20])
+def test_essay_format_for_marks_outside_the_short_ranges(marks):
+    prompt = SchemaService.build_system_prompt(marks)
+    assert answer_format(prompt).startswith("Introduction:")
+    assert "Introduction:" in SchemaService.resolve(marks).required_sections
+
+
+@pytest.mark.parametrize("marks,first_section", [(1, "Definition:"), (3, "Definition:"), (5, "Definition:"), (9, "Definition:")])
+def test_short_formats_follow_requested_marks(marks, first_section):
+    assert answer_format(SchemaService.build_system_prompt(marks)).startswith(first_section)
+    assert "Introduction:" not in SchemaService.resolve(marks).required_sections
+
+
+def test_settings_come_from_closest_schema():
+    # 6 is equally close to 5 and 7; the lower schema wins
+    assert SchemaService.resolve(6).max_tokens == SchemaService.SCHEMAS[5]["max_tokens"]
+    assert SchemaService.resolve(12).top_k == SchemaService.SCHEMAS[10]["top_k"]
+
+
+def test_marks_sharing_schema_and_format_share_one_object():
+    assert SchemaService.resolve(7) is SchemaService.resolve(8)
+    assert SchemaService.resolve(5) is not SchemaService.resolve(6)
+
+
+def test_prompts_share_static_prefix():
+    for marks in range(1, 21):
+        assert SchemaService.build_system_prompt(marks).startswith(STATIC_SYSTEM_PREFIX)
+
+
+def test_check_structure():
+    schema = SchemaService.resolve(2)
+    assert SchemaService.check_structure("**Definition:** x\nExample: y", schema)
+    assert not SchemaService.check_structure("Definition: x", schema)
+    assert not SchemaService.check_structure("   ", schema)
+
+
+def test_validate_marks_bounds():
+    assert SchemaService.validate_marks(0) == 1
+    assert SchemaService.validate_marks(25) == 15
+    assert SchemaService.validate_marks(7) == 7
@@ -0,0 +1,180 @@
+"""
+CPU topology-aware thread budgeting across API workers.
+
+Every uvicorn worker runs its own SentenceTransformer.encode, and torch
+defaults to one intra-op thread per core, so N workers oversubscribe the
+CPU N times over. Each worker claims a slot (an flock-held file, released
+automatically if the worker dies), takes its share of the available cores
+and caps torch / OpenMP / tokenizer threads to that share, optionally
+pinning its CPU affinity to those cores.
+"""
+
+import fcntl
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# Env var main.py uses to tell workers how many siblings they have
+WORKER_COUNT_ENV = "RAG_API_WORKER_COUNT"
+
+_THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+_layout: Dict[str, Any] = {"applied": False}
+_slot_file = None
+
+
+def available_cpus() -> List[int]:
+    """CPUs this process may run on, trimmed to the cgroup CPU quota."""
+    if hasattr(os, "sched_getaffinity"):
+        cpus = sorted(os.sched_getaffinity(0))
+    else:
+        cpus = list(range(os.cpu_count() or 1))
+
+    quota = _cgroup_cpu_quota()
+    if quota is not None and quota < len(cpus):
+        cpus = cpus[:max(1, quota)]
+
+    return cpus
+
+
+def _cgroup_cpu_quota() -> Optional[int]:
+    """Whole CPUs allowed by a cgroup v2 cpu.max limit, if any."""
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota == "max":
+            return None
+        return max(1, int(quota) // int(period))
+    except (OSError, ValueError):
+        return None
+
+
+def worker_count() -> int:
+    """
+    Number of API workers sharing this machine.
+
+    uvicorn --workers does not tell workers how many siblings they have, so
+    without RAG_API_WORKER_COUNT or WEB_CONCURRENCY this is a single worker
+    that gets every core.
+    """
+    return max(1, int(os.getenv(WORKER_COUNT_ENV, os.getenv("WEB_CONCURRENCY", "1"))))
+
+
+def split_cores(cpus: List[int], workers: int) -> List[List[int]]:
+    """
+    Partition CPUs into contiguous per-worker groups.
+    With more workers than CPUs, workers share single cores round-robin.
+    """
+    if workers >= len(cpus):
+        return [[cpus[i % len(cpus)]] for i in range(workers)]
+
+    base, extra = divmod(len(cpus), workers)
+    groups, start = [], 0
+    for i in range(workers):
+        size = base + (1 if i < extra else 0)
+        groups.append(cpus[start:start + size])
+        start += size
+    return groups
+
+
+def _claim_slot(workers: int) -> int:
+    """
+    Claim the first free worker slot by flock-ing a slot file.
+    The lock is held for the process lifetime and released on exit.
+    """
+    global _slot_file
+
+    os.makedirs(config.WORKER_SLOTS_DIR, exist_ok=True)
+    for slot in range(workers):
+        handle = open(os.path.join(config.WORKER_SLOTS_DIR, f"slot-{slot}.lock"), "w")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            continue
+        handle.write(str(os.getpid()))
+        handle.flush()
+        _slot_file = handle
+        return slot
+
+    # More processes than slots (e.g. during a rolling restart): share by pid
+    return os.getpid() % workers
+
+
+def export_process_defaults(workers: int):
+    """
+    Called from main.py before workers start.
+    Sets per-worker thread env vars so they apply before torch is imported.
+    """
+    threads = max(1, len(available_cpus()) // workers)
+    os.environ[WORKER_COUNT_ENV] = str(workers)
+    for var in _THREAD_ENV_VARS:
+        os.environ.setdefault(var, str(threads))
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+
+def apply_worker_topology(pin_affinity: bool = None) -> Dict[str, Any]:
+    """
+    Give this worker its share of cores and cap its thread pools.
+    Called once from the API lifespan before models are loaded.
+    """
+    global _layout
+
+    if not config.THREAD_BUDGETING:
+        return _layout
+
+    pin_affinity = config.PIN_CPU_AFFINITY if pin_affinity is None else pin_affinity
+    cpus = available_cpus()
+    workers = worker_count()
+    slot = _claim_slot(workers)
+    cores = split_cores(cpus, workers)[slot]
+    threads = len(cores)
+
+    for var in _THREAD_ENV_VARS:
+        os.environ[var] = str(threads)
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+
+    import torch
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Only settable before any inter-op work has started
+        pass
+
+    pinned = False
+    if pin_affinity and hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0, cores)
+            pinned = True
+        except OSError as e:
+            logger.warning(f"Could not pin CPU affinity to {cores}: {str(e)}")
+
+    _layout = {
+        "applied": True,
+        "pid": os.getpid(),
+        "slot": slot,
+        "workers": workers,
+        "available_cpus": len(cpus),
+        "cores": cores,
+        "torch_threads": threads,
+        "affinity_pinned": pinned
+    }
+    logger.info(f"Worker topology: slot {slot}/{workers}, cores={cores}, threads={threads}, pinned={pinned}")
+    return _layout
+
+
+def current_layout() -> Dict[str, Any]:
+    """Layout chosen for this worker (reported in /stats)."""
+    return dict(_layout)
+
+
+def thread_budget() -> int:
+    """Threads this worker may use for compute."""
+    if _layout.get("applied"):
+        return _layout["torch_threads"]
+    return len(available_cpus())
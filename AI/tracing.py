@@ -0,0 +1,305 @@
+"""
+Request ids and lightweight tracing.
+
+Every HTTP request gets a request id (the X-Request-Id header, or a new
+one) that is attached to each log record emitted while the request is
+handled, including records from executor threads, so concurrent requests
+can be told apart in the logs. The id is echoed in the response.
+
+With TRACE_EXPORT set, a head-based sample of requests is also traced: a
+request is sampled by TRACE_SAMPLE_RATE, or by the sampled flag of an
+incoming W3C `traceparent` header. Pipeline stages open nested spans
+(embed, cache lookups, retrieval, context build, LLM calls) with
+attributes. When the request finishes, the trace is written as one line of
+Zipkin v2 JSON (a span array that can be POSTed to /api/v2/spans as is) to
+the TRACE_EXPORT file, or to stdout with "stdout".
+
+Overhead is bounded. An unsampled request pays one context-variable lookup
+per span site. A sampled trace keeps at most TRACE_MAX_SPANS spans. Run
+`python benchmark.py tracing` to measure both paths.
+"""
+
+import contextvars
+import functools
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+REQUEST_ID_HEADER = "x-request-id"
+TRACEPARENT_HEADER = "traceparent"
+
+_request_id: contextvars.ContextVar[str] = contextvars.ContextVar("request_id", default="-")
+_trace: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("trace", default=None)
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+_counts = {"requests": 0, "sampled": 0, "exported": 0, "dropped_spans": 0}
+
+
+def _new_id(length: int) -> str:
+    return uuid.uuid4().hex[:length]
+
+
+class Trace:
+    """Spans collected for one sampled request."""
+
+    def __init__(self, trace_id: str, request_id: str):
+        self.trace_id = trace_id
+        self.request_id = request_id
+        self.spans: List["Span"] = []
+        self.dropped = 0
+
+    def add(self, span: "Span"):
+        if len(self.spans) < config.TRACE_MAX_SPANS:
+            self.spans.append(span)
+        else:
+            self.dropped += 1
+
+
+class Span:
+    """
+    A timed operation within a trace.
+
+    As a context manager it becomes the parent of spans opened inside it.
+    Spans that outlive a single call (e.g. a streamed response) can be
+    ended with end() instead, without becoming the current span.
+    """
+
+    __slots__ = ("name", "trace", "span_id", "parent_id", "kind", "attributes",
+                 "timestamp", "_start", "duration", "_token")
+
+    def __init__(self, name: str, trace: Trace, attributes: Dict[str, Any],
+                 parent_id: Optional[str] = None, kind: Optional[str] = None):
+        parent = _current_span.get()
+        self.name = name
+        self.trace = trace
+        self.span_id = _new_id(16)
+        self.parent_id = parent.span_id if parent is not None else parent_id
+        self.kind = kind
+        self.attributes = attributes
+        self.timestamp = time.time()
+        self._start = time.perf_counter()
+        self.duration: Optional[float] = None
+        self._token = None
+
+    def set(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def end(self):
+        if self.duration is None:
+            self.duration = time.perf_counter() - self._start
+            self.trace.add(self)
+
+    def __enter__(self) -> "Span":
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        _current_span.reset(self._token)
+        self.end()
+        return False
+
+    def to_zipkin(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace.trace_id,
+            "id": self.span_id,
+            "name": self.name,
+            "timestamp": int(self.timestamp * 1e6),
+            "duration": max(1, int((self.duration or 0) * 1e6)),
+            "localEndpoint": {"serviceName": config.TRACE_SERVICE_NAME},
+            "tags": {key: str(value) for key, value in self.attributes.items() if value is not None}
+        }
+        if self.parent_id:
+            span["parentId"] = self.parent_id
+        if self.kind:
+            span["kind"] = self.kind
+        return span
+
+
+class _NoopSpan:
+    """Stand-in returned when the request is not sampled."""
+
+    __slots__ = ()
+
+    def set(self, key: str, value: Any):
+        pass
+
+    def end(self):
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def span(name: str, **attributes: Any):
+    """Open a span under the current one; a no-op outside sampled requests."""
+    trace = _trace.get()
+    if trace is None:
+        return _NOOP_SPAN
+    return Span(name, trace, attributes)
+
+
+def current_request_id() -> str:
+    return _request_id.get()
+
+
+def propagate(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """Bind fn to the caller's context (request id, trace) for executor threads."""
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+def _install_log_record_factory():
+    """Give every log record a request_id attribute ("-" outside requests)."""
+    base_factory = logging.getLogRecordFactory()
+    if getattr(base_factory, "adds_request_id", False):
+        return
+
+    def factory(*args, **kwargs):
+        record = base_factory(*args, **kwargs)
+        record.request_id = _request_id.get()
+        return record
+
+    factory.adds_request_id = True
+    logging.setLogRecordFactory(factory)
+
+
+_install_log_record_factory()
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Parse a W3C traceparent header ("00-<trace id>-<parent id>-<flags>")."""
+    if not value:
+        return None
+    parts = value.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        sampled = bool(int(parts[3], 16) & 1)
+    except ValueError:
+        return None
+    return {"trace_id": parts[1], "parent_id": parts[2], "sampled": sampled}
+
+
+class TraceExporter:
+    """Writes finished traces as Zipkin v2 JSON, one trace per line."""
+
+    def __init__(self, target: str):
+        self.target = target
+        if target == "stdout":
+            self._file = sys.stdout
+        else:
+            os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+            self._file = open(target, "a", encoding="utf-8", buffering=1)
+        self._lock = threading.Lock()
+
+    def export(self, trace: Trace):
+        spans = [span.to_zipkin() for span in trace.spans]
+        if trace.dropped and spans:
+            spans[-1]["tags"]["dropped_spans"] = str(trace.dropped)
+        line = json.dumps(spans, separators=(",", ":"))
+        with self._lock:
+            self._file.write(line + "\n")
+            _counts["exported"] += 1
+            _counts["dropped_spans"] += trace.dropped
+
+    def close(self):
+        with self._lock:
+            if self._file is not sys.stdout:
+                self._file.close()
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware assigning request ids and tracing sampled requests.
+    """
+
+    def __init__(self, app, exporter: TraceExporter = None, sample_rate: float = None):
+        self.app = app
+        if exporter is None and config.TRACE_EXPORT:
+            exporter = TraceExporter(config.TRACE_EXPORT)
+        self.exporter = exporter
+        self.sample_rate = config.TRACE_SAMPLE_RATE if sample_rate is None else sample_rate
+
+    def _sample(self, parent: Optional[Dict[str, Any]]) -> bool:
+        if self.exporter is None:
+            return False
+        if parent is not None:
+            return parent["sampled"]
+        return random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers", []))
+        request_id = headers.get(REQUEST_ID_HEADER.encode(), b"").decode("latin-1")[:128] or _new_id(16)
+        parent = parse_traceparent(headers.get(TRACEPARENT_HEADER.encode(), b"").decode("latin-1"))
+        _counts["requests"] += 1
+
+        trace = None
+        if self._sample(parent):
+            trace = Trace(parent["trace_id"] if parent else _new_id(32), request_id)
+            _counts["sampled"] += 1
+
+        request_id_token = _request_id.set(request_id)
+        trace_token = _trace.set(trace)
+        root = None
+        if trace is not None:
+            root = Span(
+                f"{scope['method']} {scope['path']}", trace,
+                {"http.method": scope["method"], "http.path": scope["path"], "request_id": request_id},
+                parent_id=parent["parent_id"] if parent else None,
+                kind="SERVER"
+            )
+
+        async def traced_send(message):
+            if message["type"] == "http.response.start":
+                extra = [(REQUEST_ID_HEADER.encode(), request_id.encode("latin-1"))]
+                if root is not None:
+                    root.set("http.status_code", message["status"])
+                    extra.append((TRACEPARENT_HEADER.encode(), f"00-{trace.trace_id}-{root.span_id}-01".encode()))
+                message["headers"] = list(message.get("headers", [])) + extra
+            await send(message)
+
+        try:
+            if root is None:
+                await self.app(scope, receive, traced_send)
+            else:
+                with root:
+                    await self.app(scope, receive, traced_send)
+        finally:
+            _trace.reset(trace_token)
+            _request_id.reset(request_id_token)
+            if trace is not None:
+                try:
+                    self.exporter.export(trace)
+                except OSError as e:
+                    logger.warning(f"Could not export trace {trace.trace_id}: {str(e)}")
+
+
+
+def stats() -> Dict[str, Any]:
+    """Request and trace counts for this worker."""
+    return {
+        "export": config.TRACE_EXPORT or None,
+        "sample_rate": config.TRACE_SAMPLE_RATE if config.TRACE_EXPORT else 0.0,
+        **_counts
+    }
@@ -0,0 +1,131 @@
+"""
+Token usage, latency and cost accounting for LLM calls.
+
+LLMService fills a usage dict for every completion, streamed or not:
+token counts from the Groq usage block, Groq's queue time, and client-side
+time to first token, generation time and total time. Endpoints record it
+against dimensions (endpoint, marks, namespace, model) and /stats reports
+per-dimension totals. Cost is estimated from LLM_PRICES for models that
+have a price configured.
+"""
+
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+TOKEN_FIELDS = ("prompt_tokens", "completion_tokens", "total_tokens")
+TIMING_FIELDS = ("queue_ms", "time_to_first_token_ms", "generation_ms", "total_ms")
+
+_totals: Dict[str, Dict[str, Dict[str, float]]] = {}
+_totals_lock = threading.Lock()
+
+
+def from_completion(
+    model: str,
+    usage: Any = None,
+    total_seconds: float = None,
+    first_token_seconds: float = None,
+    last_token_seconds: float = None
+) -> Dict[str, Any]:
+    """
+    Build a usage dict from a Groq usage block plus client-side timings.
+
+    Args:
+        model: Model that served the call
+        usage: completion.usage (or x_groq.usage on the last stream chunk), if any
+        total_seconds: Wall time of the call
+        first_token_seconds: Time to the first streamed token
+        last_token_seconds: Time to the last streamed token
+    """
+    result: Dict[str, Any] = {"model": model, "calls": 1}
+    for field in TOKEN_FIELDS:
+        result[field] = getattr(usage, field, None)
+
+    queue_time = getattr(usage, "queue_time", None)
+    result["queue_ms"] = queue_time * 1000 if queue_time is not None else None
+    result["time_to_first_token_ms"] = first_token_seconds * 1000 if first_token_seconds is not None else None
+
+    if first_token_seconds is not None and last_token_seconds is not None:
+        result["generation_ms"] = (last_token_seconds - first_token_seconds) * 1000
+    else:
+        completion_time = getattr(usage, "completion_time", None)
+        result["generation_ms"] = completion_time * 1000 if completion_time is not None else None
+
+    result["total_ms"] = total_seconds * 1000 if total_seconds is not None else None
+    result["cost_usd"] = cost(result)
+    return result
+
+
+def cost(usage: Dict[str, Any]) -> Optional[float]:
+    """Estimated cost in USD from LLM_PRICES, or None if the model has no price."""
+    prices = config.LLM_PRICES.get(usage.get("model"))
+    if prices is None or usage.get("prompt_tokens") is None:
+        return None
+    input_price, output_price = prices
+    return (usage["prompt_tokens"] * input_price + (usage.get("completion_tokens") or 0) * output_price) / 1e6
+
+
+def combine(usages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Sum several calls made for one request (e.g. a cascade fallback)."""
+    if len(usages) == 1:
+        return usages[0]
+
+    result: Dict[str, Any] = {"model": usages[-1]["model"], "calls": sum(u["calls"] for u in usages)}
+    if any(u.get("truncated") for u in usages):
+        result["truncated"] = True
+    for field in TOKEN_FIELDS + TIMING_FIELDS + ("cost_usd",):
+        values = [u[field] for u in usages if u.get(field) is not None]
+        result[field] = sum(values) if values else None
+    return result
+
+
+def record(usage: Optional[Dict[str, Any]], **dimensions: Any):
+    """
+    Add one request's usage to the per-dimension totals.
+
+    Args:
+        usage: Usage dict from LLMService (ignored when None)
+        **dimensions: e.g. endpoint="generate", marks=5, namespace="os"
+    """
+    if not usage:
+        return
+
+    dimensions = dict(dimensions, model=usage.get("model"))
+    with _totals_lock:
+        for dimension, value in dimensions.items():
+            totals = _totals.setdefault(dimension, {}).setdefault(str(value), {})
+            totals["requests"] = totals.get("requests", 0) + 1
+            totals["calls"] = totals.get("calls", 0) + usage.get("calls", 1)
+            # Streams stopped early have no token counts from Groq
+            totals["truncated"] = totals.get("truncated", 0) + bool(usage.get("truncated"))
+            for field in TOKEN_FIELDS + TIMING_FIELDS + ("cost_usd",):
+                if usage.get(field) is not None:
+                    totals[field] = totals.get(field, 0) + usage[field]
+                    totals[f"{field}_count"] = totals.get(f"{field}_count", 0) + 1
+
+
+def _summarize(totals: Dict[str, float]) -> Dict[str, Any]:
+    summary = {"requests": totals["requests"], "calls": totals["calls"], "truncated": totals["truncated"]}
+    for field in TOKEN_FIELDS:
+        summary[field] = totals.get(field, 0)
+    for field in TIMING_FIELDS:
+        count = totals.get(f"{field}_count", 0)
+        summary[f"avg_{field}"] = totals[field] / count if count else None
+    summary["cost_usd"] = totals.get("cost_usd")
+    return summary
+
+
+def stats() -> Dict[str, Any]:
+    """Token, latency and cost totals per dimension value."""
+    with _totals_lock:
+        return {
+            "priced_models": sorted(config.LLM_PRICES),
+            **{
+                f"by_{dimension}": {value: _summarize(totals) for value, totals in values.items()}
+                for dimension, values in _totals.items()
+            }
+        }